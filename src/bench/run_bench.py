@@ -0,0 +1,298 @@
+"""
+Бенчмарки инференса, аналитики и ETL на синтетической базе (без сети и без настоящих моделей).
+
+    python src/bench/run_bench.py run --rows 100000 --out bench/100k.json
+    python src/bench/run_bench.py run --rows 1000000 --iters 200 --db /tmp/bench_1m.duckdb
+    python src/bench/run_bench.py compare bench/before.json bench/after.json --threshold 0.2
+
+run генерирует --rows синтетических вакансий (src/bench/synthetic.py) во временную DuckDB
+со схемой vacancy / vacancy_proc / vacancy_skill / cities, загружая их через loader.load_vacancies,
+подставляет маленькие модели-заглушки вместо MODEL_DIR (--models real — настоящие артефакты)
+и замеряет задержку и пропускную способность:
+  etl.*       — массовая загрузка, предобработка в vacancy_proc, пересборка куба/индексов,
+                инкрементальная пачка;
+  model.*     — predict_salary / predict_grade по одной вакансии и пачками;
+  analytics.* — каждая функция market_analytics без кэша (cold) и из кэша (cached).
+Результат — JSON (метаданные запуска + метрики в мс); compare сравнивает два таких файла
+по p50 и завершается с кодом 1, если что-то замедлилось больше чем на --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(SRC_DIR, 'bot'), os.path.join(SRC_DIR, 'etl')]
+
+LOAD_CHUNK = 50000        # строк на один вызов load_vacancies при генерации базы
+INCREMENTAL_BATCH = 1000  # размер пачки для etl.load_incremental
+BATCH_SIZE = 32           # размер пачки для predict_*_batch (как у InferenceBatcher)
+
+
+def summarize(samples, items=1) -> dict:
+    """Задержки (сек) -> мс-метрики; items — объектов за один вызов (для пропускной способности)."""
+    s = np.asarray(samples, dtype=float)
+    p50, p95, p99 = np.percentile(s, [50, 95, 99])
+    return {
+        "calls": int(len(s)),
+        "items_per_call": items,
+        "mean_ms": round(1000 * s.mean(), 3),
+        "p50_ms": round(1000 * p50, 3),
+        "p95_ms": round(1000 * p95, 3),
+        "p99_ms": round(1000 * p99, 3),
+        "min_ms": round(1000 * s.min(), 3),
+        "throughput_per_s": round(items * len(s) / s.sum(), 1) if s.sum() > 0 else None,
+    }
+
+
+def measure(fn, args_list, items=1, warmup=1, before=None) -> dict:
+    """Вызывает fn(*args) для каждого набора аргументов; before() — перед каждым вызовом (вне замера)."""
+    for args in args_list[:warmup]:
+        if before:
+            before()
+        fn(*args)
+    samples = []
+    for args in args_list:
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, items)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _versions():
+    import duckdb
+    import lightgbm
+    import pandas
+    import sklearn
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pandas.__version__,
+            "duckdb": duckdb.__version__, "sklearn": sklearn.__version__, "lightgbm": lightgbm.__version__}
+
+
+def build_database(db_path, rows, seed):
+    """Синтетическая база на rows вакансий; возвращает метрики etl.* и выборку вакансий для моделей."""
+    from hh_database import connect_writer
+    from loader import load_vacancies
+    from market_cube import rebuild_skill_cube
+    from title_index import rebuild_title_index
+    from preprocess import preprocess_pending
+    from synthetic import create_schema, generate_vacancies
+
+    results = {}
+    con = connect_writer(db_path)
+    create_schema(con)
+    gen_time, load_samples, sample = 0.0, [], None
+    for start in range(0, rows, LOAD_CHUNK):
+        t0 = time.perf_counter()
+        df = generate_vacancies(min(LOAD_CHUNK, rows - start), seed=seed, start_id=1_000_000_000 + start)
+        gen_time += time.perf_counter() - t0
+        if sample is None:
+            sample = df
+        t0 = time.perf_counter()
+        load_vacancies(con, df, refresh_derived=False)
+        load_samples.append(time.perf_counter() - t0)
+    results["etl.load_bulk"] = summarize(load_samples, items=min(LOAD_CHUNK, rows))
+    results["etl.load_bulk"].update(rows=rows, seconds=round(sum(load_samples), 3))
+    results["etl.generate"] = {"seconds": round(gen_time, 3)}
+
+    stats = preprocess_pending(con, parquet_root=None)
+    results["etl.preprocess"] = {"seconds": stats["seconds"], "rows_per_sec": stats["rows_per_sec"]}
+
+    t0 = time.perf_counter()
+    rebuild_skill_cube(con)
+    rebuild_title_index(con)
+    results["etl.rebuild_derived"] = {"seconds": round(time.perf_counter() - t0, 3)}
+
+    # Инкрементальная загрузка (как etl/incremental.py): новые вакансии + обновление куба и индекса
+    batches = [
+        (con, generate_vacancies(INCREMENTAL_BATCH, seed=seed, start_id=2_000_000_000 + i * INCREMENTAL_BATCH))
+        for i in range(4)
+    ]
+    results["etl.load_incremental"] = measure(
+        lambda c, df: load_vacancies(c, df, refresh_derived=True, update_existing=True),
+        batches, items=INCREMENTAL_BATCH,
+    )
+    con.close()
+    return results, sample
+
+
+def bench_models(sample, iters, stub=True, seed=0) -> dict:
+    import model_inference
+
+    feats = model_inference.vacancies_to_features_frame(sample)
+    if stub:
+        from synthetic import install_stub_models
+        install_stub_models(feats.head(5000), seed=seed)
+    else:
+        model_inference.warmup()
+    records = feats.to_dict('records')
+    # Разные вакансии на каждый вызов — чтобы кэш эмбеддингов не подменял замер MiniLM
+    single = [(records[i % len(records)],) for i in range(iters)]
+    batches = [
+        ([records[(i * BATCH_SIZE + j) % len(records)] for j in range(BATCH_SIZE)],)
+        for i in range(max(2, iters // BATCH_SIZE))
+    ]
+    results = {
+        "model.predict_salary": measure(model_inference.predict_salary, single),
+        "model.predict_grade": measure(model_inference.predict_grade, single),
+        f"model.predict_salary_batch{BATCH_SIZE}": measure(model_inference.predict_salary_batch, batches, items=BATCH_SIZE),
+        f"model.predict_grade_batch{BATCH_SIZE}": measure(model_inference.predict_grade_batch, batches, items=BATCH_SIZE),
+    }
+    results["model.n_features"] = int(model_inference.prepare_features_full(records[0]).shape[1])
+    return results
+
+
+def _analytics_cases(iters):
+    from synthetic import CITIES, EXPERIENCE, PROFESSIONS
+
+    professions = list(PROFESSIONS)
+    area_ids = [c[0] for c in CITIES[1:]]
+    rng = np.random.default_rng(0)
+    pick = lambda seq: seq[int(rng.integers(len(seq)))]
+    grades = ['junior', 'middle', 'senior', 'lead']
+    cases = {
+        "get_area_id_by_city": [(pick([c[1] for c in CITIES]),) for _ in range(iters)],
+        "top_5_skills": [(pick(professions).split('-')[0], pick(area_ids), pick([None, 0, 1, 2, 3])) for _ in range(iters)],
+        "top_vacancies": [(pick([c[1] for c in CITIES]), pick(professions).split('-')[0], pick([None, 1, 2])) for _ in range(iters)],
+        "promotion_skills": [],
+        "promotion_ladder": [],
+        "compare_vacancy_to_market": [],
+    }
+    for _ in range(iters):
+        prof = pick(professions)
+        g = int(rng.integers(3))
+        cases["promotion_skills"].append((prof.split('-')[0], pick([None] + area_ids), grades[g], grades[g + 1]))
+        cases["promotion_ladder"].append((prof.split('-')[0], pick([None] + area_ids)))
+        cases["compare_vacancy_to_market"].append(({
+            'title': prof, 'area_id': pick(area_ids), 'experience_hh': pick(EXPERIENCE),
+            'skills': list(rng.choice(PROFESSIONS[prof][1], 3, replace=False)),
+            'salary_rub': float(rng.integers(50, 300)) * 1000, 'embedding': None,
+        },))
+    return cases
+
+
+def bench_analytics(db_path, iters) -> dict:
+    import market_analytics
+
+    market_analytics.DB_PATH = db_path
+    market_analytics.pool = None
+    market_analytics._existing_tables.clear()
+    cache = market_analytics.analytics_cache
+    results = {}
+    for name, args_list in _analytics_cases(iters).items():
+        fn = getattr(market_analytics, name)
+        if hasattr(fn, 'cache'):
+            results[f"analytics.{name}.cold"] = measure(fn, args_list, before=cache.clear)
+            for args in args_list:  # все наборы аргументов уже в кэше — замеряем только попадания
+                fn(*args)
+            results[f"analytics.{name}.cached"] = measure(fn, args_list)
+        else:
+            results[f"analytics.{name}"] = measure(fn, args_list)
+    market_analytics.get_pool().close()
+    return results
+
+
+def run(args):
+    # Заглушки вместо внешних ресурсов: без кэша эмбеддингов и без индекса похожих вакансий
+    os.environ.setdefault('EMB_CACHE_SIZE', '0')
+    tmp_dir = tempfile.mkdtemp(prefix='hh_bench_')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(tmp_dir, 'vector_index')
+    db_path = args.db or os.path.join(tmp_dir, 'bench.duckdb')
+    if os.path.exists(db_path):
+        sys.exit(f"{db_path} уже существует — бенчмарк создаёт базу с нуля")
+
+    t0 = time.perf_counter()
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            "rows": args.rows, "seed": args.seed, "iters": args.iters, "models": args.models,
+            "cpu_count": os.cpu_count(), "platform": platform.platform(), "versions": _versions(),
+        },
+        "results": {},
+    }
+    etl, sample = build_database(db_path, args.rows, args.seed)
+    report["results"].update(etl)
+    print(f"База: {args.rows} вакансий загружены за {etl['etl.load_bulk']['seconds']} c")
+    report["results"].update(bench_models(sample, args.iters, stub=args.models == 'stub', seed=args.seed))
+    report["results"].update(bench_analytics(db_path, args.iters))
+    report["meta"]["seconds"] = round(time.perf_counter() - t0, 1)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            f.write(text)
+        print(f"Результаты: {args.out}")
+    else:
+        print(text)
+    for name, r in report["results"].items():
+        if isinstance(r, dict) and 'p50_ms' in r:
+            print(f"  {name}: p50 {r['p50_ms']} мс, p95 {r['p95_ms']} мс, {r['throughput_per_s']}/с")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def compare(args) -> int:
+    """Сравнение двух прогонов по p50; код 1 — есть замедление больше threshold."""
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before["meta"].get("rows") != after["meta"].get("rows"):
+        print(f"Внимание: разный размер базы ({before['meta'].get('rows')} и {after['meta'].get('rows')})")
+    regressions = []
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    for name, new in after["results"].items():
+        old = before["results"].get(name)
+        if not (isinstance(new, dict) and isinstance(old, dict) and 'p50_ms' in new and 'p50_ms' in old):
+            continue
+        change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] if old['p50_ms'] else 0.0
+        mark = ""
+        if change > args.threshold:
+            mark = "  <- медленнее"
+            regressions.append(name)
+        print(f"  {name}: {old['p50_ms']} -> {new['p50_ms']} мс ({change:+.0%}){mark}")
+    if regressions:
+        print(f"Замедлилось больше чем на {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарки инференса, аналитики и ETL")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_run = sub.add_parser('run', help="сгенерировать базу и замерить")
+    p_run.add_argument('--rows', type=int, default=10000, help="вакансий в синтетической базе (1k … 1M)")
+    p_run.add_argument('--iters', type=int, default=100, help="вызовов на каждый замер")
+    p_run.add_argument('--seed', type=int, default=0)
+    p_run.add_argument('--models', choices=['stub', 'real'], default='stub',
+                       help="stub — модели-заглушки, real — артефакты из MODEL_DIR")
+    p_run.add_argument('--db', default=None, help="путь для базы (по умолчанию — временная, удаляется)")
+    p_run.add_argument('--out', default=None, help="JSON с результатами (по умолчанию — в stdout)")
+    p_cmp = sub.add_parser('compare', help="сравнить два JSON-прогона")
+    p_cmp.add_argument('before')
+    p_cmp.add_argument('after')
+    p_cmp.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление p50 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
@@ -0,0 +1,193 @@
+"""
+Синтетические вакансии и маленькие модели-заглушки для бенчмарков (src/bench/run_bench.py).
+
+Данные похожи на выгрузку hh.ru по форме: те же колонки vacancy (loader.VACANCY_COLS),
+HTML в описании, навыки через запятую, опыт из четырёх значений hh.ru, вилка зарплаты
+в разных валютах. Генерация детерминирована: одинаковые seed и число строк дают одинаковую базу.
+"""
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import OneHotEncoder
+import lightgbm as lgb
+
+from preprocess import CURRENCY_RATE
+
+# Профессия -> (базовая зарплата, характерные навыки)
+PROFESSIONS = {
+    'Python-разработчик': (180000, ['Python', 'Django', 'FastAPI', 'SQL', 'PostgreSQL', 'Docker', 'Git', 'Linux', 'Redis']),
+    'Java-разработчик': (200000, ['Java', 'Spring', 'Kotlin', 'SQL', 'Kafka', 'Docker', 'Git', 'Microservices']),
+    'Frontend-разработчик': (160000, ['JavaScript', 'TypeScript', 'React', 'Vue', 'HTML', 'CSS', 'Git', 'Webpack']),
+    'Аналитик данных': (150000, ['SQL', 'Python', 'Pandas', 'Excel', 'Power BI', 'Tableau', 'A/B тесты', 'Статистика']),
+    'Data Scientist': (220000, ['Python', 'Machine Learning', 'PyTorch', 'SQL', 'Pandas', 'Статистика', 'Spark']),
+    'DevOps-инженер': (210000, ['Linux', 'Docker', 'Kubernetes', 'Ansible', 'Terraform', 'CI/CD', 'Bash', 'Prometheus']),
+    'QA инженер': (120000, ['Ручное тестирование', 'Регрессионное тестирование', 'Postman', 'SQL', 'Jira', 'Selenium', 'QA']),
+    'Системный аналитик': (170000, ['UML', 'BPMN', 'SQL', 'REST', 'Jira', 'Confluence', 'Написание ТЗ']),
+    'Менеджер по продажам': (90000, ['Активные продажи', 'Переговоры', 'CRM', 'Холодные звонки', 'B2B продажи']),
+    'Бухгалтер': (80000, ['1С: Бухгалтерия', 'Налоговая отчетность', 'Первичная документация', 'Excel']),
+    'HR-менеджер': (85000, ['Подбор персонала', 'Адаптация персонала', 'Кадровое делопроизводство', 'HR-бренд']),
+    'Оператор чата': (50000, ['Грамотная речь', 'Работа с возражениями', 'CRM', 'Клиентоориентированность']),
+    'Водитель': (70000, ['Водительское удостоверение категории B', 'Знание города', 'Знание устройства автомобиля']),
+    'Помощник руководителя': (75000, ['Деловая переписка', 'Организация встреч', 'MS Office', 'Тайм-менеджмент']),
+    'Маркетолог': (110000, ['Интернет-маркетинг', 'SMM', 'Яндекс.Директ', 'Google Analytics', 'Контент-маркетинг']),
+    'Финансовый директор': (300000, ['Финансовый анализ', 'Бюджетирование', 'МСФО', 'Управленческий учет']),
+}
+TITLE_PREFIXES = ['', '', '', 'Младший ', 'Старший ', 'Ведущий ', 'Junior ', 'Senior ', 'Lead ']
+TITLE_SUFFIXES = ['', '', '', ' (удаленно)', ' в офис', ' / стажер', ' (гибрид)']
+COMMON_SKILLS = ['Английский язык', 'Работа в команде', 'Деловая коммуникация', 'Ответственность',
+                 'Аналитическое мышление', 'MS Excel', 'Обучаемость']
+
+# Опыт hh.ru и множитель зарплаты
+EXPERIENCE = ['Нет опыта', 'От 1 года до 3 лет', 'От 3 до 6 лет', 'Более 6 лет']
+EXPERIENCE_P = [0.16, 0.35, 0.32, 0.17]
+EXPERIENCE_SALARY = np.array([0.6, 1.0, 1.4, 1.8])
+
+# (area_id, название, родитель, доля вакансий)
+CITIES = [
+    (113, 'Россия', None, 0.0), (1, 'Москва', 'Россия', 0.45), (2, 'Санкт-Петербург', 'Россия', 0.15),
+    (3, 'Екатеринбург', 'Свердловская область', 0.06), (4, 'Новосибирск', 'Новосибирская область', 0.06),
+    (66, 'Нижний Новгород', 'Нижегородская область', 0.05), (88, 'Казань', 'Республика Татарстан', 0.05),
+    (78, 'Самара', 'Самарская область', 0.04), (53, 'Краснодар', 'Краснодарский край', 0.04),
+    (99, 'Уфа', 'Республика Башкортостан', 0.03), (2019, 'Московская область', 'Россия', 0.04),
+    (160, 'Алматы', 'Казахстан', 0.03),
+]
+CURRENCIES = ['RUR', 'USD', 'KZT', 'EUR']
+CURRENCY_P = [0.93, 0.03, 0.03, 0.01]
+
+_WORDS = (
+    'разработка поддержка сервис клиент команда проект задача процесс система данные отчет анализ '
+    'автоматизация интеграция качество документация требования пользователь продукт компания офис '
+    'график обучение развитие опыт знание навык работа условия оформление стабильный доход премия '
+    'ответственность коммуникация руководитель отдел участие внедрение оптимизация контроль план '
+    'продажи договор бюджет учет склад доставка звонок чат сопровождение тестирование релиз код'
+).split()
+_SECTIONS = ['Обязанности:', 'Требования:', 'Условия:', 'Мы предлагаем:', 'О компании:']
+
+
+def _sentence_pool(rng, size=400):
+    lengths = rng.integers(5, 14, size)
+    return [" ".join(rng.choice(_WORDS, n)).capitalize() for n in lengths]
+
+
+def generate_vacancies(n, seed=0, start_id=1_000_000_000) -> pd.DataFrame:
+    """n синтетических вакансий с колонками loader.VACANCY_COLS (id — start_id, start_id + 1, ...)."""
+    rng = np.random.default_rng([seed, start_id])
+    sentences = np.array(_sentence_pool(rng))
+    prof_names = list(PROFESSIONS)
+    prof = rng.integers(0, len(prof_names), n)
+    exp = rng.choice(len(EXPERIENCE), n, p=EXPERIENCE_P)
+    area_ids = np.array([c[0] for c in CITIES])
+    area_p = np.array([c[3] for c in CITIES])
+    area = rng.choice(area_ids, n, p=area_p / area_p.sum())
+
+    titles = [
+        f"{TITLE_PREFIXES[a]}{prof_names[p]}{TITLE_SUFFIXES[b]}"
+        for p, a, b in zip(prof, rng.integers(0, len(TITLE_PREFIXES), n), rng.integers(0, len(TITLE_SUFFIXES), n))
+    ]
+
+    # Описание ~2 тыс. символов: разделы со списками предложений в HTML, как на hh.ru
+    n_sent = rng.integers(8, 24, n)
+    sent_idx = rng.integers(0, len(sentences), n_sent.sum())
+    bounds = np.concatenate([[0], np.cumsum(n_sent)])
+    descriptions = []
+    for i in range(n):
+        parts = sentences[sent_idx[bounds[i]:bounds[i + 1]]]
+        step = max(1, len(parts) // 3)
+        html = []
+        for k, s in enumerate(range(0, len(parts), step)):
+            items = "".join(f"<li>{p}</li>" for p in parts[s:s + step])
+            html.append(f"<p><strong>{_SECTIONS[k % len(_SECTIONS)]}</strong></p> <ul>{items}</ul>")
+        descriptions.append(" ".join(html))
+
+    # Навыки: 0–8 из профиля профессии + иногда общие; у четверти вакансий навыков нет
+    n_skills = np.where(rng.random(n) < 0.25, 0, rng.integers(1, 9, n))
+    skills_raw = []
+    for p, k in zip(prof, n_skills):
+        if not k:
+            skills_raw.append(None)
+            continue
+        pool = PROFESSIONS[prof_names[p]][1] + COMMON_SKILLS
+        skills_raw.append(", ".join(rng.choice(pool, min(k, len(pool)), replace=False)))
+
+    # Зарплата: ~60% вакансий с вилкой, база профессии × опыт × шум
+    base = np.array([PROFESSIONS[prof_names[p]][0] for p in prof]) * EXPERIENCE_SALARY[exp]
+    salary = np.round(base * rng.lognormal(0, 0.25, n), -3)
+    currency = rng.choice(CURRENCIES, n, p=CURRENCY_P)
+    rate = np.array([CURRENCY_RATE[c] for c in currency])
+    has_salary = rng.random(n) < 0.6
+    kind = rng.integers(0, 3, n)  # 0 — только «от», 1 — только «до», 2 — вилка
+    salary_local = np.round(salary / rate, -1)
+    salary_from = np.where(has_salary & (kind != 1), salary_local * 0.9, np.nan)
+    salary_to = np.where(has_salary & (kind != 0), salary_local * 1.1, np.nan)
+
+    published = pd.Timestamp('2025-06-01', tz='Europe/Moscow') - pd.to_timedelta(rng.integers(0, 90 * 86400, n), unit='s')
+    return pd.DataFrame({
+        'id': np.arange(start_id, start_id + n, dtype=np.int64),
+        'title': titles,
+        'published_at': published.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'description': descriptions,
+        'salary_from': salary_from,
+        'salary_to': salary_to,
+        'salary_currency': np.where(has_salary, currency, None),
+        'experience_hh': np.array(EXPERIENCE, dtype=object)[exp],
+        'area_id': area,
+        'skills_raw': skills_raw,
+        'employer': [f"Компания {e}" for e in rng.integers(0, max(10, n // 20), n)],
+    })
+
+
+def create_schema(con):
+    """Таблицы базы бота: vacancy, skill, vacancy_skill, cities (как в 01_etl_run.ipynb)."""
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS vacancy (
+        id BIGINT, title VARCHAR, published_at VARCHAR, description VARCHAR,
+        salary_from DOUBLE, salary_to DOUBLE, salary_currency VARCHAR, experience_hh VARCHAR,
+        area_id BIGINT, skills_raw VARCHAR, employer VARCHAR
+    )
+    """)
+    con.execute("CREATE TABLE IF NOT EXISTS skill(name TEXT PRIMARY KEY)")
+    con.execute("CREATE TABLE IF NOT EXISTS vacancy_skill(vacancy_id BIGINT, skill_name TEXT, PRIMARY KEY(vacancy_id, skill_name))")
+    con.execute("CREATE TABLE IF NOT EXISTS cities (area_id BIGINT PRIMARY KEY, area_name VARCHAR, parent_area VARCHAR)")
+    con.executemany("INSERT OR IGNORE INTO cities VALUES (?, ?, ?)", [c[:3] for c in CITIES])
+
+
+class HashingEncoder:
+    """Заглушка MiniLM: детерминированный (n, 384) эмбеддинг по хэшам слов, без сети и torch."""
+
+    def __init__(self, dim=384):
+        self.vectorizer = HashingVectorizer(n_features=dim, alternate_sign=True, norm='l2')
+
+    def encode(self, texts, batch_size=32):
+        return self.vectorizer.transform(list(texts)).toarray().astype(np.float32)
+
+
+def install_stub_models(feats: pd.DataFrame, seed=0) -> dict:
+    """
+    Обучает маленькие модели той же формы, что и в MODEL_DIR, на признаках синтетики
+    (model_inference.vacancies_to_features_frame) и подставляет их вместо артефактов model_inference.
+    """
+    import model_inference
+
+    encoder = HashingEncoder()
+    artifacts = {
+        'tfidf_desc': TfidfVectorizer(max_features=200).fit(feats['description']),
+        'tfidf_title': TfidfVectorizer(max_features=50).fit(feats['title']),
+        'ohe': OneHotEncoder(handle_unknown='ignore').fit(
+            [[str(a), str(c)] for a, c in zip(feats['area_id'], feats['salary_currency'])]
+        ),
+        'minilm_model': encoder,
+    }
+    model_inference._artifacts.update(artifacts)
+    emb = encoder.encode(feats['description'])
+    X = model_inference.prepare_features_full_frame(feats, emb)
+    rng = np.random.default_rng(seed)
+    grade = feats[['exp_junior', 'exp_middle', 'exp_senior', 'exp_lead']].to_numpy().argmax(axis=1)
+    salary = 80000 * (1 + grade) * rng.lognormal(0, 0.2, len(feats))
+    salary_model = lgb.LGBMRegressor(n_estimators=100, num_leaves=31, verbose=-1, random_state=seed).fit(X, salary)
+    grade_model = RandomForestClassifier(n_estimators=50, max_depth=12, random_state=seed, n_jobs=1).fit(emb, grade)
+    # как при загрузке из MODEL_DIR — с учётом TREE_BACKEND
+    artifacts['salary_model'] = model_inference.with_tree_backend(salary_model)
+    artifacts['grade_model'] = model_inference.with_tree_backend(grade_model)
+    model_inference._artifacts.update(artifacts)
+    return artifacts
@@ -0,0 +1,140 @@
+import functools
+import hashlib
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Кэш результатов аналитических запросов (market_analytics): ключ — имя функции,
+# нормализованные аргументы и версия данных. Версию увеличивает ETL-загрузчик после каждой
+# загрузки (файл "<база>.version", см. src/etl/hh_database.py), так что после обновления базы
+# старые ответы не отдаются.
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 1024))
+ANALYTICS_CACHE_TTL = float(os.getenv('ANALYTICS_CACHE_TTL', 3600))  # сек; 0 — без TTL
+
+
+def normalize_text_arg(value):
+    """Текстовый фильтр без учёта регистра и лишних пробелов: ' Python  Dev' -> 'python dev'."""
+    return " ".join(value.split()).lower() if isinstance(value, str) else value
+
+
+def freeze_arg(value):
+    """Аргумент -> хэшируемая часть ключа (словари и списки — кортежами, массивы — по sha1)."""
+    if isinstance(value, np.ndarray):
+        return ('ndarray', value.shape, hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze_arg(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_arg(v) for v in value)
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    return value
+
+
+class QueryCache:
+    """LRU-кэш результатов с TTL и счётчиками попаданий."""
+
+    def __init__(self, max_items=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (время записи, значение)
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def check_version(self, version):
+        """Сбрасывает кэш, если версия данных сменилась (записи старой версии уже не нужны)."""
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._data.clear()
+                    self._version = version
+
+    def get(self, key):
+        """(True, значение) при попадании, (False, None) — промах."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and time.monotonic() - item[0] > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                item = None
+            if item is None:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def put(self, key, value):
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "version": self._version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+def _copy(value):
+    # DataFrame изменяемый — наружу отдаём копию, чтобы вызывающий код не испортил кэш
+    return value.copy() if isinstance(value, pd.DataFrame) else value
+
+
+def cached(cache, version_fn, normalize=()):
+    """
+    Декоратор: результат функции кэшируется по (имя, аргументы, версия данных).
+    Аргументы приводятся к именованным с учётом значений по умолчанию, так что
+    f('python') и f(title='python') дают один ключ. normalize — имена текстовых аргументов,
+    которые функция сравнивает без учёта регистра: они нормализуются (normalize_text_arg)
+    и в ключе, и при вызове, поэтому «Python » и «python» — один и тот же запрос.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            version = version_fn()
+            cache.check_version(version)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            for name in normalize:
+                bound.arguments[name] = normalize_text_arg(bound.arguments[name])
+            key = (fn.__name__, version) + tuple(
+                (name, freeze_arg(value)) for name, value in bound.arguments.items()
+            )
+            hit, value = cache.get(key)
+            if hit:
+                return _copy(value)
+            value = fn(*bound.args, **bound.kwargs)
+            cache.put(key, value)
+            return _copy(value)
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,272 @@
+"""
+Бандл артефактов моделей: каталог с manifest.json (версия, контрольные суммы файлов) и
+numpy-массивами, которые загружаются через mmap.
+
+    python src/bot/artifact_bundle.py build --models models --out models/bundle --version 2025-06
+    python src/bot/artifact_bundle.py verify models/bundle
+
+Что лежит в бандле:
+    tfidf_desc / tfidf_title — параметры векторайзера (pickle без словаря), terms.npy, idf.npy;
+    grade_model              — массивы PackedForest (*.npy) + исходная модель для TREE_BACKEND=native;
+    salary_model             — текстовая модель LightGBM (Booster);
+    ohe                      — pickle (он крошечный);
+    minilm_onnx/             — экспортированный энкодер (export_onnx.py), если он есть.
+
+Массивы открываются np.load(..., mmap_mode='r'): страницы файла общие для всех процессов
+через page cache, поэтому N воркеров инференса держат одну копию массивов леса и IDF,
+а не N копий в своих кучах; загрузка — это отображение файла, без распаковки pickle.
+Быстрые предикторы сверяются с исходными моделями при сборке бандла, а не при каждом старте.
+"""
+import argparse
+import copy
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+
+import joblib
+import numpy as np
+
+from tree_predictor import BoosterRegressor, PackedForest, verify_compiled
+
+BUNDLE_FORMAT = 1
+MANIFEST_FILE = 'manifest.json'
+ONNX_SUBDIR = 'minilm_onnx'
+
+
+def _sha256(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(chunk):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _library_versions() -> dict:
+    import lightgbm
+    import sklearn
+    return {'numpy': np.__version__, 'scikit-learn': sklearn.__version__, 'lightgbm': lightgbm.__version__}
+
+
+# --- сборка -----------------------------------------------------------------------------------
+
+def _save_tfidf(vectorizer, out_dir, name):
+    vocabulary = vectorizer.vocabulary_
+    terms = np.array(sorted(vocabulary, key=vocabulary.get))
+    if [vocabulary[t] for t in terms.tolist()] != list(range(len(terms))):
+        raise ValueError(f"{name}: индексы словаря не идут подряд с нуля")
+    params = copy.copy(vectorizer)
+    for attr in ('vocabulary_', '_tfidf', 'stop_words_'):
+        params.__dict__.pop(attr, None)
+    files = {'params': f'{name}/params.pkl', 'terms': f'{name}/terms.npy', 'idf': f'{name}/idf.npy'}
+    os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+    with open(os.path.join(out_dir, files['params']), 'wb') as f:
+        pickle.dump(params, f)
+    np.save(os.path.join(out_dir, files['terms']), terms)
+    np.save(os.path.join(out_dir, files['idf']), np.asarray(vectorizer.idf_, dtype=np.float64))
+    return {'kind': 'tfidf', 'files': files}
+
+
+def _save_forest(model, out_dir, name):
+    forest = PackedForest(model)
+    rows = verify_compiled(model, forest)
+    os.makedirs(os.path.join(out_dir, name), exist_ok=True)
+    files = {array: f'{name}/{array}.npy' for array in PackedForest.ARRAYS}
+    for array, value in forest.arrays().items():
+        np.save(os.path.join(out_dir, files[array]), value)
+    files['native'] = f'{name}/native.joblib'
+    joblib.dump(model, os.path.join(out_dir, files['native']))
+    return {
+        'kind': 'forest',
+        'files': files,
+        'classes': forest.classes_.tolist(),
+        'n_features_in': forest.n_features_in_,
+        'depth': forest.depth,
+        'verified_rows': rows,
+    }
+
+
+def _save_lightgbm(model, out_dir, name):
+    import lightgbm as lgb
+
+    booster = model.booster_ if hasattr(model, 'booster_') else model
+    files = {'model': f'{name}.txt'}
+    path = os.path.join(out_dir, files['model'])
+    booster.save_model(path)
+    # Модель из текста должна давать те же прогнозы, что и исходный pickle
+    rows = verify_compiled(model, BoosterRegressor(lgb.Booster(model_file=path)))
+    return {'kind': 'lightgbm', 'files': files, 'verified_rows': rows}
+
+
+def _save_pickle(obj, out_dir, name):
+    files = {'pickle': f'{name}.pkl'}
+    with open(os.path.join(out_dir, files['pickle']), 'wb') as f:
+        pickle.dump(obj, f)
+    return {'kind': 'pickle', 'files': files}
+
+
+def _saver_for(obj):
+    if hasattr(obj, 'vocabulary_') and hasattr(obj, 'idf_'):
+        return _save_tfidf
+    if hasattr(obj, 'estimators_') and hasattr(obj, 'classes_'):
+        return _save_forest
+    if hasattr(obj, 'booster_') or hasattr(obj, 'num_feature'):
+        return _save_lightgbm
+    return _save_pickle
+
+
+def build_bundle(artifacts: dict, out_dir, version=None, onnx_dir=None) -> dict:
+    """
+    Пишет бандл из уже загруженных артефактов {имя: объект} (+ папка ONNX-энкодера)
+    и возвращает манифест. Каталог out_dir должен быть пустым или отсутствовать.
+    """
+    if os.path.isdir(out_dir) and os.listdir(out_dir):
+        raise ValueError(f"каталог {out_dir} не пуст")
+    os.makedirs(out_dir, exist_ok=True)
+    entries = {}
+    for name, obj in artifacts.items():
+        entries[name] = _saver_for(obj)(obj, out_dir, name)
+    if onnx_dir:
+        shutil.copytree(onnx_dir, os.path.join(out_dir, ONNX_SUBDIR))
+    files = {}
+    for root, _, names in os.walk(out_dir):
+        for fname in sorted(names):
+            path = os.path.join(root, fname)
+            rel = os.path.relpath(path, out_dir).replace(os.sep, '/')
+            files[rel] = {'bytes': os.path.getsize(path), 'sha256': _sha256(path)}
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version or time.strftime('%Y%m%d-%H%M%S'),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'libraries': _library_versions(),
+        'artifacts': entries,
+        'files': files,
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# --- загрузка ---------------------------------------------------------------------------------
+
+class ArtifactBundle:
+    """Бандл на диске: проверка манифеста и контрольных сумм, загрузка артефактов по имени."""
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"В {path} нет {MANIFEST_FILE} — это не бандл артефактов")
+        with open(manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"формат бандла {self.manifest.get('format')}, поддерживается {BUNDLE_FORMAT}")
+        if verify:
+            self.verify()
+        stale = {lib: ver for lib, ver in self.manifest.get('libraries', {}).items()
+                 if _library_versions().get(lib) != ver}
+        if stale:
+            print(f"Бандл {self.version} собран с другими версиями библиотек: {stale}")
+
+    @property
+    def version(self) -> str:
+        return self.manifest['version']
+
+    @property
+    def onnx_dir(self):
+        path = os.path.join(self.path, ONNX_SUBDIR)
+        return path if os.path.isdir(path) else None
+
+    def has(self, name) -> bool:
+        return name in self.manifest['artifacts']
+
+    def verify(self, checksums=True) -> int:
+        """ValueError, если файл бандла пропал, другого размера или (checksums) с другим sha256."""
+        bad = []
+        for rel, info in self.manifest['files'].items():
+            path = os.path.join(self.path, rel)
+            if not os.path.exists(path) or os.path.getsize(path) != info['bytes']:
+                bad.append(rel)
+            elif checksums and _sha256(path) != info['sha256']:
+                bad.append(rel)
+        if bad:
+            raise ValueError(f"бандл {self.path}: повреждены или отсутствуют {', '.join(bad)}")
+        return len(self.manifest['files'])
+
+    def _file(self, entry, key):
+        return os.path.join(self.path, entry['files'][key])
+
+    def _array(self, entry, key):
+        return np.load(self._file(entry, key), mmap_mode='r')
+
+    def load(self, name, native=False):
+        """
+        Артефакт по имени. Деревья по умолчанию — быстрые предикторы (PackedForest поверх mmap,
+        BoosterRegressor); native=True — исходный лес / Booster без обёртки.
+        """
+        entry = self.manifest['artifacts'][name]
+        kind = entry['kind']
+        if kind == 'tfidf':
+            with open(self._file(entry, 'params'), 'rb') as f:
+                vectorizer = pickle.load(f)
+            terms = self._array(entry, 'terms')
+            vectorizer.vocabulary_ = dict(zip(terms.tolist(), range(len(terms))))
+            vectorizer.idf_ = self._array(entry, 'idf')
+            return vectorizer
+        if kind == 'forest':
+            if native:
+                return joblib.load(self._file(entry, 'native'))
+            arrays = {array: self._array(entry, array) for array in PackedForest.ARRAYS}
+            return PackedForest.from_arrays(arrays, entry['classes'], entry['n_features_in'], entry['depth'])
+        if kind == 'lightgbm':
+            import lightgbm as lgb
+            booster = lgb.Booster(model_file=self._file(entry, 'model'))
+            return booster if native else BoosterRegressor(booster)
+        if kind == 'pickle':
+            with open(self._file(entry, 'pickle'), 'rb') as f:
+                return pickle.load(f)
+        raise ValueError(f"{name}: неизвестный тип артефакта {kind}")
+
+
+def _build_cli(args):
+    import model_inference
+
+    sources = {
+        'tfidf_desc': model_inference.TFIDF_DESC_PATH,
+        'tfidf_title': model_inference.TFIDF_TITLE_PATH,
+        'ohe': model_inference.OHE_CATS_PATH,
+        'salary_model': model_inference.SALARY_MODEL_PATH,
+        'grade_model': model_inference.GRADE_MODEL_PATH,
+    }
+    artifacts = {}
+    for name, path in sources.items():
+        path = os.path.join(args.models, os.path.basename(path))
+        if not os.path.exists(path):
+            print(f"{name}: нет {path}, пропускаем")
+            continue
+        artifacts[name] = joblib.load(path)
+    onnx_dir = os.path.join(args.models, ONNX_SUBDIR)
+    manifest = build_bundle(artifacts, args.out, args.version, onnx_dir if os.path.isdir(onnx_dir) else None)
+    size = sum(info['bytes'] for info in manifest['files'].values())
+    print(f"Бандл {manifest['version']}: {', '.join(manifest['artifacts'])}, "
+          f"{len(manifest['files'])} файлов, {size / 2 ** 20:.1f} МБ -> {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бандл артефактов моделей с манифестом и mmap-массивами")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="собрать бандл из pickle-артефактов")
+    build.add_argument('--models', default='models', help="каталог с *.pkl / *.joblib (и minilm_onnx/)")
+    build.add_argument('--out', required=True)
+    build.add_argument('--version', default=None)
+    check = sub.add_parser('verify', help="проверить контрольные суммы")
+    check.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        _build_cli(args)
+    else:
+        bundle = ArtifactBundle(args.path, verify=False)
+        print(f"Бандл {bundle.version}: {bundle.verify()} файлов в порядке")
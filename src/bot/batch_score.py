@@ -0,0 +1,157 @@
+"""
+Офлайн-скоринг всей таблицы vacancy: прогноз зарплаты и грейда в таблицу vacancy_pred.
+
+    python src/bot/batch_score.py --db data/hh.duckdb_3000 --chunk 2000 --workers 4
+
+Вакансии читаются из DuckDB пачками по --chunk строк (по возрастанию id) и считаются
+в пуле процессов; в работе одновременно не больше 2 × --workers пачек, так что память
+ограничена размером пачки. Каждая пачка записывается отдельно, поэтому после обрыва
+повторный запуск считает только вакансии, которых ещё нет в vacancy_pred (--rescore — всё заново).
+"""
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+import model_inference
+from db_pool import open_writer
+from vector_store import save_embeddings
+
+DB_PATH = '/content/drive/MyDrive/hh-hr-bot/data/hh.duckdb_3000'
+PRED_TABLE = 'vacancy_pred'
+SCORE_CHUNK = int(os.getenv('SCORE_CHUNK', 2000))
+SCORE_WORKERS = int(os.getenv('SCORE_WORKERS', os.cpu_count() or 1))
+
+RAW_COLS = ['id', 'title', 'description', 'salary_currency', 'experience_hh', 'area_id', 'skills_raw']
+
+
+def create_pred_table(con):
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {PRED_TABLE} (
+        id BIGINT PRIMARY KEY,
+        salary_pred DOUBLE,
+        grade_code INTEGER,
+        grade_label VARCHAR,
+        scored_at TIMESTAMP DEFAULT current_timestamp
+    )
+    """)
+
+
+def iter_unscored(con, chunk_size, limit=None):
+    """Пачки ещё не посчитанных вакансий (keyset-пагинация по id)."""
+    last_id, total = None, 0
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        df = con.execute(f"""
+            SELECT CAST(v.id AS BIGINT) AS id, {', '.join(f'v.{c}' for c in RAW_COLS[1:])}
+            FROM vacancy v
+            WHERE (? IS NULL OR CAST(v.id AS BIGINT) > ?)
+              AND NOT EXISTS (SELECT 1 FROM {PRED_TABLE} p WHERE p.id = CAST(v.id AS BIGINT))
+            ORDER BY 1
+            LIMIT ?
+        """, [last_id, last_id, size]).df()
+        if df.empty:
+            return
+        last_id = int(df['id'].iloc[-1])
+        total += len(df)
+        yield df
+
+
+def score_chunk(df: pd.DataFrame):
+    """
+    Прогноз для пачки сырых вакансий: MiniLM считается один раз и идёт в обе модели.
+    Возвращает (прогнозы, эмбеддинги) — эмбеддинги сохраняются для поиска похожих вакансий.
+    """
+    feats = model_inference.vacancies_to_features_frame(df)
+    emb = model_inference.encode_descriptions(feats['description'].tolist())
+    X = model_inference.prepare_features_full_frame(feats, emb)
+    salary = model_inference.get_salary_model().predict(X)
+    grade = model_inference.get_artifact('grade_model').predict(emb).astype(int)
+    preds = pd.DataFrame({
+        'id': df['id'].to_numpy(),
+        'salary_pred': salary.astype(float),
+        'grade_code': grade,
+        'grade_label': [model_inference.GRADE_LABELS.get(int(g), "unknown") for g in grade],
+    })
+    return preds, emb
+
+
+def write_predictions(con, result):
+    preds, emb = result
+    con.register('_pred_chunk', preds)
+    try:
+        con.execute("BEGIN TRANSACTION")
+        con.execute(f"INSERT OR REPLACE INTO {PRED_TABLE} BY NAME SELECT * FROM _pred_chunk")
+        save_embeddings(con, preds['id'], emb)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister('_pred_chunk')
+    return len(preds)
+
+
+def _init_worker(threads):
+    # Ядра делим между процессами: иначе каждый воркер возьмёт все потоки под BLAS/torch
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    model_inference.warmup()
+
+
+def score_all(con, chunk_size=SCORE_CHUNK, workers=SCORE_WORKERS, limit=None, rescore=False) -> dict:
+    """Считает прогнозы для всех вакансий без строки в vacancy_pred. Возвращает статистику."""
+    if rescore:
+        con.execute(f"DROP TABLE IF EXISTS {PRED_TABLE}")
+    create_pred_table(con)
+    t0 = time.perf_counter()
+    done = 0
+
+    def report():
+        elapsed = time.perf_counter() - t0
+        print(f"Посчитано {done} вакансий за {elapsed:.1f} c ({done / elapsed:.0f} в секунду)")
+
+    chunks = iter_unscored(con, chunk_size, limit)
+    if workers <= 1:
+        for df in chunks:
+            done += write_predictions(con, score_chunk(df))
+            report()
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+            pending = set()
+            for df in chunks:
+                pending.add(pool.submit(score_chunk, df))
+                if len(pending) < 2 * workers:
+                    continue
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    done += write_predictions(con, fut.result())
+                report()
+            for fut in pending:
+                done += write_predictions(con, fut.result())
+        report()
+    seconds = time.perf_counter() - t0
+    return {"scored": done, "seconds": round(seconds, 3),
+            "rows_per_sec": round(done / seconds) if seconds > 0 else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прогноз зарплаты и грейда для всей таблицы vacancy")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--chunk', type=int, default=SCORE_CHUNK, help="вакансий в пачке")
+    parser.add_argument('--workers', type=int, default=SCORE_WORKERS, help="процессов (1 — без пула)")
+    parser.add_argument('--limit', type=int, default=None, help="не больше стольких вакансий за запуск")
+    parser.add_argument('--rescore', action='store_true', help="пересчитать всё заново")
+    args = parser.parse_args()
+
+    con = open_writer(args.db)
+    print(score_all(con, chunk_size=args.chunk, workers=args.workers, limit=args.limit, rescore=args.rescore))
+    con.close()
@@ -1,7 +1,15 @@
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes,MessageHandler, filters, ConversationHandler
-from model_inference import predict_salary, predict_salary_response, predict_grade
+from model_inference import predict_salary, predict_salary_response, predict_grade, predict_salary_batch, predict_grade_batch, startup_report, encode_descriptions
+from inference_batcher import InferenceBatcher
+from executors import BusyError, BUSY_TEXT, INFERENCE_QUEUE_LIMIT, INFERENCE_WORKERS, WARMUP, run_inference, run_query, shutdown_executors
+import functools
+import asyncio
 from telegram.constants import ParseMode
+import market_analytics
+import metrics
+import vector_store
+from metrics import timed, timer
 from market_analytics import top_5_skills, compare_vacancy_to_market, top_vacancies, get_area_id_by_city, promotion_skills
 import pandas as pd
 from dotenv import load_dotenv
@@ -34,6 +42,25 @@ load_dotenv(dotenv_path="/content/drive/MyDrive/hh-hr-bot/.env")
 # Получить токен из переменных окружения
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
+# Telegram id администраторов через запятую — им доступна команда /stats
+ADMIN_IDS = {int(x) for x in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',') if x}
+
+# Одновременные запросы /salary и /grade считаются пачками
+# (пачки считаются в пуле процессов, см. executors.py)
+salary_batcher = InferenceBatcher(predict_salary_batch, runner=run_inference, max_pending=INFERENCE_QUEUE_LIMIT)
+grade_batcher = InferenceBatcher(predict_grade_batch, runner=run_inference, max_pending=INFERENCE_QUEUE_LIMIT)
+
+def busy_guard(handler):
+    """Если пулы перегружены — сразу отвечаем «повторите позже» и завершаем диалог."""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        try:
+            return await handler(update, context)
+        except BusyError:
+            await update.message.reply_text(BUSY_TEXT)
+            return ConversationHandler.END
+    return wrapper
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Отправляем картинку
     await update.message.reply_photo(
@@ -89,6 +116,8 @@ async def salary_get_grade(update, context):
     )
     return SALARY_GRADE
 
+@timed('handler.salary')
+@busy_guard
 async def salary_finish(update, context):
     grade_input = update.message.text.strip().lower()
     grade = grade_input if grade_input in ['junior', 'middle', 'senior', 'lead'] else None
@@ -102,7 +131,7 @@ async def salary_finish(update, context):
 
     # Найти area_id по названию города (твоя таблица area)
 
-    area_id = get_area_id_by_city(city) or 0
+    area_id = await run_query(get_area_id_by_city, city) or 0
 
 
     # Кодируем грейд
@@ -131,7 +160,7 @@ async def salary_finish(update, context):
         'title': description[:40],
         'salary_currency': "RUR"
     }
-    salary = predict_salary(features)
+    salary = await salary_batcher.submit(features)
     msg = (
         f"<b>Прогнозируемая зарплата по вакансии:</b> {int(salary):,}".replace(',', ' ') +f" {features['salary_currency']}\n\n"
         f"Ваши данные:\n"
@@ -139,7 +168,8 @@ async def salary_finish(update, context):
         f"Навыки: {', '.join(skills)}\n"
         f"Уровень: {grade if grade else 'не указан'}"
     )
-    await update.message.reply_text(msg, parse_mode="HTML")
+    with timer('telegram.reply'):
+        await update.message.reply_text(msg, parse_mode="HTML")
     await update.message.reply_text(MAIN_MENU_TEXT)
     return ConversationHandler.END
 
@@ -163,12 +193,14 @@ async def grade_get_skills(update, context):
     )
     return GRADE_SKILLS
 
+@timed('handler.grade')
+@busy_guard
 async def grade_finish(update, context):
     description = context.user_data['description']
     city = context.user_data['city']
     skills = [s.strip() for s in update.message.text.split(',')]
 
-    area_id = get_area_id_by_city(city) or 0
+    area_id = await run_query(get_area_id_by_city, city) or 0
     desc_len = len(description)
     desc_words = len(description.split())
     title = description[:40]
@@ -191,7 +223,7 @@ async def grade_finish(update, context):
         'salary_currency': "RUR"
     }
 
-    grade_code = predict_grade(features)
+    grade_code = await grade_batcher.submit(features)
     grade_map = {0: "junior", 1: "middle", 2: "senior", 3: "lead"}
     grade_label = grade_map.get(grade_code, "unknown")
 
@@ -202,7 +234,8 @@ async def grade_finish(update, context):
         f"Навыки: {', '.join(skills)}\n"
         f"Описание: {description[:40]}..."
     )
-    await update.message.reply_text(msg, parse_mode="HTML")
+    with timer('telegram.reply'):
+        await update.message.reply_text(msg, parse_mode="HTML")
     await update.message.reply_text(MAIN_MENU_TEXT)
     return ConversationHandler.END
 
@@ -226,6 +259,8 @@ async def skills_get_grade(update, context):
     )
     return SKILLS_GRADE
 
+@timed('handler.skills')
+@busy_guard
 async def skills_finish(update, context):
     grade_input = update.message.text.strip().lower()
     title = context.user_data['title']
@@ -233,14 +268,14 @@ async def skills_finish(update, context):
     grade = grade_input if grade_input in ['junior', 'middle', 'senior', 'lead'] else None
 
     # Получить area_id
-    area_id = get_area_id_by_city(city) or 0
+    area_id = await run_query(get_area_id_by_city, city) or 0
 
     # Преобразовать грейд в нужный формат для top_5_skills (int или str)
     grade_map = {'junior': 0, 'middle': 1, 'senior': 2, 'lead': 3}
     grade_code = grade_map.get(grade, None) if grade else None
 
     # Получить топ-5 навыков
-    df = top_5_skills(title=title, area_id=area_id, grade=grade_code)
+    df = await run_query(top_5_skills, title=title, area_id=area_id, grade=grade_code)
 
     if df.empty:
         await update.message.reply_text("Нет данных для выбранных параметров.")
@@ -257,7 +292,8 @@ async def skills_finish(update, context):
             f"{i+1}. <b>{row['skill_name']}</b> — {row['frequency']} вакансий, "
             f"ср. зарплата: {salary} руб.\n"
         )
-    await update.message.reply_text(msg, parse_mode="HTML")
+    with timer('telegram.reply'):
+        await update.message.reply_text(msg, parse_mode="HTML")
     await update.message.reply_text(MAIN_MENU_TEXT)
     return ConversationHandler.END
 
@@ -288,6 +324,8 @@ async def nextskills_get_to(update, context):
     )
     return NEXTSKILLS_TO
 
+@timed('handler.nextskills')
+@busy_guard
 async def nextskills_finish(update, context):
     grade_to = update.message.text.strip().lower()
     title = context.user_data['title']
@@ -295,10 +333,10 @@ async def nextskills_finish(update, context):
     grade_from = context.user_data['grade_from']
 
     # Получить area_id
-    area_id = get_area_id_by_city(city) if city and city != '-' else None
+    area_id = await run_query(get_area_id_by_city, city) if city and city != '-' else None
 
     # Аналитика
-    result = promotion_skills(title=title, area_id=area_id, grade_from=grade_from, grade_to=grade_to, top_n=7)
+    result = await run_query(promotion_skills, title=title, area_id=area_id, grade_from=grade_from, grade_to=grade_to, top_n=7)
     if not result:
         await update.message.reply_text("Нет данных для выбранных параметров или мало вакансий для анализа.")
     else:
@@ -306,9 +344,10 @@ async def nextskills_finish(update, context):
             f"Для перехода с <b>{grade_from}</b> на <b>{grade_to}</b> по профессии <b>{title}</b> "
             f"на рынке чаще всего выделяют навыки:\n"
         )
-        for i, (skill, delta, freq) in enumerate(result, 1):
-            msg += f"{i}. <b>{skill}</b> (+{delta} вакансий, всего {freq})\n"
-        await update.message.reply_text(msg, parse_mode="HTML")
+        for i, (skill, delta, share_from, share_to) in enumerate(result, 1):
+            msg += f"{i}. <b>{skill}</b> — в {share_to:.0%} вакансий {grade_to} против {share_from:.0%} у {grade_from}\n"
+        with timer('telegram.reply'):
+            await update.message.reply_text(msg, parse_mode="HTML")
 
     await update.message.reply_text(MAIN_MENU_TEXT)
     return ConversationHandler.END
@@ -347,6 +386,41 @@ async def analyze_get_salary(update, context):
     )
     return ANALYZE_SALARY
 
+def format_market_report(report):
+    """Текст ответа /analyze по результату compare_vacancy_to_market."""
+    if not report['vacancies']:
+        return "Нет сопоставимых вакансий для сравнения."
+    region = f"регион {report['area_id']}" if report['area_id'] else "все регионы"
+    text = f"Ваша вакансия: {report['title']} ({report['experience_hh'] or 'любой опыт'}, {region})\n"
+    text += f"Сопоставимых вакансий: {report['vacancies']}, с зарплатой: {report['with_salary']}\n"
+    if report['median'] is not None:
+        q = report['quantiles']
+        if report['salary_diff'] is not None:
+            diff, perc = report['salary_diff'], report['salary_diff_pct']
+            text += (
+                f"Зарплата: {int(report['salary'])} руб.\n"
+                f"Медиана рынка: {int(report['median'])} руб.\n"
+                f"Отклонение: {'+' if diff > 0 else ''}{int(diff)} руб. ({'+' if perc > 0 else ''}{perc}%)\n"
+                f"Ваша зарплата выше, чем в {report['salary_percentile']}% вакансий\n"
+            )
+        else:
+            text += f"Медиана зарплаты по рынку: {int(report['median'])} руб.\n"
+        text += f"Половина вакансий: от {int(q[0.25])} до {int(q[0.75])} руб.\n"
+
+    if report['top_skills']:
+        top = [f"{skill} ({share:.0%})" for skill, share in report['top_skills']]
+        text += (
+            f"\nВаши навыки: {', '.join(report['your_skills'])}\n"
+            f"Топ-{len(top)} популярных навыков на рынке: {', '.join(top)}\n"
+        )
+        if report['unique']:
+            text += f"Уникальные для вас навыки (редко встречаются): {', '.join(report['unique'])}\n"
+        if report['missing']:
+            text += f"Рекомендуется добавить популярные навыки: {', '.join(report['missing'])}\n"
+    return text
+
+@timed('handler.analyze')
+@busy_guard
 async def analyze_finish(update, context):
     description = context.user_data['description']
     city = context.user_data['city']
@@ -357,19 +431,27 @@ async def analyze_finish(update, context):
     except ValueError:
         salary_rub = None
 
-    area_id = get_area_id_by_city(city) or 0
+    area_id = await run_query(get_area_id_by_city, city) or 0
+
+    # Эмбеддинг описания — для поиска похожих вакансий (если ETL собрал индекс)
+    embedding = None
+    # get_index при пересборке перечитывает файлы индекса — не в event loop
+    if await run_query(vector_store.get_index) is not None:
+        embedding = (await run_inference(encode_descriptions, [description]))[0]
 
     vac = {
         'title': description[:40],          # для title
         'area_id': area_id,
         'experience_hh': None,              # если хочешь — добавить шаг с опытом
         'skills': skills,
-        'salary_rub': salary_rub
+        'salary_rub': salary_rub,
+        'embedding': embedding,
     }
 
     # Анализ
-    result = compare_vacancy_to_market(vac)
-    await update.message.reply_text(result)
+    report = await run_query(compare_vacancy_to_market, vac)
+    with timer('telegram.reply'):
+        await update.message.reply_text(format_market_report(report))
     await update.message.reply_text(MAIN_MENU_TEXT)
     return ConversationHandler.END
 
@@ -393,18 +475,20 @@ async def top_get_grade(update, context):
     )
     return TOP_GRADE
 
+@timed('handler.top')
+@busy_guard
 async def top_finish(update, context):
     city = context.user_data['city']
     title = context.user_data['title']
     grade_input = update.message.text.strip().lower()
 
-    area_id = get_area_id_by_city(city) or 0
+    area_id = await run_query(get_area_id_by_city, city) or 0
 
     grade_map = {'junior': 0, 'middle': 1, 'senior': 2, 'lead': 3}
     grade = grade_map.get(grade_input, None) if grade_input and grade_input != '-' else None
 
     # Получаем топ-вакансий (твоя функция должна возвращать DataFrame/список вакансий)
-    df = top_vacancies(area_name=city, keyword=title, grade=grade)
+    df = await run_query(top_vacancies, area_name=city, keyword=title, grade=grade)
 
     if df.empty:
         await update.message.reply_text("Не найдено вакансий по заданным параметрам.")
@@ -423,7 +507,8 @@ async def top_finish(update, context):
             f"Город: {city}\n"
             "— — —\n"
         )
-    await update.message.reply_text(msg, parse_mode="HTML")
+    with timer('telegram.reply'):
+        await update.message.reply_text(msg, parse_mode="HTML")
     await update.message.reply_text(MAIN_MENU_TEXT)
     return ConversationHandler.END
 
@@ -436,9 +521,45 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     )
 
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Задержки по этапам (p50/p95/p99) и состояние кэша/пула — только для ADMIN_IDS."""
+    if update.effective_user is None or update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("Команда доступна только администраторам.")
+        return
+    cache = market_analytics.analytics_cache.stats()
+    pool = market_analytics.get_pool().stats()
+    msg = (
+        metrics.format_stats() + "\n\n"
+        f"Кэш аналитики: {cache['hits']} попаданий / {cache['misses']} промахов "
+        f"(hit rate {cache['hit_rate']}), записей {cache['size']}\n"
+        f"Пул DuckDB: занято {pool['in_use']} из {pool['size']}, ожиданий {pool['waited']}, "
+        f"таймаутов {pool['timeouts']}, макс. ожидание {pool['wait_max_ms']} мс"
+    )
+    await update.message.reply_text(msg)
+
+async def warmup_in_background():
+    """Прогрев базы и моделей в воркерах, пока бот уже отвечает на /start и /help"""
+    try:
+        await run_query(market_analytics.get_connection)
+        print(f"DuckDB открыта за {market_analytics.CONNECT_TIME:.2f} c")
+        # Каждый воркер пула при старте грузит модели (см. executors._init_inference_worker)
+        reports = await asyncio.gather(*[run_inference(startup_report) for _ in range(INFERENCE_WORKERS)])
+        for report in sorted(set(reports)):
+            print(report)
+    except Exception as e:
+        print(f"Прогрев не удался: {e}")
+
+async def on_startup(app):
+    metrics.start_http_server()  # /metrics для Prometheus, если задан METRICS_PORT
+    if WARMUP:
+        app.create_task(warmup_in_background())
+
+async def on_shutdown(app):
+    shutdown_executors()
+
 def main():
 
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    app = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(on_startup).post_shutdown(on_shutdown).build()
 
     conv_salary = ConversationHandler(
         entry_points=[CommandHandler("salary", salary_start)],
@@ -505,6 +626,7 @@ def main():
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
+    app.add_handler(CommandHandler("stats", stats_command))
     app.add_handler(conv_salary)
     app.add_handler(conv_skills)
     app.add_handler(conv_analyze)
@@ -0,0 +1,216 @@
+import bisect
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+# Поиск area_id по названию города в памяти: справочник cities (несколько тысяч строк)
+# загружается один раз и раскладывается в отсортированный список «хвостов» названий
+# (поиск по префиксу слова — bisect) и триграммный индекс (подстрока и опечатки).
+# Раз в CITY_REFRESH_INTERVAL сек сверяется подпись справочника; если она поменялась —
+# индекс пересобирается.
+CITY_REFRESH_INTERVAL = float(os.getenv('CITY_REFRESH_INTERVAL', 60))
+CITY_CACHE_SIZE = int(os.getenv('CITY_CACHE_SIZE', 4096))
+
+# Сокращения и разговорные названия (в нормализованном виде) -> нормализованное название
+ALIASES = {
+    'спб': 'санкт петербург',
+    'с пб': 'санкт петербург',
+    'питер': 'санкт петербург',
+    'петербург': 'санкт петербург',
+    'мск': 'москва',
+    'екб': 'екатеринбург',
+    'екат': 'екатеринбург',
+    'нск': 'новосибирск',
+    'новосиб': 'новосибирск',
+    'нн': 'нижний новгород',
+    'н новгород': 'нижний новгород',
+    'нижний': 'нижний новгород',
+    'ростов': 'ростов на дону',
+    'рнд': 'ростов на дону',
+    'мо': 'московская область',
+    'подмосковье': 'московская область',
+    'ло': 'ленинградская область',
+    'спб и ло': 'санкт петербург',
+}
+
+# «г. Москва», «город Казань» -> без префикса
+_PREFIX_RE = re.compile(r'^(?:г|гор|город)\s+')
+_NON_WORD_RE = re.compile(r'[^0-9a-zа-я]+')
+
+
+def normalize_city(text) -> str:
+    """Нижний регистр, ё -> е, дефисы и знаки препинания -> пробел, без «г.»/«город»."""
+    text = _NON_WORD_RE.sub(' ', str(text).lower().replace('ё', 'е')).strip()
+    return _PREFIX_RE.sub('', text)
+
+
+def _grams(text):
+    """Триграммы с пробелами по краям: у коротких слов тоже есть триграммы, начало и конец весомее."""
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _max_typos(text):
+    """Сколько опечаток прощаем: короткие названия — ни одной, иначе 1–2."""
+    if len(text) < 4:
+        return 0
+    return 1 if len(text) < 8 else 2
+
+
+def _edit_distance(a, b, limit):
+    """Расстояние Левенштейна с перестановкой соседних букв; больше limit — limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+class CityResolver:
+    """
+    Название города/региона -> area_id.
+
+    load() возвращает строки (area_id, area_name, parent_area, вакансий); signature() — любое
+    значение, которое меняется вместе со справочником (None — не проверять).
+    Порядок поиска: сокращение из ALIASES, точное совпадение, начало названия или его слова,
+    подстрока, затем ближайшее название с опечаткой. Из нескольких подходящих выбирается
+    город с наибольшим числом вакансий, затем с более коротким названием.
+    """
+
+    def __init__(self, load, signature=None, refresh_interval=CITY_REFRESH_INTERVAL, cache_size=CITY_CACHE_SIZE):
+        self._load = load
+        self._signature = signature
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._index = None
+        self._current_signature = None
+        self._checked_at = 0.0
+        self._cache = {}  # (индекс, запрос) -> area_id
+        self.loads = 0
+
+    # --- индекс -------------------------------------------------------------------------------
+
+    def _build(self, rows):
+        ids, names, rank = [], [], []
+        suffixes = []  # (хвост названия с начала слова, номер записи)
+        postings = {}  # триграмма -> номера записей
+        for area_id, area_name, _parent, vacancies in rows:
+            name = normalize_city(area_name)
+            if not name:
+                continue
+            n = len(ids)
+            ids.append(int(area_id))
+            names.append(name)
+            rank.append((-int(vacancies or 0), len(name), int(area_id)))
+            for match in re.finditer(r'\S+', name):
+                suffixes.append((name[match.start():], n))
+            for gram in _grams(name):
+                postings.setdefault(gram, []).append(n)
+        suffixes.sort()
+        exact = {}
+        for n, name in enumerate(names):
+            if name not in exact or rank[n] < rank[exact[name]]:
+                exact[name] = n
+        return {
+            'ids': ids, 'names': names, 'rank': rank, 'exact': exact,
+            'suffixes': suffixes, 'suffix_keys': [s for s, _ in suffixes], 'postings': postings,
+        }
+
+    def refresh(self, force=False):
+        """Сверяет подпись справочника и при изменении (или force) пересобирает индекс."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._index is not None and now - self._checked_at < self.refresh_interval:
+                return False
+            signature = self._signature() if self._signature else None
+            self._checked_at = now
+            if not force and self._index is not None and signature == self._current_signature:
+                return False
+            self._index = self._build(self._load())
+            self._current_signature = signature
+            self._cache.clear()
+            self.loads += 1
+            return True
+
+    def _ensure_fresh(self):
+        if self._index is None or time.monotonic() - self._checked_at >= self.refresh_interval:
+            self.refresh()
+
+    # --- поиск --------------------------------------------------------------------------------
+
+    def _best(self, idx, candidates):
+        return min(candidates, key=idx['rank'].__getitem__, default=None)
+
+    def _by_prefix(self, idx, query):
+        keys = idx['suffix_keys']
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + '\uffff', start)
+        return {idx['suffixes'][i][1] for i in range(start, end)}
+
+    def _by_substring(self, idx, query):
+        grams = {g for g in _grams(query) if ' ' not in (g[0], g[2])} or _grams(query)
+        lists = sorted((idx['postings'].get(g, ()) for g in grams), key=len)
+        if not lists or not lists[0]:
+            return set()
+        candidates = set(lists[0]).intersection(*lists[1:])
+        return {n for n in candidates if query in idx['names'][n]}
+
+    def _by_typo(self, idx, query):
+        limit = _max_typos(query)
+        if not limit:
+            return set()
+        grams = _grams(query)
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(idx['postings'].get(gram, ()))
+        # каждая правка портит не больше 3 триграмм (+1 — конец запроса, если он совпадает с началом названия)
+        min_overlap = len(grams) - 3 * limit - 1
+        candidates = sorted((n for n, c in overlap.items() if c >= min_overlap), key=overlap.__getitem__, reverse=True)
+        best, found = limit + 1, set()
+        for n in candidates[:64]:
+            name = idx['names'][n]
+            # опечатка в названии целиком («новосибрск») или в его начале («новасиб»)
+            distance = min(_edit_distance(query, name, limit), _edit_distance(query, name[:len(query)], limit))
+            if distance < best:
+                best, found = distance, {n}
+            elif distance == best:
+                found.add(n)
+        return found if best <= limit else set()
+
+    def _resolve(self, idx, query):
+        query = ALIASES.get(query, query)
+        if query in idx['exact']:
+            return idx['exact'][query]
+        for search in (self._by_prefix, self._by_substring, self._by_typo):
+            found = self._best(idx, search(idx, query))
+            if found is not None:
+                return found
+        return None
+
+    def resolve(self, city_name):
+        """area_id для названия (None — ничего похожего нет)."""
+        query = normalize_city(city_name or '')
+        if not query:
+            return None
+        self._ensure_fresh()
+        idx = self._index
+        key = (id(idx), query)
+        if key in self._cache:
+            return self._cache[key]
+        found = self._resolve(idx, query)
+        area_id = idx['ids'][found] if found is not None else None
+        if len(self._cache) >= self.cache_size:
+            self._cache = {}  # запросы — названия городов, их немного: проще сбросить, чем вести LRU
+        self._cache[key] = area_id
+        return area_id
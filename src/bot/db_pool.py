@@ -0,0 +1,205 @@
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import duckdb
+
+from metrics import observe
+
+# Настройки DuckDB (DUCKDB_THREADS, DUCKDB_MEMORY_LIMIT), соединение на запись и версия данных
+# базы — общие с ETL: модуль src/etl/hh_database.py (имя уникально для обоих каталогов src/bot и src/etl)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'etl'))
+from hh_database import (  # noqa: E402,F401
+    DUCKDB_MEMORY_LIMIT, DUCKDB_THREADS, bump_data_version, connect_writer as open_writer, duckdb_config,
+    published_snapshot, read_data_version,
+)
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', os.getenv('DB_WORKERS', 4)))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))  # сек ожидания свободного курсора
+DB_READ_ONLY = os.getenv('DB_READ_ONLY', '1') == '1'       # бот только читает базу
+DB_USE_SNAPSHOTS = os.getenv('DB_USE_SNAPSHOTS', '1') == '1'  # читать снимки, публикуемые ETL
+
+
+class PoolTimeout(TimeoutError):
+    """Свободный курсор не появился за DB_POOL_TIMEOUT секунд."""
+
+
+class ConnectionPool:
+    """
+    Пул курсоров DuckDB поверх одного соединения с базой.
+
+    Курсоры DuckDB — независимые соединения к одному экземпляру базы, поэтому запросы
+    из разных потоков выполняются параллельно. Курсор берётся на время запроса:
+
+        with pool.acquire() as cur:
+            df = cur.execute(sql, params).fetchdf()
+
+    Если все size курсоров заняты, acquire ждёт до timeout секунд (иначе PoolTimeout).
+    Время ожидания курсора копится в stats() и в метрике db.acquire (src/bot/metrics.py).
+
+    С use_snapshots пул открывает не сам файл базы, а снимок текущей версии данных, который
+    публикует ETL (src/etl/hh_database.py), — иначе соединение бота блокировало бы запись.
+    При смене версии следующий acquire открывает новый снимок; курсоры старого соединения
+    закрываются по возврату, а само оно — когда вернётся последний из них.
+    """
+
+    def __init__(self, db_path, size=DB_POOL_SIZE, read_only=DB_READ_ONLY, threads=DUCKDB_THREADS,
+                 memory_limit=DUCKDB_MEMORY_LIMIT, timeout=DB_POOL_TIMEOUT, use_snapshots=DB_USE_SNAPSHOTS):
+        self.db_path = db_path
+        self.size = size
+        self.read_only = read_only
+        self.use_snapshots = use_snapshots
+        self.config = duckdb_config(threads, memory_limit)
+        self.timeout = timeout
+        self.connect_time = None
+        self.path = None           # открытый файл: снимок или сама база
+        self._con = None
+        self._generation = 0       # номер соединения; курсоры помечены им
+        self._busy = {}            # поколение -> курсоров на руках
+        self._retired = {}         # поколение -> старое соединение, ждущее возврата курсоров
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.RLock()
+        self._stats = {"acquired": 0, "waited": 0, "timeouts": 0, "wait_total": 0.0, "wait_max": 0.0,
+                       "reopened": 0}
+
+    def _target(self):
+        """Какой файл должен быть открыт: снимок текущей версии, а пока его нет — сама база."""
+        if self.use_snapshots:
+            return published_snapshot(self.db_path) or self.db_path
+        return self.db_path
+
+    def connection(self):
+        """Соединение с актуальным снимком (открывается при первом обращении и при смене версии)."""
+        target = self._target()
+        with self._lock:
+            if self._con is None or target != self.path:
+                self._open(target)
+            return self._con
+
+    def _open(self, path):
+        """Открывает path вместо текущего соединения (под self._lock)."""
+        if self._con is not None:
+            self._drain_idle()
+            if self._busy.get(self._generation):
+                self._retired[self._generation] = self._con
+            else:
+                self._con.close()
+            self._stats["reopened"] += 1
+        t0 = time.perf_counter()
+        self._con = duckdb.connect(path, read_only=self.read_only, config=self.config)
+        self.connect_time = time.perf_counter() - t0
+        self.path = path
+        self._generation += 1
+        self._created = 0
+
+    def _drain_idle(self):
+        while True:
+            try:
+                _, cur = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            cur.close()
+
+    def _take_now(self, con):
+        """Свободный или новый курсор соединения con без ожидания (под self._lock); None — все заняты."""
+        try:
+            generation, cur = self._idle.get_nowait()
+        except queue.Empty:
+            if self._created >= self.size:
+                return None
+            generation, cur = self._generation, con.cursor()
+            self._created += 1
+        self._busy[generation] = self._busy.get(generation, 0) + 1
+        return generation, cur
+
+    def _take(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            con = self.connection()
+            with self._lock:
+                taken = self._take_now(con) if con is self._con else None
+            if taken:
+                return (*taken, waited)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise PoolTimeout(f"нет свободного курсора DuckDB за {self.timeout} c")
+            waited = True
+            try:
+                # Ждём короткими отрезками: после смены снимка курсоры создаются заново, а не возвращаются
+                generation, cur = self._idle.get(timeout=min(remaining, 0.1))
+            except queue.Empty:
+                continue
+            with self._lock:
+                if generation == self._generation:
+                    self._busy[generation] = self._busy.get(generation, 0) + 1
+                    return generation, cur, True
+            cur.close()  # курсор соединения, которое уже сменилось
+
+    def _release(self, generation, cur):
+        with self._lock:
+            self._busy[generation] -= 1
+            if generation == self._generation:
+                self._idle.put((generation, cur))
+                return
+            cur.close()
+            if not self._busy[generation]:
+                del self._busy[generation]
+                retired = self._retired.pop(generation, None)
+                if retired is not None:
+                    retired.close()
+
+    @contextmanager
+    def acquire(self):
+        t0 = time.perf_counter()
+        generation, cur, waited = self._take()
+        wait = time.perf_counter() - t0
+        with self._lock:
+            self._stats["acquired"] += 1
+            self._stats["waited"] += int(waited)
+            self._stats["wait_total"] += wait
+            self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+        observe('db.acquire', wait)
+        try:
+            yield cur
+        finally:
+            self._release(generation, cur)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            created = self._created
+            in_use = self._busy.get(self._generation, 0)
+        acquired = s["acquired"]
+        return {
+            "size": self.size,
+            "created": created,
+            "in_use": in_use,
+            "acquired": acquired,
+            "waited": s["waited"],
+            "timeouts": s["timeouts"],
+            "wait_avg_ms": round(1000 * s["wait_total"] / acquired, 3) if acquired else 0.0,
+            "wait_max_ms": round(1000 * s["wait_max"], 3),
+            "connect_time": self.connect_time,
+            "reopened": s["reopened"],
+            "path": self.path,
+        }
+
+    def close(self):
+        with self._lock:
+            self._drain_idle()
+            self._created = 0
+            for con in self._retired.values():
+                con.close()
+            self._retired.clear()
+            self._busy.clear()
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+            self.path = None
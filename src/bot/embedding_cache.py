@@ -0,0 +1,120 @@
+import fcntl
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_text(text) -> str:
+    """
+    Нормализация описания для ключа кэша: только пробелы (strip + схлопывание).
+    Регистр не трогаем — токенизатор MiniLM регистрозависимый.
+    """
+    return " ".join(str(text or "").split())
+
+
+def text_key(text, namespace="") -> str:
+    """Ключ кэша — sha1 от нормализованного текста (namespace — например, бэкенд энкодера)."""
+    return hashlib.sha1(f"{namespace}\0{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    LRU-кэш эмбеддингов описаний с ограничением по числу записей и по памяти.
+    Общий для всех пайплайнов признаков, умеет сохраняться на диск (npz).
+    """
+
+    def __init__(self, max_items=10000, max_bytes=64 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False  # есть записи, которых ещё нет на диске
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, key, vec):
+        vec = np.asarray(vec, dtype=np.float32)
+        if self.max_items <= 0 or vec.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._data[key] = vec
+            self._bytes += vec.nbytes
+            self.dirty = True
+            # Вытесняем самые старые записи, пока не влезем в лимиты
+            while len(self._data) > self.max_items or self._bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def save(self, path):
+        """
+        Сохраняет кэш в .npz (ключи + матрица эмбеддингов). Кэш ведут несколько процессов
+        (бот и воркеры пула инференса), поэтому файл не перезаписывается, а дополняется:
+        под файловой блокировкой записи с диска объединяются со своими (свои — как более
+        свежие), лишнее сверх лимитов отбрасывается со старой стороны. Временный файл у
+        каждого процесса свой.
+        """
+        with self._lock:
+            mine = OrderedDict(self._data)
+            self.dirty = False
+        if not mine:
+            return
+        with open(f"{path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = OrderedDict()
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    for key, vec in zip(data['keys'], data['vecs']):
+                        if str(key) not in mine:
+                            merged[str(key)] = vec
+            merged.update(mine)
+            keys, vecs = list(merged), list(merged.values())
+            total = sum(v.nbytes for v in vecs)
+            start = 0
+            while start < len(keys) and (len(keys) - start > self.max_items or total > self.max_bytes):
+                total -= vecs[start].nbytes
+                start += 1
+            if start == len(keys):
+                return
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, keys=np.array(keys[start:]), vecs=np.stack(vecs[start:]))
+            os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Подгружает ранее сохранённый кэш (если файла нет — ничего не делает)."""
+        if not path or not os.path.exists(path):
+            return 0
+        with np.load(path) as data:
+            for key, vec in zip(data['keys'], data['vecs']):
+                self.put(str(key), vec)
+        self.dirty = False
+        return len(self._data)
@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+
+# Размеры пулов и лимиты очередей (можно переопределить в .env)
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', 2))
+INFERENCE_QUEUE_LIMIT = int(os.getenv('INFERENCE_QUEUE_LIMIT', 64))
+DB_WORKERS = int(os.getenv('DB_WORKERS', 4))
+DB_QUEUE_LIMIT = int(os.getenv('DB_QUEUE_LIMIT', 64))
+# Прогревать модели в воркерах сразу при их старте (0 — грузить по первому запросу)
+WARMUP = os.getenv('WARMUP', '1') == '1'
+
+BUSY_TEXT = "Сервис сейчас перегружен, попробуйте ещё раз через минуту."
+
+
+class BusyError(Exception):
+    """Очередь задач переполнена — лучше сразу попросить повторить, чем копить задержку."""
+
+
+class BoundedExecutor:
+    """Обёртка над executor'ом с ограничением числа задач в работе и в очереди."""
+
+    def __init__(self, executor, max_pending):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def run(self, fn, *args, **kwargs):
+        if self.pending >= self.max_pending:
+            raise BusyError(f"в очереди уже {self.pending} задач")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _init_inference_worker():
+    import model_inference
+    model_inference.register_cache_save()
+    if WARMUP:
+        try:
+            model_inference.warmup()
+        except Exception as e:
+            # Не роняем воркер: недостающий артефакт проявится ошибкой при первом запросе
+            print(f"Прогрев моделей не удался: {e}")
+
+
+# Инференс — в отдельных процессах (MiniLM/LightGBM упираются в GIL),
+# запросы к DuckDB — в потоках (у каждого потока свой курсор, см. market_analytics)
+inference_executor = BoundedExecutor(ProcessPoolExecutor(max_workers=INFERENCE_WORKERS, initializer=_init_inference_worker), INFERENCE_QUEUE_LIMIT)
+db_executor = BoundedExecutor(ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='duckdb'), DB_QUEUE_LIMIT)
+
+
+async def run_inference(fn, *args, **kwargs):
+    """Запускает функцию модели в пуле процессов (замеры этапов из воркера попадают в metrics)."""
+    result, samples = await inference_executor.run(metrics.capture, fn, *args, **kwargs)
+    metrics.merge(samples)
+    return result
+
+
+async def run_query(fn, *args, **kwargs):
+    """Запускает аналитический запрос к DuckDB в пуле потоков."""
+    return await db_executor.run(fn, *args, **kwargs)
+
+
+def shutdown_executors():
+    inference_executor.shutdown()
+    db_executor.shutdown()
@@ -0,0 +1,115 @@
+"""
+Экспорт MiniLM-энкодера в ONNX с динамической int8-квантизацией и проверка паритета.
+
+    python src/bot/export_onnx.py export --out models/minilm_onnx
+    python src/bot/export_onnx.py check --onnx-dir models/minilm_onnx --csv data/raw/sample_vacancies.csv
+
+После экспорта model_inference сам переключится на ONNX (ENCODER_BACKEND=auto),
+если ONNX_ENCODER_DIR указывает на папку с моделью.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import model_inference
+from onnx_encoder import OnnxEncoder, ONNX_FP32_FILE, ONNX_QUANT_FILE
+
+
+def export_onnx(out_dir, quantize=True, opset=14):
+    """Экспортирует MiniLM в out_dir/model.onnx (+ model_quant.onnx) вместе с токенизатором."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_inference.MINILM_NAME)
+    model = AutoModel.from_pretrained(model_inference.MINILM_NAME).eval()
+    sample = tokenizer(["Python-разработчик, Django, PostgreSQL"], return_tensors='pt')
+
+    fp32_path = os.path.join(out_dir, ONNX_FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample['input_ids'], sample['attention_mask']),
+            fp32_path,
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['last_hidden_state'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'seq'},
+                'attention_mask': {0: 'batch', 1: 'seq'},
+                'last_hidden_state': {0: 'batch', 1: 'seq'},
+            },
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(out_dir)
+    print(f"ONNX (fp32): {fp32_path}, {os.path.getsize(fp32_path) / 2**20:.1f} МБ")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quant_path = os.path.join(out_dir, ONNX_QUANT_FILE)
+        quantize_dynamic(fp32_path, quant_path, weight_type=QuantType.QInt8)
+        print(f"ONNX (int8): {quant_path}, {os.path.getsize(quant_path) / 2**20:.1f} МБ")
+
+
+def parity_check(onnx_dir, csv_path, limit=None):
+    """
+    Сравнивает ONNX-энкодер с исходным SentenceTransformer на вакансиях из csv:
+    косинусный дрейф эмбеддингов и разница прогнозов зарплаты/грейда.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    df = pd.read_csv(csv_path)
+    if limit:
+        df = df.head(limit)
+    features_list = [model_inference.vacancy_to_features(row) for row in df.to_dict('records')]
+    descs = [f['description'] for f in features_list]
+
+    torch_encoder = SentenceTransformer(model_inference.MINILM_NAME)
+    onnx_encoder = OnnxEncoder(onnx_dir)
+
+    t0 = time.perf_counter()
+    emb_torch = torch_encoder.encode(descs)
+    t_torch = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    emb_onnx = onnx_encoder.encode(descs)
+    t_onnx = time.perf_counter() - t0
+
+    cos = (emb_torch * emb_onnx).sum(axis=1) / (
+        np.linalg.norm(emb_torch, axis=1) * np.linalg.norm(emb_onnx, axis=1) + 1e-12
+    )
+    print(f"Вакансий: {len(descs)}, модель: {onnx_encoder.model_path}")
+    print(f"Энкодинг: torch {t_torch:.2f} c, onnx {t_onnx:.2f} c (x{t_torch / max(t_onnx, 1e-9):.1f})")
+    print(f"Косинус torch vs onnx: среднее {cos.mean():.5f}, минимум {cos.min():.5f}")
+
+    salary_model = model_inference.get_artifact('salary_model')
+    salary_torch = salary_model.predict(model_inference.prepare_features_full_batch(features_list, emb_vec=emb_torch))
+    salary_onnx = salary_model.predict(model_inference.prepare_features_full_batch(features_list, emb_vec=emb_onnx))
+    delta = np.abs(salary_torch - salary_onnx)
+    print(f"Зарплата: средняя |Δ| {delta.mean():.0f} руб., максимум {delta.max():.0f} руб., "
+          f"медиана относительной Δ {np.median(delta / np.maximum(np.abs(salary_torch), 1)) * 100:.2f}%")
+
+    grade_model = model_inference.get_artifact('grade_model')
+    grade_agree = (grade_model.predict(emb_torch) == grade_model.predict(emb_onnx)).mean()
+    print(f"Грейд: совпадение прогнозов {grade_agree * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX-экспорт MiniLM и проверка паритета")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_export = sub.add_parser('export', help="экспорт в ONNX + int8-квантизация")
+    p_export.add_argument('--out', default=model_inference.ONNX_ENCODER_DIR)
+    p_export.add_argument('--no-quantize', action='store_true')
+
+    p_check = sub.add_parser('check', help="сравнение с исходным энкодером на csv")
+    p_check.add_argument('--onnx-dir', default=model_inference.ONNX_ENCODER_DIR)
+    p_check.add_argument('--csv', default='data/raw/sample_vacancies.csv')
+    p_check.add_argument('--limit', type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_onnx(args.out, quantize=not args.no_quantize)
+    else:
+        parity_check(args.onnx_dir, args.csv, limit=args.limit)
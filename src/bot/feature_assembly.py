@@ -0,0 +1,105 @@
+import numpy as np
+from scipy import sparse
+
+# Раскладка колонок salary-модели (как в 06_salary_regressor.ipynb):
+#   num (NUM_FEATURES) | tfidf_desc | tfidf_title | ohe (area_id, salary_currency) | emb (MiniLM)
+BLOCKS = ('num', 'tfidf_desc', 'tfidf_title', 'ohe', 'emb')
+
+
+def _vectorizer_width(vectorizer):
+    return len(vectorizer.vocabulary_)
+
+
+def _ohe_width(ohe):
+    drop_idx = getattr(ohe, 'drop_idx_', None)
+    n_dropped = 0 if drop_idx is None else sum(d is not None for d in drop_idx)
+    return sum(len(c) for c in ohe.categories_) - n_dropped
+
+
+def model_n_features(model):
+    """Число признаков, на которых обучена модель (sklearn-обёртка LightGBM, Booster, sklearn)."""
+    n = getattr(model, 'n_features_in_', None)
+    if n is None and hasattr(model, 'num_feature'):
+        n = model.num_feature()
+    return None if n is None else int(n)
+
+
+class FeatureAssembler:
+    """
+    Сборка матрицы признаков salary-модели сразу в CSR, без sparse.hstack.
+
+    Плотные блоки (num, emb) и разреженные (TF-IDF, OHE) пишутся в заранее выделенные
+    массивы data/indices/indptr: сначала считается число ненулевых значений каждой строки
+    по всем блокам, затем каждый блок одним векторным присваиванием раскладывается по своим
+    позициям. Результат совпадает с sparse.hstack([...]).tocsr() (нули плотных блоков
+    не хранятся, индексы в строке отсортированы), но без промежуточных COO-матриц.
+    """
+
+    def __init__(self, widths: dict):
+        missing = [b for b in BLOCKS if b not in widths]
+        if missing:
+            raise ValueError(f"не заданы ширины блоков: {', '.join(missing)}")
+        self.widths = {b: int(widths[b]) for b in BLOCKS}
+        offsets = np.cumsum([0] + [self.widths[b] for b in BLOCKS])
+        self.offsets = dict(zip(BLOCKS, offsets[:-1].tolist()))
+        self.n_features = int(offsets[-1])
+
+    @classmethod
+    def from_artifacts(cls, num_features, tfidf_desc, tfidf_title, ohe, emb_dim):
+        """Раскладка по обученным преобразователям признаков."""
+        return cls({
+            'num': len(num_features),
+            'tfidf_desc': _vectorizer_width(tfidf_desc),
+            'tfidf_title': _vectorizer_width(tfidf_title),
+            'ohe': _ohe_width(ohe),
+            'emb': emb_dim,
+        })
+
+    def check_model(self, model):
+        """ValueError, если модель обучена на другом числе колонок, чем даёт эта раскладка."""
+        expected = model_n_features(model)
+        if expected is not None and expected != self.n_features:
+            raise ValueError(
+                f"раскладка признаков ({self.layout()}) даёт {self.n_features} колонок, "
+                f"а модель обучена на {expected}"
+            )
+
+    def layout(self) -> str:
+        return ", ".join(f"{b}={self.widths[b]}" for b in BLOCKS)
+
+    def assemble(self, num, tfidf_desc, tfidf_title, ohe, emb) -> sparse.csr_matrix:
+        blocks = dict(zip(BLOCKS, (num, tfidf_desc, tfidf_title, ohe, emb)))
+        n = num.shape[0]
+        parts = []  # (смещение колонок, строки, колонки, значения, ненулевых в строке, начало строки в блоке)
+        for name in BLOCKS:
+            block = blocks[name]
+            if block.shape != (n, self.widths[name]):
+                raise ValueError(f"блок {name}: форма {block.shape}, ожидалась {(n, self.widths[name])}")
+            if sparse.issparse(block):
+                block = block.tocsr()
+                if not block.has_sorted_indices:
+                    block = block.sorted_indices()
+                counts = np.diff(block.indptr)
+                rows = np.repeat(np.arange(n), counts)
+                parts.append((self.offsets[name], rows, block.indices, block.data, counts, block.indptr[:-1]))
+            else:
+                block = np.asarray(block)
+                rows, cols = np.nonzero(block)  # построчно, колонки по возрастанию
+                counts = np.bincount(rows, minlength=n)
+                starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+                parts.append((self.offsets[name], rows, cols, block[rows, cols], counts, starts))
+
+        row_nnz = sum(p[4] for p in parts)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(row_nnz, out=indptr[1:])
+        nnz = int(indptr[-1])
+        index_dtype = np.int32 if max(nnz, self.n_features) < np.iinfo(np.int32).max else np.int64
+        data = np.empty(nnz, dtype=np.float64)
+        indices = np.empty(nnz, dtype=index_dtype)
+        row_pos = indptr[:-1].copy()  # куда в строке писать следующий блок
+        for offset, rows, cols, values, counts, starts in parts:
+            pos = row_pos[rows] + (np.arange(len(rows)) - starts[rows])
+            data[pos] = values
+            indices[pos] = cols + offset
+            row_pos += counts
+        return sparse.csr_matrix((data, indices, indptr.astype(index_dtype)), shape=(n, self.n_features))
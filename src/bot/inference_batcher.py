@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+from executors import BusyError
+
+# Параметры микробатчинга (можно переопределить в .env)
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 32))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 10))
+
+
+class InferenceBatcher:
+    """
+    Собирает одновременные запросы к модели в пачки и считает их одним вызовом.
+
+    batch_fn — синхронная функция list[dict] -> list (например, predict_salary_batch).
+    Запросы копятся не дольше max_wait_ms миллисекунд или до max_batch_size штук,
+    затем вся пачка уходит в batch_fn, а результаты раздаются ожидающим хендлерам.
+    runner — корутина runner(fn, items), которая выполняет пачку вне event loop
+    (например, executors.run_inference); по умолчанию — стандартный пул потоков.
+    Если в работе уже max_pending запросов (в очереди и в считающихся пачках), submit
+    сразу бросает BusyError.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                 runner=None, max_pending=None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.runner = runner
+        self.max_pending = max_pending
+        self._queue = None
+        self._worker_task = None
+        self._batch_tasks = set()  # ссылки на задачи пачек, чтобы их не собрал сборщик мусора
+        self._in_flight = 0        # запросов от submit до получения результата
+
+    async def submit(self, item):
+        """Ставит один запрос в очередь и ждёт его результат."""
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self.max_pending is not None and self._in_flight >= self.max_pending:
+            raise BusyError(f"в батчере уже {self._in_flight} запросов")
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = loop.create_task(self._worker())
+        future = loop.create_future()
+        self._in_flight += 1
+        try:
+            await self._queue.put((item, future))
+            return await future
+        finally:
+            self._in_flight -= 1
+
+    async def _collect_batch(self):
+        """Ждёт первый запрос, затем добирает пачку до лимита размера или времени."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, items):
+        if self.runner is not None:
+            return await self.runner(self.batch_fn, items)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.batch_fn, items)
+
+    async def _run_batch(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            # Модель считаем вне event loop, чтобы не блокировать остальные чаты
+            results = await self._run(items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # Пачки выполняются параллельно — сколько позволяет пул воркеров
+            task = loop.create_task(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
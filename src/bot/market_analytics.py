@@ -1,8 +1,191 @@
-import duckdb
+import os
+import re
+import threading
 import pandas as pd
+import vector_store
+from db_pool import ConnectionPool, read_data_version
+from analytics_cache import QueryCache, cached
+from city_resolver import CityResolver
+from metrics import timed
 
-# Подключение к базе (укажи свой путь, если другой)
-con = duckdb.connect('/content/drive/MyDrive/hh-hr-bot/data/hh.duckdb_3000')
+# Путь к базе (укажи свой, если другой)
+DB_PATH = '/content/drive/MyDrive/hh-hr-bot/data/hh.duckdb_3000'
+
+# Запросы выполняются из пула потоков бота: каждый берёт свой курсор из пула (src/bot/db_pool.py),
+# поэтому запросы идут параллельно. Соединение (только чтение) открывается при первом запросе.
+pool = None
+CONNECT_TIME = None  # сколько заняло открытие базы, сек
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global pool
+    if pool is None:
+        with _pool_lock:
+            if pool is None:
+                pool = ConnectionPool(DB_PATH)
+    return pool
+
+def get_connection():
+    global CONNECT_TIME
+    con = get_pool().connection()
+    CONNECT_TIME = pool.connect_time
+    return con
+
+def _fetchdf(query, params=()):
+    with get_pool().acquire() as cur:
+        return cur.execute(query, params).fetchdf()
+
+def _fetchall(query, params=()):
+    with get_pool().acquire() as cur:
+        return cur.execute(query, params).fetchall()
+
+# Какие служебные таблицы есть в базе — для текущей версии данных: ETL может построить,
+# пересобрать или удалить таблицу, и после смены версии проверки делаются заново
+_existing_tables = {}
+
+def _known_tables():
+    version = data_version()
+    if _existing_tables.get('version') != version:
+        _existing_tables.clear()
+        _existing_tables['version'] = version
+    return _existing_tables
+
+def _table_exists(name):
+    """Есть ли в базе служебная таблица (куб, индексы — их строит ETL)."""
+    known = _known_tables()
+    if name not in known:
+        known[name] = _fetchall(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?", [name]
+        )[0][0] > 0
+    return known[name]
+
+# Версия токенизации куба (комментарий таблиц, см. src/etl/market_cube.py CUBE_FORMAT):
+# куб в другом формате не используем, пока ETL его не пересоберёт
+CUBE_FORMAT = 'stem-v1'
+
+def _cube_available(table='skill_market_agg'):
+    """Есть ли в базе таблица куба (собирается ETL-загрузчиком) в текущем формате токенов."""
+    known, key = _known_tables(), (table, CUBE_FORMAT)
+    if key not in known:
+        rows = _fetchall("SELECT comment FROM duckdb_tables() WHERE table_name = ?", [table])
+        known[key] = bool(rows) and rows[0][0] == CUBE_FORMAT
+    return known[key]
+
+def _trigrams(text):
+    return sorted({text[i:i + 3] for i in range(len(text) - 2)})
+
+def _like_filter(column, id_column, term, index_table, index_id):
+    """
+    Условие «AND LOWER(column) LIKE '%term%'» через триграммный индекс (src/etl/title_index.py):
+    сначала отбираем записи, у которых есть все триграммы term, и только их проверяем LIKE.
+    Если индекса нет или term короче 3 символов — обычный LIKE.
+    """
+    term = str(term).lower()
+    sql, params = "", []
+    grams = _trigrams(term)
+    if grams and _table_exists(index_table):
+        placeholders = ", ".join(["?"] * len(grams))
+        sql += (
+            f" AND CAST({id_column} AS BIGINT) IN ("
+            f"SELECT {index_id} FROM {index_table} WHERE trigram IN ({placeholders}) "
+            f"GROUP BY {index_id} HAVING COUNT(*) = ?)"
+        )
+        params += grams + [len(grams)]
+    sql += f" AND LOWER({column}) LIKE ?"
+    params.append(f"%{term}%")
+    return sql, params
+
+def _title_filter(term, alias='v'):
+    return _like_filter(f"{alias}.title", f"{alias}.id", term, 'title_trigram', 'vacancy_id')
+
+def find_vacancy_ids(term) -> list:
+    """id вакансий, в названии которых встречается term (без учёта регистра)."""
+    sql, params = _title_filter(term)
+    rows = _fetchall("SELECT CAST(v.id AS BIGINT) FROM vacancy v WHERE 1=1" + sql, params)
+    return [r[0] for r in rows]
+
+def _cube_title_filter(title):
+    """
+    Условие на title_token в кубе: без названия — строка '' (все вакансии),
+    с одним словом — точное совпадение основы слова, чтобы «водитель» находил и «водителя»,
+    а каждая вакансия учитывалась один раз. Для фраз из нескольких слов куб не подходит — None.
+    """
+    if not title:
+        return "title_token = ?", ''
+    tokens = _title_tokens(title)
+    if len(tokens) != 1:
+        return None
+    return "title_token = ?", tokens[0]
+
+# Окончания, которые отрезаются у токенов длиннее 4 символов (как TITLE_ENDINGS в src/etl/market_cube.py)
+_TITLE_ENDING_RE = re.compile(
+    r'(?:ами|ями|ого|его|ому|ему|ыми|ими|ов|ев|ей|ом|ем|ах|ях|ия|ие|ий|ый|ой|ая|яя|ое|ее|ые|а|я|ы|и|у|ю|е|о|ь|й)$'
+)
+
+def _title_tokens(text):
+    """Токены названия так же, как в src/etl/market_cube.py (нижний регистр, ё -> е, без окончаний)."""
+    text = str(text).lower().replace('ё', 'е')
+    tokens = (t for t in re.split(r'[^a-z0-9а-я+#]+', text) if t)
+    return list(dict.fromkeys(_TITLE_ENDING_RE.sub('', t) if len(t) > 4 else t for t in tokens))
+
+# Кэш ответов top_5_skills / top_vacancies / promotion_skills / compare_vacancy_to_market
+analytics_cache = QueryCache()
+
+def data_version():
+    """Версия данных, которую увеличивает ETL после загрузки (файл рядом с базой)."""
+    return read_data_version(DB_PATH)
+
+# Снимки vacancy_proc в Parquet (src/etl/raw_store.py export_proc): если задан каталог,
+# top_vacancies читает их через read_parquet вместо таблицы, открывая только файлы региона
+ANALYTICS_PARQUET_ROOT = os.getenv('ANALYTICS_PARQUET_ROOT')
+
+def _proc_parquet_source(area_id=None):
+    """
+    read_parquet(...) по текущему снимку vacancy_proc; с area_id — только каталог area_id=<id>.
+    None — Parquet не настроен, ещё не выгружен или в снимке нет такого региона.
+    """
+    if not ANALYTICS_PARQUET_ROOT:
+        return None
+    try:
+        with open(os.path.join(ANALYTICS_PARQUET_ROOT, 'CURRENT')) as f:
+            snapshot = os.path.join(ANALYTICS_PARQUET_ROOT, f.read().strip())
+    except FileNotFoundError:
+        return None
+    region = f"area_id={int(area_id)}" if area_id else "area_id=*"
+    if area_id and not os.path.isdir(os.path.join(snapshot, region)):
+        return None
+    pattern = os.path.join(snapshot, region, "*", "*.parquet").replace("'", "''")
+    return (f"read_parquet('{pattern}', hive_partitioning = true, "
+            f"hive_types = {{'area_id': BIGINT, 'month': VARCHAR}})")
+
+# Поиск похожих вакансий по эмбеддингам описаний (src/bot/vector_store.py)
+SIMILAR_K = int(os.getenv('SIMILAR_K', 50))                    # вакансий в «аналогичном рынке»
+SIMILAR_CANDIDATES = int(os.getenv('SIMILAR_CANDIDATES', 1000))  # кандидатов из индекса до фильтров
+
+@timed('analytics.similar_vacancy_ids')
+def similar_vacancy_ids(embedding, area_id=None, experience_hh=None, k=SIMILAR_K) -> list:
+    """
+    id k самых похожих по описанию вакансий (по убыванию близости) с учётом региона и опыта.
+    Пустой список — индекса эмбеддингов нет или ничего не нашлось.
+    """
+    index = vector_store.get_index()
+    if embedding is None or index is None or not len(index):
+        return []
+    ids, _ = index.search(embedding, k=SIMILAR_CANDIDATES)
+    if not len(ids):
+        return []
+    ids = [int(i) for i in ids]
+    query = "SELECT CAST(v.id AS BIGINT) FROM vacancy v WHERE CAST(v.id AS BIGINT) IN (SELECT unnest(?))"
+    params = [ids]
+    if area_id:
+        query += " AND v.area_id = ?"
+        params.append(area_id)
+    if experience_hh:
+        query += " AND v.experience_hh = ?"
+        params.append(experience_hh)
+    query += " ORDER BY list_position(?, CAST(v.id AS BIGINT)) LIMIT ?"
+    params += [ids, k]
+    return [r[0] for r in _fetchall(query, params)]
 
 # Карта грейдов для удобной фильтрации по “человеческим” грейдам
 grade_map = {
@@ -12,6 +195,8 @@ grade_map = {
     'Более 6 лет': 3         # lead
 }
 
+@timed('analytics.top_5_skills')
+@cached(analytics_cache, data_version, normalize=('title',))
 def top_5_skills(title=None, area_id=None, grade=None):
     """
     Возвращает топ-5 навыков по частоте и средней зарплате.
@@ -33,6 +218,32 @@ def top_5_skills(title=None, area_id=None, grade=None):
         else:
             raise ValueError("grade должен быть int (0-3) или одним из: " + ", ".join(grade_map.keys()))
 
+    # Быстрый путь: предагрегированный куб (src/etl/market_cube.py)
+    cube_filter = _cube_title_filter(title)
+    if cube_filter and _cube_available():
+        query = f"""
+        SELECT
+            skill_name,
+            CAST(SUM(proc_freq) AS BIGINT) AS frequency,
+            ROUND(SUM(salary_sum) / NULLIF(SUM(salary_cnt), 0), 0) AS mean_salary
+        FROM skill_market_agg
+        WHERE {cube_filter[0]}
+        """
+        params = [cube_filter[1]]
+        if area_id is not None:
+            query += " AND area_id = ?"
+            params.append(area_id)
+        if experience_hh is not None:
+            query += " AND experience_hh = ?"
+            params.append(experience_hh)
+        query += """
+        GROUP BY skill_name
+        HAVING SUM(proc_freq) > 0
+        ORDER BY frequency DESC, skill_name
+        LIMIT 5
+        """
+        return _fetchdf(query, params)
+
     query = """
     SELECT
         vs.skill_name,
@@ -45,8 +256,9 @@ def top_5_skills(title=None, area_id=None, grade=None):
     """
     params = []
     if title:
-        query += " AND LOWER(v.title) LIKE ?"
-        params.append(f"%{title.lower()}%")
+        title_sql, title_params = _title_filter(title)
+        query += title_sql
+        params += title_params
     if area_id is not None:
         query += " AND v.area_id = ?"
         params.append(area_id)
@@ -58,112 +270,155 @@ def top_5_skills(title=None, area_id=None, grade=None):
     ORDER BY frequency DESC
     LIMIT 5
     """
-    return con.execute(query, params).df()
+    return _fetchdf(query, params)
+
+# Навык -> ключ для сравнения: нижний регистр, ё -> е, схлопнутые пробелы («Английский  язык» = «английский язык»)
+SKILL_KEY_SQL = "regexp_replace(replace(lower(trim({col})), 'ё', 'е'), '\\s+', ' ', 'g')"
+SALARY_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+def _skill_key(skill):
+    return " ".join(str(skill).lower().replace('ё', 'е').split())
+
+def _proc_source(area_id=None):
+    """FROM для запросов по обработанным вакансиям (алиас vp): Parquet-снимок или таблицы базы."""
+    # В снимке vacancy_proc есть все колонки vacancy, поэтому join не нужен
+    parquet = _proc_parquet_source(area_id)
+    return f"{parquet} vp" if parquet else "vacancy v JOIN vacancy_proc vp ON v.id = vp.id"
 
-def compare_vacancy_to_market(vac: dict):
+@timed('analytics.compare_vacancy_to_market')
+@cached(analytics_cache, data_version)
+def compare_vacancy_to_market(vac: dict, top_n=10):
     """
     Сравнивает переданную вакансию (dict) с рынком аналогичных вакансий:
       - title (str)
       - area_id (int)
-      - experience_hh (str, например, 'От 1 года до 3 лет')
+      - experience_hh (str, например, 'От 1 года до 3 лет'; None — любой опыт)
       - skills (list или строка через ;)
       - salary_rub (int/float, опционально)
-    Возвращает текстовый отчёт с анализом зарплаты и навыков.
+      - embedding (np.ndarray, опционально) — эмбеддинг описания; если есть индекс эмбеддингов,
+        рынок — SIMILAR_K самых похожих по смыслу вакансий вместо совпадения по названию
+    Зарплатная статистика и top_n навыков рынка считаются одним запросом, навыки сравниваются
+    по нормализованным ключам. Возвращает словарь (текст собирает бот, format_market_report):
+      vacancies, with_salary — размер рынка; median, quantiles {доля: зарплата};
+      salary, salary_diff, salary_diff_pct, salary_percentile — если передана зарплата;
+      top_skills [(навык, доля вакансий)]; your_skills, common, unique, missing.
     """
     title = vac['title']
     area_id = vac['area_id']
     experience_hh = vac['experience_hh']
     skills = vac['skills']
     salary = vac.get('salary_rub', None)
+    if isinstance(skills, str):
+        skills = skills.split(';')
+    your_skills = list(dict.fromkeys(s.strip() for s in skills if s and s.strip()))
 
-    # === 1. Формируем "аналогичный рынок" вакансий ===
-    query = """
-    SELECT v.id, v.title, v.area_id, v.experience_hh, vp.salary_rub
-    FROM vacancy v
-    JOIN vacancy_proc vp ON v.id = vp.id
-    WHERE v.area_id = ?
-      AND v.experience_hh = ?
-      AND LOWER(v.title) LIKE ?
-      AND vp.salary_rub IS NOT NULL
-    """
-    params = [area_id, experience_hh, f"%{title.lower()}%"]
-    df_market = con.execute(query, params).fetchdf()
-
-    if df_market.empty:
-        return "Нет сопоставимых вакансий для сравнения."
-
-    # === 2. Медианная зарплата по рынку ===
-    market_salary = df_market['salary_rub'].median()
-    result = ""
-    if salary:
-        diff = salary - market_salary
-        perc = round(100 * diff / market_salary, 1)
-        result += (
-            f"Ваша вакансия: {title} ({experience_hh}, регион {area_id})\n"
-            f"Зарплата: {int(salary)} руб.\n"
-            f"Медиана рынка: {int(market_salary)} руб.\n"
-            f"Отклонение: {'+' if diff > 0 else ''}{int(diff)} руб. "
-            f"({'+' if perc > 0 else ''}{perc}%)\n"
-        )
+    # === 1. "Аналогичный рынок": похожие по эмбеддингу или по названию, региону и опыту ===
+    # Рынок — все подходящие вакансии из vacancy (и ещё не предобработанные), зарплаты —
+    # из vacancy_proc только по ним
+    similar_ids = similar_vacancy_ids(vac.get('embedding'), area_id, experience_hh)
+    if similar_ids:
+        market_sql = " AND CAST(v.id AS BIGINT) IN (SELECT unnest(?))"
+        params = [similar_ids]
+        source = _proc_source()
     else:
-        result += (
-            f"Ваша вакансия: {title} ({experience_hh}, регион {area_id})\n"
-            f"Медиана зарплаты по рынку: {int(market_salary)} руб.\n"
-        )
+        market_sql, params = _title_filter(title) if title else ("", [])
+        if area_id:
+            market_sql += " AND v.area_id = ?"
+            params.append(area_id)
+        if experience_hh is not None:
+            market_sql += " AND v.experience_hh = ?"
+            params.append(experience_hh)
+        source = _proc_source(area_id)
 
-    # === 3. Анализ навыков ===
-    # BinderError fix: явно приводим id к BIGINT
-    q_skills = """
-    SELECT vs.skill_name
-    FROM vacancy_skill vs
-    WHERE vs.vacancy_id IN (
-        SELECT CAST(v.id AS BIGINT)
+    # === 2. Один проход: рынок материализуется, по нему — квантили зарплат и частоты навыков ===
+    skill_key = SKILL_KEY_SQL.format(col='vs.skill_name')
+    query = f"""
+    WITH market AS MATERIALIZED (
+        SELECT CAST(v.id AS BIGINT) AS id
         FROM vacancy v
-        WHERE v.area_id = ?
-          AND v.experience_hh = ?
-          AND LOWER(v.title) LIKE ?
+        WHERE 1=1{market_sql}
+    ),
+    salaries AS MATERIALIZED (
+        SELECT vp.salary_rub
+        FROM {source}
+        WHERE CAST(vp.id AS BIGINT) IN (SELECT id FROM market) AND vp.salary_rub IS NOT NULL
+    ),
+    skill_freq AS (
+        SELECT {skill_key} AS skill_key, min(vs.skill_name) AS skill_name, COUNT(DISTINCT vs.vacancy_id) AS freq
+        FROM vacancy_skill vs
+        JOIN market m ON vs.vacancy_id = m.id
+        GROUP BY 1
     )
+    SELECT
+        (SELECT COUNT(*) FROM market) AS vacancies,
+        COUNT(*) AS with_salary,
+        quantile_cont(salary_rub, ?) AS quantiles,
+        COUNT(*) FILTER (WHERE salary_rub < ?) AS below,
+        (SELECT list((skill_key, skill_name, freq) ORDER BY freq DESC, skill_key)
+         FROM (SELECT * FROM skill_freq ORDER BY freq DESC, skill_key LIMIT ?)) AS top_skills
+    FROM salaries
     """
-    skills_df = con.execute(q_skills, params).fetchdf()
-
-    if not skills_df.empty:
-        top_skills = (
-            skills_df['skill_name']
-            .value_counts()
-            .head(10)
-            .index
-            .tolist()
-        )
-        if isinstance(skills, str):
-            your_skills = [s.strip() for s in skills.split(';') if s.strip()]
-        else:
-            your_skills = list(skills)
-        common = [s for s in your_skills if s in top_skills]
-        unique = [s for s in your_skills if s not in top_skills]
-        missing = [s for s in top_skills if s not in your_skills]
-        result += (
-            f"\nВаши навыки: {', '.join(your_skills)}\n"
-            f"Топ-10 популярных навыков на рынке: {', '.join(top_skills)}\n"
-        )
-        if unique:
-            result += f"Уникальные для вас навыки (редко встречаются): {', '.join(unique)}\n"
-        if missing:
-            result += f"Рекомендуется добавить популярные навыки: {', '.join(missing)}\n"
-    return result
+    params += [list(SALARY_QUANTILES), salary or 0, top_n]
+    vacancies, with_salary, quantiles, below, top_rows = _fetchall(query, params)[0]
+
+    report = {
+        'title': title, 'area_id': area_id, 'experience_hh': experience_hh,
+        'vacancies': vacancies, 'with_salary': with_salary,
+        'median': None, 'quantiles': {}, 'salary': salary,
+        'salary_diff': None, 'salary_diff_pct': None, 'salary_percentile': None,
+        'top_skills': [], 'your_skills': your_skills, 'common': [], 'unique': [], 'missing': [],
+    }
+    if with_salary:
+        report['quantiles'] = {q: float(v) for q, v in zip(SALARY_QUANTILES, quantiles)}
+        report['median'] = report['quantiles'][0.5]
+        if salary:
+            diff = salary - report['median']
+            report['salary_diff'] = diff
+            report['salary_diff_pct'] = round(100 * diff / report['median'], 1)
+            report['salary_percentile'] = round(100 * below / with_salary)
+
+    # === 3. Навыки: множества нормализованных ключей ===
+    top_rows = top_rows or []
+    report['top_skills'] = [(name, round(freq / vacancies, 3)) for _, name, freq in top_rows]
+    top_keys = {key for key, _, _ in top_rows}
+    your_keys = {_skill_key(s) for s in your_skills}
+    report['common'] = [s for s in your_skills if _skill_key(s) in top_keys]
+    report['unique'] = [s for s in your_skills if _skill_key(s) not in top_keys]
+    report['missing'] = [name for key, name, _ in top_rows if key not in your_keys]
+    return report
 
 #получение города
+def _load_cities():
+    """Справочник cities с числом вакансий в каждом area_id (им разрешаются неоднозначные названия)."""
+    if not _table_exists('cities'):
+        return []
+    return _fetchall("""
+        SELECT c.area_id, c.area_name, c.parent_area, COALESCE(v.n, 0)
+        FROM cities c
+        LEFT JOIN (SELECT CAST(area_id AS BIGINT) AS area_id, COUNT(*) AS n FROM vacancy GROUP BY 1) v
+          ON v.area_id = c.area_id
+    """)
+
+def _cities_signature():
+    """Меняется при любом изменении cities (и после загрузки вакансий — через версию данных)."""
+    if not _table_exists('cities'):
+        return None
+    rows = _fetchall("SELECT COUNT(*), SUM(hash(area_id, area_name, parent_area)) FROM cities")
+    return data_version(), rows[0]
+
+city_resolver = CityResolver(_load_cities, _cities_signature)
+
+@timed('analytics.get_area_id_by_city')
 def get_area_id_by_city(city_name):
     """
     Возвращает area_id по названию города (или None, если не найдено).
-    Поиск регистронезависимый и по подстроке.
+    Поиск в памяти (src/bot/city_resolver.py): без учёта регистра и ё, понимает «СПб», «Мск»,
+    подстроку и опечатки.
     """
-    query = "SELECT area_id FROM cities WHERE LOWER(area_name) LIKE ? LIMIT 1"
-    result = con.execute(query, [f"%{city_name.lower()}%"]).fetchdf()
-    if not result.empty:
-        return int(result.iloc[0]['area_id'])
-    else:
-        return None
+    return city_resolver.resolve(city_name)
 
+@timed('analytics.top_vacancies')
+@cached(analytics_cache, data_version, normalize=('area_name', 'keyword'))
 def top_vacancies(area_name=None, keyword=None, grade=None, limit=5):
     """
     Возвращает топ-вакансий по зарплате с учётом фильтров.
@@ -197,21 +452,21 @@ def top_vacancies(area_name=None, keyword=None, grade=None, limit=5):
         else:
             experience_hh = grade  # Вдруг ввели текст напрямую
 
-    query = """
-    SELECT v.title, v.employer, v.area_id, v.experience_hh, vp.salary_rub
-    FROM vacancy v
-    JOIN vacancy_proc vp ON v.id = vp.id
+    query = f"""
+    SELECT vp.title, vp.employer, vp.area_id, vp.experience_hh, vp.salary_rub
+    FROM {_proc_source(area_id)}
     WHERE vp.salary_rub IS NOT NULL
     """
     params = []
     if area_id:
-        query += " AND v.area_id = ?"
+        query += " AND vp.area_id = ?"
         params.append(area_id)
     if keyword:
-        query += " AND LOWER(v.title) LIKE ?"
-        params.append(f"%{keyword.lower()}%")
+        title_sql, title_params = _title_filter(keyword, alias='vp')
+        query += title_sql
+        params += title_params
     if experience_hh:
-        query += " AND v.experience_hh = ?"
+        query += " AND vp.experience_hh = ?"
         params.append(experience_hh)
     query += """
     ORDER BY vp.salary_rub DESC
@@ -219,53 +474,131 @@ def top_vacancies(area_name=None, keyword=None, grade=None, limit=5):
     """
     params.append(limit)
 
-    return con.execute(query, params).fetchdf()
+    return _fetchdf(query, params)
+
 
+# Карьерная лестница: грейд бота -> опыт в hh (коды из grade_map)
+GRADE_LADDER = ['junior', 'middle', 'senior', 'lead']
+_EXPERIENCE_BY_CODE = {code: experience for experience, code in grade_map.items()}
 
+def _grade_label(grade):
+    """'junior' / 0 / 'Нет опыта' -> 'junior'; неизвестный грейд -> None."""
+    if isinstance(grade, str):
+        grade = grade.strip()
+        if grade.lower() in GRADE_LADDER:
+            return grade.lower()
+        grade = grade_map.get(grade)
+    if isinstance(grade, int) and 0 <= grade < len(GRADE_LADDER):
+        return GRADE_LADDER[grade]
+    return None
+
+def _grade_columns(value_sql, grade_column):
+    """freq_junior ... freq_lead условной агрегацией value_sql по грейду (и параметры для них)."""
+    columns = ", ".join(
+        f"CAST(COALESCE({value_sql} FILTER (WHERE {grade_column} = ?), 0) AS BIGINT) AS freq_{label}"
+        for label in GRADE_LADDER
+    )
+    return columns, [_EXPERIENCE_BY_CODE[code] for code in range(len(GRADE_LADDER))]
+
+@timed('analytics.grade_skill_matrix')
+@cached(analytics_cache, data_version, normalize=('title',))
+def grade_skill_matrix(title=None, area_id=None):
+    """
+    Частоты навыков сразу по всем грейдам одним запросом: DataFrame с индексом skill_name
+    и колонками freq_junior ... freq_lead (вакансий грейда с навыком). Число вакансий каждого
+    грейда (знаменатель для долей) — в attrs['vacancies'].
+    """
+    experiences = [_EXPERIENCE_BY_CODE[code] for code in range(len(GRADE_LADDER))]
+    in_grades = ", ".join(["?"] * len(experiences))
+    cube_filter = _cube_title_filter(title)
+    if cube_filter and _cube_available() and _cube_available('vacancy_market_agg'):
+        # Частоты — из куба навыков, число вакансий — из vacancy_market_agg (src/etl/market_cube.py);
+        # токен сравнивается точно, поэтому каждая вакансия попадает в обе суммы один раз
+        area_sql, area_params = (" AND area_id = ?", [area_id]) if area_id else ("", [])
+        skill_cols, skill_params = _grade_columns("SUM(freq)", "experience_hh")
+        total_cols, total_params = _grade_columns("SUM(vacancies)", "experience_hh")
+        query = f"""
+        SELECT NULL AS skill_name, {total_cols}
+        FROM vacancy_market_agg
+        WHERE {cube_filter[0]} AND experience_hh IN ({in_grades}){area_sql}
+        UNION ALL
+        SELECT skill_name, {skill_cols}
+        FROM skill_market_agg
+        WHERE {cube_filter[0]} AND experience_hh IN ({in_grades}){area_sql}
+        GROUP BY skill_name
+        """
+        params = (total_params + [cube_filter[1]] + experiences + area_params
+                  + skill_params + [cube_filter[1]] + experiences + area_params)
+    else:
+        filter_sql, filter_params = "", []
+        if title:
+            filter_sql, filter_params = _title_filter(title)
+        if area_id:
+            filter_sql += " AND v.area_id = ?"
+            filter_params.append(area_id)
+        cols, col_params = _grade_columns("COUNT(*)", "fv.experience_hh")
+        query = f"""
+        WITH fv AS (
+            SELECT v.id, v.experience_hh
+            FROM vacancy v
+            WHERE v.experience_hh IN ({in_grades}){filter_sql}
+        )
+        SELECT NULL AS skill_name, {cols} FROM fv
+        UNION ALL
+        SELECT vs.skill_name, {cols}
+        FROM vacancy_skill vs
+        JOIN fv ON vs.vacancy_id = fv.id
+        GROUP BY vs.skill_name
+        """
+        params = experiences + filter_params + col_params + col_params
+
+    df = _fetchdf(query, params)
+    totals = df[df['skill_name'].isna()]
+    matrix = df[df['skill_name'].notna()].set_index('skill_name').sort_index()
+    matrix.attrs['vacancies'] = {
+        label: int(totals[f'freq_{label}'].iloc[0]) if not totals.empty else 0 for label in GRADE_LADDER
+    }
+    return matrix
+
+def _skill_deltas(matrix, grade_from, grade_to, top_n):
+    """Навыки, доля которых у grade_to выше, чем у grade_from: [(навык, прирост доли, доля from, доля to)]."""
+    vacancies = matrix.attrs['vacancies']
+    if matrix.empty or not vacancies[grade_from] or not vacancies[grade_to]:
+        return []
+    share_from = matrix[f'freq_{grade_from}'] / vacancies[grade_from]
+    share_to = matrix[f'freq_{grade_to}'] / vacancies[grade_to]
+    deltas = pd.DataFrame({'delta': share_to - share_from, 'share_from': share_from, 'share_to': share_to})
+    deltas = deltas[deltas['delta'] > 0].sort_values(['delta', 'share_to'], ascending=False, kind='stable')
+    return [
+        (skill, round(float(delta), 4), round(float(s_from), 4), round(float(s_to), 4))
+        for skill, delta, s_from, s_to in deltas.head(top_n).itertuples()
+    ]
+
+@timed('analytics.promotion_skills')
+@cached(analytics_cache, data_version, normalize=('title',))
 def promotion_skills(title=None, area_id=None, grade_from=None, grade_to=None, top_n=7):
     """
-    Возвращает топ-навыки, которые чаще встречаются у grade_to, чем у grade_from,
-    то есть навыки для карьерного роста.
+    Возвращает топ-навыки, которые у grade_to встречаются чаще, чем у grade_from,
+    то есть навыки для карьерного роста. Сравниваются доли вакансий грейда с навыком,
+    так что разное число вакансий junior и senior не искажает результат.
+    Грейды — 'junior'..'lead', 0-3 или опыт hh ('Нет опыта', ...), пара любая (не только соседние).
+    Выход: [(навык, прирост доли, доля у grade_from, доля у grade_to)].
     """
+    grade_from, grade_to = _grade_label(grade_from), _grade_label(grade_to)
     if grade_from is None or grade_to is None:
         return []
+    return _skill_deltas(grade_skill_matrix(title, area_id), grade_from, grade_to, top_n)
 
-    grade_map = {'junior': 0, 'middle': 1, 'senior': 2, 'lead': 3}
-    grades = {v: k for k, v in grade_map.items()}
-    from_grade = grades.get(grade_from, grade_from)
-    to_grade = grades.get(grade_to, grade_to)
-
-    query = """
-    SELECT vs.skill_name, COUNT(*) as freq
-    FROM vacancy_skill vs
-    JOIN vacancy v ON vs.vacancy_id = v.id
-    WHERE 1=1
+@timed('analytics.promotion_ladder')
+@cached(analytics_cache, data_version, normalize=('title',))
+def promotion_ladder(title=None, area_id=None, top_n=7):
     """
-    params = []
-    if title:
-        query += " AND LOWER(v.title) LIKE ?"
-        params.append(f"%{title.lower()}%")
-    if area_id:
-        query += " AND v.area_id = ?"
-        params.append(area_id)
-
-    query_from = query + " AND v.experience_hh = ? GROUP BY vs.skill_name"
-    params_from = params + [from_grade]
-    df_from = con.execute(query_from, params_from).fetchdf()
-
-    query_to = query + " AND v.experience_hh = ? GROUP BY vs.skill_name"
-    params_to = params + [to_grade]
-    df_to = con.execute(query_to, params_to).fetchdf()
-
-    skills_from = df_from.set_index('skill_name')['freq'] if not df_from.empty else pd.Series(dtype=int)
-    skills_to = df_to.set_index('skill_name')['freq'] if not df_to.empty else pd.Series(dtype=int)
-
-    skill_delta = []
-    for skill in skills_to.index:
-        freq_to = skills_to[skill]
-        freq_from = skills_from[skill] if skill in skills_from else 0
-        diff = freq_to - freq_from
-        if diff > 0:
-            skill_delta.append((skill, diff, freq_to))
-    skill_delta.sort(key=lambda x: (-x[1], -x[2]))
-    return skill_delta[:top_n]
+    Вся лестница junior -> middle -> senior -> lead по одной матрице частот:
+    {('junior', 'middle'): [...], ('middle', 'senior'): [...], ('senior', 'lead'): [...]}
+    в формате promotion_skills.
+    """
+    matrix = grade_skill_matrix(title, area_id)
+    return {
+        (grade_from, grade_to): _skill_deltas(matrix, grade_from, grade_to, top_n)
+        for grade_from, grade_to in zip(GRADE_LADDER, GRADE_LADDER[1:])
+    }
@@ -0,0 +1,166 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# Лёгкие метрики задержек: по каждому этапу (stage) — число вызовов, сумма, гистограмма
+# с фиксированными границами (для Prometheus) и последние METRICS_WINDOW замеров для p50/p95/p99.
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', 2048))
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # >0 — отдавать /metrics по HTTP на этом порту
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_NAME = 'hh_bot_stage_seconds'
+
+
+class Histogram:
+    def __init__(self, window=METRICS_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        self.recent.append(seconds)
+
+    def summary(self) -> dict:
+        p50, p95, p99 = np.percentile(self.recent, [50, 95, 99]) if self.recent else (0.0, 0.0, 0.0)
+        return {"count": self.count, "sum": self.sum, "p50": p50, "p95": p95, "p99": p99}
+
+
+_histograms = {}
+_lock = threading.Lock()
+# В воркерах пула инференса замеры ещё и копятся здесь, чтобы вернуть их в главный процесс
+_captured = threading.local()
+
+
+def observe(stage, seconds):
+    with _lock:
+        hist = _histograms.get(stage)
+        if hist is None:
+            hist = _histograms[stage] = Histogram()
+        hist.observe(seconds)
+    samples = getattr(_captured, 'samples', None)
+    if samples is not None:
+        samples.append((stage, seconds))
+
+
+def merge(samples):
+    """Добавляет замеры, пришедшие из другого процесса (см. capture)."""
+    for stage, seconds in samples:
+        observe(stage, seconds)
+
+
+def capture(fn, *args, **kwargs):
+    """Вызывает fn и возвращает (результат, замеры за время вызова) — для задач в пуле процессов."""
+    _captured.samples = []
+    try:
+        return fn(*args, **kwargs), _captured.samples
+    finally:
+        _captured.samples = None
+
+
+@contextmanager
+def timer(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - t0)
+
+
+def timed(stage):
+    """Декоратор-таймер для обычных и async-функций."""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    """stage -> {count, sum, p50, p95, p99} (секунды)."""
+    with _lock:
+        return {stage: hist.summary() for stage, hist in sorted(_histograms.items())}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def format_stats(stats=None) -> str:
+    """Таблица для /stats: вызовы и p50/p95/p99 в миллисекундах."""
+    stats = snapshot() if stats is None else stats
+    if not stats:
+        return "Замеров пока нет."
+    lines = ["этап: вызовов | p50 / p95 / p99, мс"]
+    for stage, s in stats.items():
+        lines.append(
+            f"{stage}: {s['count']} | {1000 * s['p50']:.1f} / {1000 * s['p95']:.1f} / {1000 * s['p99']:.1f}"
+        )
+    return "\n".join(lines)
+
+
+def prometheus_text() -> str:
+    """Все гистограммы в текстовом формате Prometheus."""
+    lines = [
+        f"# HELP {METRIC_NAME} Время выполнения этапов бота, сек.",
+        f"# TYPE {METRIC_NAME} histogram",
+    ]
+    with _lock:
+        items = [(stage, list(h.buckets), h.count, h.sum) for stage, h in sorted(_histograms.items())]
+    for stage, buckets, count, total in items:
+        cumulative = 0
+        for bound, n in zip(BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+        lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT):
+    """Отдаёт /metrics для Prometheus в фоновом потоке. port=0 — не запускать."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -1,12 +1,24 @@
-
 import os
+import re
+import time
+import threading
 import joblib
 import pickle
 import numpy as np
-from scipy import sparse
-from sentence_transformers import SentenceTransformer
+import pandas as pd
+from multiprocessing import util as mp_util
+from embedding_cache import EmbeddingCache, text_key
+from artifact_bundle import ArtifactBundle, ONNX_SUBDIR
+from feature_assembly import FeatureAssembler
+from onnx_encoder import OnnxEncoder, find_onnx_model
+from tree_predictor import compile_model, verify_compiled
+from metrics import timer
 
 MODEL_DIR = '/content/drive/MyDrive/hh-hr-bot/models'
+# Бандл артефактов (artifact_bundle.py build): если задан, артефакты из него имеют приоритет над MODEL_DIR
+MODEL_BUNDLE_DIR = os.getenv('MODEL_BUNDLE_DIR')
+MODEL_BUNDLE_VERIFY = os.getenv('MODEL_BUNDLE_VERIFY', '1') == '1'  # sha256 всех файлов при открытии
+MINILM_NAME = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
 
 SALARY_MODEL_PATH = os.path.join(MODEL_DIR, 'salary_lgbm_model.pkl')
 GRADE_MODEL_PATH = os.path.join(MODEL_DIR, 'grade_rf_model.joblib')
@@ -14,60 +26,322 @@ TFIDF_DESC_PATH = os.path.join(MODEL_DIR, 'tfidf_desc.pkl')
 TFIDF_TITLE_PATH = os.path.join(MODEL_DIR, 'tfidf_title.pkl')
 OHE_CATS_PATH = os.path.join(MODEL_DIR, 'ohe_cats.pkl')
 
-salary_model = joblib.load(SALARY_MODEL_PATH)
-grade_model = joblib.load(GRADE_MODEL_PATH)
+# Бэкенд энкодера: torch (SentenceTransformer), onnx (экспорт из export_onnx.py)
+# или auto — onnx, если экспортированная модель есть в ONNX_ENCODER_DIR
+ENCODER_BACKEND = os.getenv('ENCODER_BACKEND', 'auto')
+ONNX_ENCODER_DIR = os.getenv('ONNX_ENCODER_DIR', os.path.join(MODEL_BUNDLE_DIR or MODEL_DIR, ONNX_SUBDIR))
+
+# Предиктор деревьев: native — predict исходных моделей, compiled — быстрые предикторы
+# из tree_predictor.py, auto — compiled, если модель поддерживается и прогнозы совпали
+TREE_BACKEND = os.getenv('TREE_BACKEND', 'auto')
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def resolve_encoder_backend() -> str:
+    if ENCODER_BACKEND == 'auto':
+        return 'onnx' if find_onnx_model(ONNX_ENCODER_DIR) else 'torch'
+    if ENCODER_BACKEND not in ('torch', 'onnx'):
+        raise ValueError("ENCODER_BACKEND должен быть auto, torch или onnx")
+    return ENCODER_BACKEND
+
+def with_tree_backend(model):
+    """ Модель с учётом TREE_BACKEND: быстрый предиктор проверяется на совпадение прогнозов с исходной """
+    if TREE_BACKEND == 'native':
+        return model
+    if TREE_BACKEND not in ('auto', 'compiled'):
+        raise ValueError("TREE_BACKEND должен быть auto, native или compiled")
+    try:
+        compiled = compile_model(model)
+        verify_compiled(model, compiled)
+    except (NotImplementedError, ValueError) as e:
+        if TREE_BACKEND == 'compiled':
+            raise
+        print(f"Быстрый предиктор для {type(model).__name__} не используется: {e}")
+        return model
+    return compiled
+
+_bundle = None
+_bundle_lock = threading.Lock()
+
+def get_bundle():
+    """ Бандл из MODEL_BUNDLE_DIR (None — бандл не задан, всё грузится из MODEL_DIR) """
+    global _bundle
+    if MODEL_BUNDLE_DIR and _bundle is None:
+        with _bundle_lock:
+            if _bundle is None:
+                _bundle = ArtifactBundle(MODEL_BUNDLE_DIR, verify=MODEL_BUNDLE_VERIFY)
+    return _bundle
+
+def _bundled(name, load_legacy):
+    """ Загрузчик артефакта: из бандла, если он есть и содержит name, иначе прежним способом """
+    def load():
+        bundle = get_bundle()
+        if bundle is not None and bundle.has(name):
+            # быстрые предикторы деревьев сверены с исходными моделями при сборке бандла
+            return bundle.load(name, native=TREE_BACKEND == 'native')
+        return load_legacy()
+    return load
+
+def _load_minilm():
+    if resolve_encoder_backend() == 'onnx':
+        return OnnxEncoder(ONNX_ENCODER_DIR)
+    # torch/sentence-transformers импортируем только при первой загрузке модели
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MINILM_NAME)
+
+# Артефакты грузятся лениво, при первом обращении (или в warmup)
+_LOADERS = {
+    'salary_model': _bundled('salary_model', lambda: with_tree_backend(joblib.load(SALARY_MODEL_PATH))),
+    'grade_model': _bundled('grade_model', lambda: with_tree_backend(joblib.load(GRADE_MODEL_PATH))),
+    'tfidf_desc': _bundled('tfidf_desc', lambda: _load_pickle(TFIDF_DESC_PATH)),
+    'tfidf_title': _bundled('tfidf_title', lambda: _load_pickle(TFIDF_TITLE_PATH)),
+    'ohe': _bundled('ohe', lambda: _load_pickle(OHE_CATS_PATH)),
+    'minilm_model': _load_minilm,
+}
+_artifacts = {}
+_locks = {name: threading.Lock() for name in _LOADERS}
+LOAD_TIMINGS = {}  # имя артефакта -> время загрузки, сек
+
+def get_artifact(name):
+    """Возвращает артефакт модели, загружая его при первом обращении."""
+    obj = _artifacts.get(name)
+    if obj is not None:
+        return obj
+    with _locks[name]:
+        if name not in _artifacts:
+            t0 = time.perf_counter()
+            _artifacts[name] = _LOADERS[name]()
+            LOAD_TIMINGS[name] = time.perf_counter() - t0
+    return _artifacts[name]
+
+def __getattr__(name):
+    # Совместимость: model_inference.salary_model и т.п. по-прежнему работают
+    if name in _LOADERS:
+        return get_artifact(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warmup(names=None) -> dict:
+    """Заранее загружает артефакты (по умолчанию все) и возвращает время загрузки каждого."""
+    for name in names or _LOADERS:
+        get_artifact(name)
+    return dict(LOAD_TIMINGS)
+
+def startup_report() -> str:
+    """Текстовый отчёт о времени загрузки артефактов."""
+    lines = [f"  {name}: {LOAD_TIMINGS[name]:.2f} c" for name in _LOADERS if name in LOAD_TIMINGS]
+    not_loaded = [name for name in _LOADERS if name not in LOAD_TIMINGS]
+    if not_loaded:
+        lines.append(f"  ещё не загружены: {', '.join(not_loaded)}")
+    if _bundle is not None:
+        lines.append(f"  бандл: {_bundle.version} ({MODEL_BUNDLE_DIR})")
+    total = sum(LOAD_TIMINGS.values())
+    return f"Загрузка моделей (pid {os.getpid()}), всего {total:.2f} c:\n" + "\n".join(lines)
+
+# Общий кэш эмбеддингов описаний (MiniLM — самый дорогой шаг на сообщение)
+EMB_CACHE_SIZE = int(os.getenv('EMB_CACHE_SIZE', 10000))
+EMB_CACHE_MAX_MB = int(os.getenv('EMB_CACHE_MAX_MB', 64))
+EMB_CACHE_PATH = os.getenv('EMB_CACHE_PATH')  # если задан — кэш переживает рестарт
+EMB_CACHE_SAVE_INTERVAL = float(os.getenv('EMB_CACHE_SAVE_INTERVAL', 300))  # сек между сохранениями
+
+embedding_cache = EmbeddingCache(max_items=EMB_CACHE_SIZE, max_bytes=EMB_CACHE_MAX_MB * 1024 * 1024)
+_cache_save_pid = None
+_cache_saved_at = time.monotonic()
+
+def register_cache_save():
+    """
+    Сохранение кэша эмбеддингов при выходе текущего процесса. Вызывается в каждом процессе:
+    воркер пула, созданный через fork, наследует модуль, но multiprocessing при старте
+    процесса очищает унаследованные Finalize — поэтому executors вызывает это в initializer.
+    """
+    global _cache_save_pid
+    if EMB_CACHE_PATH and _cache_save_pid != os.getpid():
+        _cache_save_pid = os.getpid()
+        mp_util.Finalize(embedding_cache, embedding_cache.save, args=(EMB_CACHE_PATH,), exitpriority=10)
+
+def _save_cache_periodically():
+    # Воркер могут убить без нормального выхода — новые эмбеддинги сбрасываются и по времени
+    global _cache_saved_at
+    if EMB_CACHE_PATH and embedding_cache.dirty and time.monotonic() - _cache_saved_at >= EMB_CACHE_SAVE_INTERVAL:
+        _cache_saved_at = time.monotonic()
+        embedding_cache.save(EMB_CACHE_PATH)
 
-with open(TFIDF_DESC_PATH, 'rb') as f:
-    tfidf_desc = pickle.load(f)
-with open(TFIDF_TITLE_PATH, 'rb') as f:
-    tfidf_title = pickle.load(f)
-with open(OHE_CATS_PATH, 'rb') as f:
-    ohe = pickle.load(f)
+if EMB_CACHE_PATH:
+    embedding_cache.load(EMB_CACHE_PATH)
+    register_cache_save()
 
-minilm_model = SentenceTransformer('sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2')
+def encode_descriptions(descs: list):
+    """ Эмбеддинги описаний (n, 384) с кэшем: MiniLM считается только для новых текстов """
+    # Эмбеддинги torch и onnx немного различаются — держим их под разными ключами
+    backend = resolve_encoder_backend()
+    keys = [text_key(desc, namespace=backend) for desc in descs]
+    vecs = [embedding_cache.get(key) for key in keys]
+    missing = {}
+    for desc, key, vec in zip(descs, keys, vecs):
+        if vec is None and key not in missing:
+            missing[key] = desc
+    if missing:
+        with timer('model.encode'):
+            new_vecs = get_artifact('minilm_model').encode(list(missing.values()))
+        computed = dict(zip(missing.keys(), new_vecs))
+        for key, vec in computed.items():
+            embedding_cache.put(key, vec)
+        _save_cache_periodically()
+        vecs = [vec if vec is not None else computed[key] for key, vec in zip(keys, vecs)]
+    return np.vstack(vecs).astype(np.float32).reshape(len(descs), -1)
+
+NUM_FEATURES = [
+    'area_id', 'desc_len', 'desc_words', 'title_len', 'num_skills',
+    'exp_junior', 'exp_middle', 'exp_senior', 'exp_lead'
+]
+
+# Опыт из hh.ru -> индикаторы грейда (как в ноутбуках с обучением)
+EXPERIENCE_TO_GRADE = {
+    'Нет опыта': 'junior',
+    'От 1 года до 3 лет': 'middle',
+    'От 3 до 6 лет': 'senior',
+    'Более 6 лет': 'lead',
+}
+
+def vacancy_to_features(row: dict) -> dict:
+    """ Словарь признаков из сырой строки вакансии (vacancy / csv из fetch_hh) """
+    description = re.sub(r'<.*?>', '', str(row.get('description') or ''))
+    title = str(row.get('title') or '')
+    skills_raw = row.get('skills_raw')
+    skills = [s for s in str(skills_raw).split(',') if s.strip()] if isinstance(skills_raw, str) else []
+    grade = EXPERIENCE_TO_GRADE.get(row.get('experience_hh'))
+    currency = row.get('salary_currency')
+    return {
+        'area_id': int(row.get('area_id') or 0),
+        'desc_len': len(description),
+        'desc_words': len(description.split()),
+        'title_len': len(title),
+        'num_skills': len(skills),
+        'exp_junior': int(grade == 'junior'),
+        'exp_middle': int(grade == 'middle'),
+        'exp_senior': int(grade == 'senior'),
+        'exp_lead': int(grade == 'lead'),
+        'description': description,
+        'title': title.strip().lower(),
+        'salary_currency': currency if isinstance(currency, str) and currency else "RUR",
+    }
+
+def vacancies_to_features_frame(df) -> pd.DataFrame:
+    """ Векторизованный vacancy_to_features для DataFrame сырых вакансий (те же колонки-признаки) """
+    description = df['description'].fillna('').astype(str).str.replace(r'<.*?>', '', regex=True)
+    title = df['title'].fillna('').astype(str)
+    skills = df['skills_raw'].where(df['skills_raw'].map(lambda v: isinstance(v, str)), '')
+    grade = df['experience_hh'].map(EXPERIENCE_TO_GRADE)
+    currency = df['salary_currency'].where(
+        df['salary_currency'].map(lambda v: isinstance(v, str) and bool(v)), "RUR"
+    )
+    return pd.DataFrame({
+        'area_id': pd.to_numeric(df['area_id'], errors='coerce').fillna(0).astype(int),
+        'desc_len': description.str.len(),
+        'desc_words': description.str.split().str.len().fillna(0).astype(int),
+        'title_len': title.str.len(),
+        'num_skills': skills.str.split(',').map(lambda parts: sum(1 for s in parts if s.strip())),
+        'exp_junior': (grade == 'junior').astype(int),
+        'exp_middle': (grade == 'middle').astype(int),
+        'exp_senior': (grade == 'senior').astype(int),
+        'exp_lead': (grade == 'lead').astype(int),
+        'description': description,
+        'title': title.str.strip().str.lower(),
+        'salary_currency': currency,
+    }, index=df.index)
+
+EMB_DIM = 384
+_assembler = None
+_assembler_key = None
+_checked_salary_model = None
+
+def get_feature_assembler() -> FeatureAssembler:
+    """ Сборщик матрицы признаков salary по текущим TF-IDF/OHE (пересоздаётся, если их заменили) """
+    global _assembler, _assembler_key
+    names = ('tfidf_desc', 'tfidf_title', 'ohe')
+    key = tuple(id(get_artifact(name)) for name in names)
+    if key != _assembler_key:
+        _assembler = FeatureAssembler.from_artifacts(NUM_FEATURES, *(get_artifact(name) for name in names), EMB_DIM)
+        _assembler_key = key
+    return _assembler
+
+def get_salary_model():
+    """ salary_model; при первом обращении раскладка колонок сверяется с числом признаков модели """
+    global _checked_salary_model
+    model = get_artifact('salary_model')
+    if id(model) != _checked_salary_model:
+        get_feature_assembler().check_model(model)
+        _checked_salary_model = id(model)
+    return model
+
+def ohe_categories(feats: pd.DataFrame) -> list:
+    """ [[area_id, salary_currency], ...] строками для OHE """
+    if 'area_id' in feats:
+        # area_id — целое, как в vacancies_to_features_frame: если у части вакансий area_id нет,
+        # колонка становится float и str() дал бы '1.0' вместо '1'
+        areas = pd.to_numeric(feats['area_id'], errors='coerce').fillna(0).astype(int).astype(str)
+    else:
+        areas = pd.Series([""] * len(feats))
+    currencies = feats['salary_currency'] if 'salary_currency' in feats else pd.Series(["RUR"] * len(feats))
+    return [[a, str(c)] for a, c in zip(areas, currencies.fillna("RUR"))]
+
+def prepare_features_full_frame(feats: pd.DataFrame, emb_vec=None):
+    """ Полный пайплайн для salary по DataFrame признаков (n, 668) """
+    num_feats = feats.reindex(columns=NUM_FEATURES).fillna(0).to_numpy(dtype=float)
+    descs = feats['description'].fillna("").tolist() if 'description' in feats else [""] * len(feats)
+    titles = feats['title'].fillna("").tolist() if 'title' in feats else [""] * len(feats)
+    with timer('model.tfidf'):
+        tfidf_desc_vec = get_artifact('tfidf_desc').transform(descs)
+        tfidf_title_vec = get_artifact('tfidf_title').transform(titles)
+    with timer('model.ohe'):
+        ohe_cats_vec = get_artifact('ohe').transform(ohe_categories(feats))
+    if emb_vec is None:
+        emb_vec = encode_descriptions(descs)  # (n, 384) — один прогон MiniLM на всю пачку
+    with timer('model.assemble'):
+        X = get_feature_assembler().assemble(num_feats, tfidf_desc_vec, tfidf_title_vec, ohe_cats_vec, emb_vec)
+    return X
+
+def prepare_features_full_batch(features_list: list, emb_vec=None):
+    """ Полный пайплайн для salary сразу по пачке вакансий (n, 668) """
+    return prepare_features_full_frame(pd.DataFrame.from_records(features_list), emb_vec)
+
+def prepare_features_emb_only_batch(features_list: list):
+    """ Эмбеддинги описаний для grade-классификатора по пачке вакансий (n, 384) """
+    descs = [features.get('description', "") for features in features_list]
+    return encode_descriptions(descs)
 
 def prepare_features_full(features: dict):
     """ Полный пайплайн для salary (668 признаков) """
-    num_feats = np.array([
-        features.get('area_id', 0),
-        features.get('desc_len', 0),
-        features.get('desc_words', 0),
-        features.get('title_len', 0),
-        features.get('num_skills', 0),
-        features.get('exp_junior', 0),
-        features.get('exp_middle', 0),
-        features.get('exp_senior', 0),
-        features.get('exp_lead', 0)
-    ]).reshape(1, -1)
-
-    desc = features.get('description', "")
-    tfidf_desc_vec = tfidf_desc.transform([desc])
-    title = features.get('title', "")
-    tfidf_title_vec = tfidf_title.transform([title])
-    area_id = str(features.get('area_id', ""))
-    salary_currency = str(features.get('salary_currency', "RUR"))
-    ohe_cats_vec = ohe.transform([[area_id, salary_currency]])
-    emb_vec = minilm_model.encode([desc])  # (1, 384)
-    X = sparse.hstack([
-        num_feats, tfidf_desc_vec, tfidf_title_vec, ohe_cats_vec, emb_vec
-    ]).tocsr()
-    return X
+    return prepare_features_full_batch([features])
 
 def prepare_features_emb_only(features: dict):
     """ Только эмбеддинг по описанию для grade-классификатора (384 признака) """
-    desc = features.get('description', "")
-    emb_vec = minilm_model.encode([desc])  # (1, 384)
-    return emb_vec
+    return prepare_features_emb_only_batch([features])
+
+def predict_salary_batch(features_list: list) -> list:
+    """ Прогноз зарплаты для пачки вакансий одним вызовом модели """
+    if not features_list:
+        return []
+    X = prepare_features_full_batch(features_list)
+    with timer('model.salary_predict'):
+        return [float(v) for v in get_salary_model().predict(X)]
+
+def predict_grade_batch(features_list: list) -> list:
+    """ Грейд для пачки вакансий одним вызовом модели """
+    if not features_list:
+        return []
+    X = prepare_features_emb_only_batch(features_list)
+    with timer('model.grade_predict'):
+        return [int(v) for v in get_artifact('grade_model').predict(X)]
+
+GRADE_LABELS = {0: "junior", 1: "middle", 2: "senior", 3: "lead"}
 
 def predict_salary(features: dict) -> float:
-    X = prepare_features_full(features)
-    salary_pred = salary_model.predict(X)[0]
-    return float(salary_pred)
+    return predict_salary_batch([features])[0]
 
 def predict_grade(features: dict) -> int:
-    X = prepare_features_emb_only(features)
-    grade_pred = grade_model.predict(X)[0]
-    return int(grade_pred)
+    return predict_grade_batch([features])[0]
 
 def predict_salary_response(features: dict) -> dict:
     value = predict_salary(features)
@@ -78,10 +352,9 @@ def predict_salary_response(features: dict) -> dict:
 
 def predict_grade_response(features: dict) -> dict:
     code = predict_grade(features)
-    grade_map = {0: "junior", 1: "middle", 2: "senior", 3: "lead"}
     return {
         "grade_code": int(code),
-        "grade_label": grade_map.get(code, "unknown")
+        "grade_label": GRADE_LABELS.get(code, "unknown")
     }    
 
 #if __name__ == "__main__":
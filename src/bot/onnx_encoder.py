@@ -0,0 +1,58 @@
+import os
+import numpy as np
+
+ONNX_QUANT_FILE = 'model_quant.onnx'
+ONNX_FP32_FILE = 'model.onnx'
+
+
+def find_onnx_model(model_dir):
+    """Путь к экспортированному энкодеру (int8, если есть) или None."""
+    if not model_dir:
+        return None
+    for name in (ONNX_QUANT_FILE, ONNX_FP32_FILE):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class OnnxEncoder:
+    """
+    MiniLM, экспортированный в ONNX (см. export_onnx.py), с тем же интерфейсом encode(),
+    что и у SentenceTransformer: mean pooling по attention mask, выход (n, 384) float32.
+    """
+
+    def __init__(self, model_dir, max_seq_length=128, num_threads=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = find_onnx_model(model_dir)
+        if path is None:
+            raise FileNotFoundError(f"В {model_dir} нет {ONNX_QUANT_FILE} или {ONNX_FP32_FILE}")
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.model_path = path
+        self.max_seq_length = max_seq_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(path, opts, providers=['CPUExecutionProvider'])
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 384), dtype=np.float32)
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[i:i + batch_size], padding=True, truncation=True,
+                max_length=self.max_seq_length, return_tensors='np'
+            )
+            hidden = self.session.run(None, {
+                'input_ids': enc['input_ids'].astype(np.int64),
+                'attention_mask': enc['attention_mask'].astype(np.int64),
+            })[0]
+            mask = enc['attention_mask'][..., None].astype(np.float32)
+            emb = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(emb.astype(np.float32))
+        return np.vstack(out)
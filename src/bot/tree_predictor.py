@@ -0,0 +1,174 @@
+import numpy as np
+from scipy import sparse
+
+# Быстрые предикторы для моделей бота (выбираются при загрузке, см. model_inference.TREE_BACKEND):
+#
+#   grade_model (sklearn RandomForest) -> PackedForest: все узлы всех деревьев в плоских numpy-массивах,
+#       лист ссылается сам на себя, поэтому обход — depth одинаковых векторных шагов сразу по всем
+#       строкам × деревьям. sklearn же на каждый predict запускает joblib и обходит деревья по одному.
+#   salary_model (LGBMRegressor)        -> BoosterRegressor: сразу Booster.predict (C++), без проверок
+#       sklearn-обёртки, которые на одной строке дороже самого прогноза.
+#
+# Прогнозы совпадают с исходными моделями бит в бит: verify_compiled проверяет это при загрузке.
+
+PREDICT_CHUNK = 1024  # строк за один проход PackedForest (массивы строки × деревья)
+
+
+def _float32_floor(threshold):
+    """Наибольший float32 <= порога: для float32-признаков x <= t ⇔ x <= floor32(t)."""
+    t64 = np.asarray(threshold, dtype=np.float64)
+    t32 = t64.astype(np.float32)
+    over = t32.astype(np.float64) > t64
+    t32[over] = np.nextafter(t32[over], np.float32(-np.inf))
+    return t32
+
+
+class PackedForest:
+    """
+    RandomForestClassifier в плоских массивах: predict / predict_proba как у sklearn.
+
+    sklearn сравнивает признаки в float32 с порогами float64; здесь пороги заранее округлены
+    вниз до float32 (результат сравнения тот же), а доли классов хранятся только для листьев.
+    """
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'leaf', 'default_left', 'proba', 'roots')
+
+    def __init__(self, model):
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise NotImplementedError("поддерживается только один выход")
+        n_classes = len(model.classes_)
+        feature, threshold, left, right, leaf, default_left, proba, roots = [], [], [], [], [], [], [], []
+        offset, n_leaves, depth = 0, 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            idx = np.arange(tree.node_count)
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, idx, tree.children_left) + offset)
+            right.append(np.where(is_leaf, idx, tree.children_right) + offset)
+            leaf.append(np.where(is_leaf, np.cumsum(is_leaf) - 1 + n_leaves, -1))
+            missing_left = getattr(tree, 'missing_go_to_left', None)
+            default_left.append(np.zeros(tree.node_count, bool) if missing_left is None else missing_left.astype(bool))
+            # Доли классов в листе: sklearn >= 1.4 хранит в tree_.value уже доли и отдаёт их как есть,
+            # старые версии хранят веса и нормируют в DecisionTreeClassifier.predict_proba
+            p = tree.value[is_leaf, 0, :n_classes].astype(np.float64)
+            if not np.allclose(p.sum(axis=1), 1.0):
+                normalizer = p.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                p = p / normalizer
+            proba.append(p)
+            roots.append(offset)
+            offset += tree.node_count
+            n_leaves += int(is_leaf.sum())
+            depth = max(depth, tree.max_depth)
+
+        self.feature = np.concatenate(feature).astype(np.int32)
+        self.threshold = _float32_floor(np.concatenate(threshold))
+        self.left = np.concatenate(left).astype(np.int32)
+        self.right = np.concatenate(right).astype(np.int32)
+        self.leaf = np.concatenate(leaf).astype(np.int32)
+        self.default_left = np.concatenate(default_left)
+        self.proba = np.concatenate(proba)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.depth = depth
+        self.classes_ = np.asarray(model.classes_)
+        self.n_features_in_ = int(model.n_features_in_)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, classes, n_features_in, depth):
+        """Лес из готовых массивов (например, np.load(..., mmap_mode='r') из бандла артефактов)."""
+        forest = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(forest, name, arrays[name])
+        forest.classes_ = np.asarray(classes)
+        forest.n_features_in_ = int(n_features_in)
+        forest.depth = int(depth)
+        return forest
+
+    def arrays(self) -> dict:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays().values())
+
+    def leaves(self, X):
+        """Номер листа (в self.proba) для каждой строки × дерева."""
+        X = X.toarray() if sparse.issparse(X) else np.asarray(X)
+        X = X.astype(np.float32, copy=False)
+        n = X.shape[0]
+        nodes = np.broadcast_to(self.roots, (n, len(self.roots))).copy()
+        rows = np.arange(n)[:, None]
+        check_nan = np.isnan(X).any()
+        for _ in range(self.depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if check_nan:
+                # NaN идёт туда, куда указывает missing_go_to_left
+                go_left = np.where(np.isnan(x), self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return self.leaf[nodes]
+
+    def predict_proba(self, X):
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"ожидалось {self.n_features_in_} признаков, передано {X.shape[1]}")
+        out = []
+        for start in range(0, X.shape[0], PREDICT_CHUNK):
+            values = self.proba[self.leaves(X[start:start + PREDICT_CHUNK])]  # (строки, деревья, классы)
+            # cumsum складывает деревья по порядку, как sklearn (np.sum — попарно, последний бит может отличаться)
+            out.append(np.cumsum(values, axis=1)[:, -1] / len(self.roots))
+        return np.concatenate(out) if out else np.zeros((0, len(self.classes_)))
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+class BoosterRegressor:
+    """LGBMRegressor без sklearn-обёртки: predict сразу через Booster."""
+
+    def __init__(self, model):
+        self.booster = model.booster_ if hasattr(model, 'booster_') else model
+        self.n_features_in_ = self.booster.num_feature()
+
+    def predict(self, X):
+        return self.booster.predict(X)
+
+
+def compile_model(model):
+    """Модель -> быстрый предиктор (NotImplementedError — для этого типа модели его нет)."""
+    if hasattr(model, 'booster_') or hasattr(model, 'num_feature'):
+        return BoosterRegressor(model)
+    if hasattr(model, 'estimators_') and hasattr(model, 'classes_'):
+        return PackedForest(model)
+    raise NotImplementedError(f"{type(model).__name__} не поддерживается")
+
+
+def probe_matrix(compiled, n=512, per_row=64, seed=0):
+    """Проверочные строки: у PackedForest — значения ровно на порогах сплитов и рядом, иначе — случайные."""
+    rng = np.random.default_rng(seed)
+    n_features = compiled.n_features_in_
+    if not isinstance(compiled, PackedForest):
+        return rng.standard_normal((n, n_features)) * (rng.random((n, n_features)) < 0.05)
+    X = np.zeros((n, n_features), dtype=np.float32)
+    internal = np.flatnonzero(compiled.leaf < 0)
+    if len(internal):
+        picked = internal[rng.integers(0, len(internal), (n, per_row))]
+        thr = compiled.threshold[picked]
+        X[np.arange(n)[:, None], compiled.feature[picked]] = np.where(
+            rng.random(thr.shape) < 0.5, thr, np.nextafter(thr, np.float32(np.inf))
+        )
+    return X
+
+
+def verify_compiled(model, compiled, X=None):
+    """ValueError, если прогнозы быстрого предиктора отличаются от исходной модели на X (по умолчанию — probe_matrix)."""
+    X = probe_matrix(compiled) if X is None else X
+    expected, actual = np.asarray(model.predict(X)), np.asarray(compiled.predict(X))
+    mismatch = np.flatnonzero(expected != actual)
+    if len(mismatch):
+        i = mismatch[0]
+        raise ValueError(f"{len(mismatch)} из {len(expected)} прогнозов не совпали (строка {i}: {expected[i]} != {actual[i]})")
+    if hasattr(model, 'predict_proba') and not np.array_equal(model.predict_proba(X), compiled.predict_proba(X)):
+        raise ValueError("вероятности классов не совпали")
+    return len(expected)
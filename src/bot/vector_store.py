@@ -0,0 +1,222 @@
+"""
+Хранилище эмбеддингов описаний вакансий и приближённый поиск похожих (IVF на numpy).
+
+    python src/bot/vector_store.py update --db data/hh.duckdb_3000   # досчитать эмбеддинги + пересобрать индекс
+    python src/bot/vector_store.py build-index --db data/hh.duckdb_3000
+
+Эмбеддинги MiniLM (float32, 384) лежат в таблице vacancy_emb базы — её заполняют
+batch_score.py и команда update. Для поиска из неё собирается индекс в VECTOR_INDEX_DIR:
+векторы нормируются, разбиваются k-means на nlist кластеров и сохраняются отсортированными
+по кластеру, так что каждый кластер — непрерывный кусок emb.npy, который читается через mmap.
+Запрос сравнивается с центроидами и просматривает только nprobe ближайших кластеров.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from db_pool import bump_data_version, open_writer
+
+EMB_TABLE = 'vacancy_emb'
+EMB_DIM = 384
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', '/content/drive/MyDrive/hh-hr-bot/data/vector_index')
+VECTOR_NPROBE = int(os.getenv('VECTOR_NPROBE', 8))
+KMEANS_SAMPLE = 50000   # векторов для обучения центроидов
+KMEANS_ITERS = 15
+
+
+def create_emb_table(con):
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {EMB_TABLE} (
+        id BIGINT PRIMARY KEY,
+        emb FLOAT[{EMB_DIM}]
+    )
+    """)
+
+
+def save_embeddings(con, ids, emb):
+    """Записывает (перезаписывает) эмбеддинги вакансий в vacancy_emb."""
+    create_emb_table(con)
+    df = pd.DataFrame({'id': np.asarray(ids, dtype=np.int64), 'emb': list(np.asarray(emb, dtype=np.float32))})
+    con.register('_emb_chunk', df)
+    try:
+        con.execute(f"INSERT OR REPLACE INTO {EMB_TABLE} SELECT id, CAST(emb AS FLOAT[{EMB_DIM}]) FROM _emb_chunk")
+    finally:
+        con.unregister('_emb_chunk')
+    return len(df)
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def _kmeans(x, nlist, iters=KMEANS_ITERS, seed=0):
+    """Сферический k-means (косинусная близость) по нормированным векторам."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = np.bincount(assign, minlength=nlist) == 0
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()))]  # пустой кластер — новая случайная точка
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _assign(x, centroids, chunk=65536):
+    return np.concatenate([
+        np.argmax(x[i:i + chunk] @ centroids.T, axis=1) for i in range(0, len(x), chunk)
+    ]) if len(x) else np.zeros(0, dtype=np.int64)
+
+
+def build_index(con, out_dir=VECTOR_INDEX_DIR, nlist=None):
+    """Собирает IVF-индекс по всей таблице vacancy_emb и атомарно заменяет файлы в out_dir."""
+    t0 = time.perf_counter()
+    create_emb_table(con)
+    rows = con.execute(f"SELECT id, emb FROM {EMB_TABLE} ORDER BY id").fetchnumpy()
+    ids = rows['id'].astype(np.int64)
+    x = _normalize(np.stack(rows['emb']) if len(ids) else np.zeros((0, EMB_DIM), dtype=np.float32))
+    nlist = nlist or max(1, min(len(ids) // 39, int(4 * np.sqrt(len(ids)))))
+    if len(ids) > nlist > 1:
+        rng = np.random.default_rng(0)
+        sample = x[rng.choice(len(x), min(len(x), KMEANS_SAMPLE), replace=False)]
+        centroids = _kmeans(sample, nlist)
+        assign = _assign(x, centroids)
+    else:
+        nlist = 1
+        centroids = _normalize(x.mean(axis=0, keepdims=True)) if len(x) else np.zeros((1, EMB_DIM), np.float32)
+        assign = np.zeros(len(ids), dtype=np.int64)
+    order = np.argsort(assign, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+
+    os.makedirs(out_dir, exist_ok=True)
+    # Уникальная версия: две сборки в одну секунду не должны перезаписывать файлы под чужим mmap
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    for name, arr in (('ids', ids[order]), ('emb', x[order]), ('centroids', centroids), ('offsets', offsets)):
+        np.save(os.path.join(out_dir, f"{name}-{version}.npy"), arr)
+    manifest = {"version": version, "count": int(len(ids)), "nlist": int(nlist), "dim": EMB_DIM}
+    tmp_path = os.path.join(out_dir, "index.json.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(out_dir, "index.json"))
+    # старые версии файлов больше не нужны (уже открытые mmap на Linux остаются валидными)
+    for fname in os.listdir(out_dir):
+        if fname.endswith('.npy') and not fname.endswith(f"-{version}.npy"):
+            os.remove(os.path.join(out_dir, fname))
+    # Ответы /analyze зависят от индекса — кэш аналитики должен сброситься
+    bump_data_version(con)
+    print(f"Индекс: {len(ids)} векторов, {nlist} кластеров за {time.perf_counter() - t0:.1f} c")
+    return manifest
+
+
+class VectorIndex:
+    """IVF-индекс, загруженный из VECTOR_INDEX_DIR (векторы читаются через mmap)."""
+
+    def __init__(self, index_dir=VECTOR_INDEX_DIR):
+        with open(os.path.join(index_dir, "index.json")) as f:
+            self.manifest = json.load(f)
+        version = self.manifest["version"]
+        load = lambda name, mmap=None: np.load(os.path.join(index_dir, f"{name}-{version}.npy"), mmap_mode=mmap)
+        self.ids = load('ids')
+        self.emb = load('emb', mmap='r')
+        self.centroids = load('centroids')
+        self.offsets = load('offsets')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k=50, nprobe=VECTOR_NPROBE):
+        """k ближайших по косинусу вакансий: (ids, scores), по убыванию близости."""
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        cand_ids, cand_scores = [], []
+        for c in lists:
+            start, end = self.offsets[c], self.offsets[c + 1]
+            if end > start:
+                cand_ids.append(self.ids[start:end])
+                cand_scores.append(np.asarray(self.emb[start:end]) @ q)
+        if not cand_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        ids, scores = np.concatenate(cand_ids), np.concatenate(cand_scores)
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return ids[order], scores[order]
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+INDEX_LOAD_ATTEMPTS = 3
+
+
+def get_index(index_dir=VECTOR_INDEX_DIR):
+    """
+    Индекс для бота; перечитывается, если ETL пересобрал его. None — индекса нет.
+    Вызывается из потоков пула запросов, поэтому перечитывание идёт под блокировкой. Если
+    build_index успел заменить манифест и удалить файлы версии, которую мы начали читать,
+    манифест читается заново; не получилось за INDEX_LOAD_ATTEMPTS — остаётся прежний индекс.
+    """
+    global _index, _index_mtime
+    manifest_path = os.path.join(index_dir, "index.json")
+    with _index_lock:
+        for _ in range(INDEX_LOAD_ATTEMPTS):
+            try:
+                mtime = os.stat(manifest_path).st_mtime_ns
+            except FileNotFoundError:
+                return _index
+            if _index is not None and mtime == _index_mtime:
+                return _index
+            try:
+                index = VectorIndex(index_dir)
+            except FileNotFoundError:
+                continue
+            _index, _index_mtime = index, mtime
+            return _index
+        return _index
+
+
+def update_embeddings(con, chunk_size=2000):
+    """Досчитывает эмбеддинги вакансий, которых ещё нет в vacancy_emb."""
+    import model_inference  # модель нужна только ETL-команде, не боту
+
+    create_emb_table(con)
+    done, t0 = 0, time.perf_counter()
+    while True:
+        df = con.execute(f"""
+            SELECT CAST(v.id AS BIGINT) AS id, v.description FROM vacancy v
+            WHERE NOT EXISTS (SELECT 1 FROM {EMB_TABLE} e WHERE e.id = CAST(v.id AS BIGINT))
+            LIMIT ?
+        """, [chunk_size]).df()
+        if df.empty:
+            break
+        descs = df['description'].fillna('').astype(str).str.replace(r'<.*?>', '', regex=True).tolist()
+        save_embeddings(con, df['id'], model_inference.encode_descriptions(descs))
+        done += len(df)
+        print(f"Эмбеддингов: {done} ({done / (time.perf_counter() - t0):.0f} в секунду)")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Эмбеддинги вакансий и индекс похожих")
+    parser.add_argument('command', choices=['update', 'build-index'])
+    parser.add_argument('--db', default='/content/drive/MyDrive/hh-hr-bot/data/hh.duckdb_3000')
+    parser.add_argument('--out', default=VECTOR_INDEX_DIR)
+    parser.add_argument('--nlist', type=int, default=None, help="число кластеров (по умолчанию ~4·√n)")
+    args = parser.parse_args()
+
+    con = open_writer(args.db)
+    if args.command == 'update':
+        update_embeddings(con)
+    build_index(con, args.out, nlist=args.nlist)
+    con.close()
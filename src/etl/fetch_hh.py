@@ -1,9 +1,11 @@
+import os
 import requests
 import time
 import pandas as pd
-import duckdb
+from hh_database import connect_writer
 from tqdm import tqdm
 from pathlib import Path
+from loader import load_vacancies
 
 Path("data/raw").mkdir(parents=True, exist_ok=True)
 
@@ -23,11 +25,21 @@ REGIONS = [
 PAGES_PER_REGION = 1   # максимум 500 вакансий на регион
 PER_PAGE = 10
 
+# Параллельная загрузка (fetch_hh_async.py) и чекпоинт для докачки после обрыва
+USE_ASYNC_FETCHER = os.getenv('HH_ASYNC_FETCH', '1') == '1'
+FETCH_CHECKPOINT = "data/raw/fetch_checkpoint.jsonl"
+
+# Инкрементальный режим (incremental.py): только вакансии новее сохранённого watermark;
+# HH_INCREMENTAL=0 — полная выгрузка первых PAGES_PER_REGION страниц каждого региона
+INCREMENTAL = os.getenv('HH_INCREMENTAL', '1') == '1'
+
+HH_API_URL = "https://api.hh.ru"
+
 def fetch_vacancy_ids(pages=1, per_page=10, area="1"):
     """Собирает id вакансий по поиску"""
     vac_ids = []
     for page in tqdm(range(pages), desc="Выгружаем id"):
-        url = "https://api.hh.ru/vacancies"
+        url = f"{HH_API_URL}/vacancies"
         params = dict(area=area, per_page=per_page, page=page, text="*")
         r = requests.get(url, params=params)
         for item in r.json()["items"]:
@@ -35,113 +47,77 @@ def fetch_vacancy_ids(pages=1, per_page=10, area="1"):
         time.sleep(0.2)
     return vac_ids
 
+def parse_vacancy(v):
+    """Строка для таблицы vacancy из ответа /vacancies/{id}"""
+    return {
+        "id": v["id"],
+        "title": v["name"],
+        "published_at": v["published_at"],
+        "description": v.get("description", ""),
+        "salary_from": (v["salary"] or {}).get("from") if v.get("salary") else None,
+        "salary_to": (v["salary"] or {}).get("to") if v.get("salary") else None,
+        "salary_currency": (v["salary"] or {}).get("currency") if v.get("salary") else None,
+        "experience_hh": (v.get("experience") or {}).get("name"),
+        "area_id": int(v["area"]["id"]),
+        "skills_raw": ", ".join(s["name"] for s in v.get("key_skills", [])),
+        "employer": (v.get("employer") or {}).get("name", "")
+    }
+
 def fetch_full_vacancies(vac_ids):
     """Детально собирает вакансии по id (description, key_skills и др.)"""
     all_rows = []
     for vid in tqdm(vac_ids, desc="Грузим вакансии по id"):
-        url = f"https://api.hh.ru/vacancies/{vid}"
+        url = f"{HH_API_URL}/vacancies/{vid}"
         v = requests.get(url).json()
         # ПРОВЕРКА!
         if not v or 'id' not in v:
             print(f"Нет id для {vid}, ответ: {v}")
             continue
-        all_rows.append({
-            "id": v["id"],
-            "title": v["name"],
-            "published_at": v["published_at"],
-            "description": v.get("description", ""),
-            "salary_from": (v["salary"] or {}).get("from") if v.get("salary") else None,
-            "salary_to": (v["salary"] or {}).get("to") if v.get("salary") else None,
-            "salary_currency": (v["salary"] or {}).get("currency") if v.get("salary") else None,
-            "experience_hh": (v.get("experience") or {}).get("name"),
-            "area_id": int(v["area"]["id"]),
-            "skills_raw": ", ".join(s["name"] for s in v.get("key_skills", [])),
-            "employer": v.get("employer", {}).get("name", "")
-        })
+        all_rows.append(parse_vacancy(v))
         time.sleep(1.00)  # не перегружаем hh.ru
     return pd.DataFrame(all_rows)
 
-if __name__ == "__main__":
-    # 5 страницы по 100 = 500 вакансий на регион (можно увеличить до лимита)
-    #vac_ids = fetch_vacancy_ids(pages=3, per_page=100, area="113")
-    #df = fetch_full_vacancies(vac_ids)
+def fetch_all():
+    """Полная выгрузка: id по первым PAGES_PER_REGION страницам каждого региона, детали, Parquet и база."""
+    if USE_ASYNC_FETCHER:
+        import fetch_hh_async
+        fetch_ids = fetch_hh_async.fetch_vacancy_ids
+        fetch_details = lambda ids: fetch_hh_async.fetch_full_vacancies(ids, checkpoint_path=FETCH_CHECKPOINT)
+    else:
+        fetch_ids, fetch_details = fetch_vacancy_ids, fetch_full_vacancies
+
     all_vac_ids = set()
     for area in REGIONS:
         print(f"\n=== Грузим регион area_id={area} ===")
-        ids = fetch_vacancy_ids(pages=PAGES_PER_REGION, per_page=PER_PAGE, area=str(area))
+        ids = fetch_ids(pages=PAGES_PER_REGION, per_page=PER_PAGE, area=str(area))
         all_vac_ids.update(ids)
     print(f"\nИтого уникальных вакансий: {len(all_vac_ids)}")
 
-    new_vacancies_df = fetch_full_vacancies(list(all_vac_ids))
-    # Сохраняем в csv
-    #df.to_csv("data/raw/sample_vacancies_3000.csv", index=False)
+    new_vacancies_df = fetch_details(list(all_vac_ids))
 
-    # Считай старый датасет с новым полем employer
-    old_df = pd.read_csv("data/raw/sample_vacancies_3000.csv")
+    # Дописываем новые вакансии в Parquet (партиции по региону и месяцу публикации)
+    # вместо перечитывания и перезаписи всего CSV
+    from raw_store import append_parquet
+    append_parquet(new_vacancies_df)
+    print(f"\n=== дописали {len(new_vacancies_df)} вакансий в data/raw/vacancies")
 
-    # Добавь новые вакансии к старым
-    all_df = pd.concat([old_df, new_vacancies_df], ignore_index=True)
+    # Подключаемся к базе
+    con = connect_writer()
 
-    # Сохрани итоговый файл
-    all_df.to_csv("data/raw/sample_vacancies_3000.csv", index=False)
-    print(f"\n=== обновили файл")
+    # Вакансии, навыки и связи vacancy_skill — одной транзакцией set-based запросами,
+    # там же обновляются куб навыков и триграммный индекс названий
+    load_vacancies(con, new_vacancies_df, update_existing=True)
+    con.close()
 
-    # Сохраняем в DuckDB
-    #con = duckdb.connect("data/hh.duckdb_3000")
-    #con.execute("CREATE OR REPLACE TABLE vacancy AS SELECT * FROM df")
-    #con.close()
-    #print(f"Сохранили {len(df)} вакансий в data/raw/sample_vacancies_3000.csv и data/hh.duckdb_3000")
- 
+    # Всё сохранено — чекпоинт загрузки больше не нужен
+    Path(FETCH_CHECKPOINT).unlink(missing_ok=True)
 
-    # Подключаемся к базе
-    con = duckdb.connect('/content/drive/MyDrive/hh-hr-bot/data/hh.duckdb_3000')
-
-    # Пусть new_vacancies_df — твой DataFrame с новыми вакансиями и skills_list
-
-    # 1. Добавление новых вакансий
-    existing_ids = set(con.execute("SELECT id FROM vacancy").fetchdf()['id'].astype(str))
-    new_df = new_vacancies_df[~new_vacancies_df['id'].astype(str).isin(existing_ids)]
-    vacancy_cols = ['id', 'title', 'published_at', 'description', 'salary_from', 'salary_to',
-                    'salary_currency', 'experience_hh', 'area_id', 'skills_raw', 'employer']
-    #con.executemany(
-    #    f"INSERT INTO vacancy ({', '.join(vacancy_cols)}) VALUES ({', '.join(['?']*len(vacancy_cols))})",
-    #    new_df[vacancy_cols].values.tolist()
-    params = new_df[vacancy_cols].values.tolist()
-    if  params:
-       con.executemany(
-           f"INSERT INTO vacancy ({', '.join(vacancy_cols)}) VALUES ({', '.join(['?']*len(vacancy_cols))})",
-           params
-       )
-       print(f"Добавлено строк: {len(params)}")
+if __name__ == "__main__":
+    # 5 страницы по 100 = 500 вакансий на регион (можно увеличить до лимита)
+    #vac_ids = fetch_vacancy_ids(pages=3, per_page=100, area="113")
+    #df = fetch_full_vacancies(vac_ids)
+    if INCREMENTAL:
+        from incremental import run_incremental
+        run_incremental(REGIONS, per_page=PER_PAGE, max_pages=PAGES_PER_REGION)
     else:
-       print("Нет новых строк для вставки.")    
-    #)
-
-    # 2. Добавление новых навыков
-    all_new_skills = set()
-    for skills in new_df['skills_raw']:
-        if pd.notnull(skills):
-            for s in skills:
-                all_new_skills.add(s.strip().lower())
-    existing_skills = set(con.execute("SELECT name FROM skill").fetchdf()['name'].str.lower())
-    to_add = list(all_new_skills - existing_skills)
-    for skill in to_add:
-        con.execute("INSERT INTO skill(name) VALUES (?)", [skill])
-
-    # 3. Добавление связей vacancy_skill
-    # Получаем set всех названий навыков в нижнем регистре
-    skill_names = set(s.lower().strip() for s, in con.execute("SELECT name FROM skill").fetchall())
-
-    for _, row in new_df.iterrows():
-       vid = row['id']
-       # skills_raw — строка "Python, SQL, ..." → преобразуем в список
-       if pd.notnull(row['skills_raw']):
-           for s in str(row['skills_raw']).split(','):
-               s_norm = s.strip().lower()
-               if s_norm in skill_names:
-                   # Записываем пару: id вакансии, строка-навык
-                   con.execute(
-                       "INSERT INTO vacancy_skill (vacancy_id, skill_name) VALUES (?, ?)",
-                       [vid, s.strip()]
-                   )
-    con.close()              
+        fetch_all()
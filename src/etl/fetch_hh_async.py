@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+import pandas as pd
+from tqdm import tqdm
+
+from fetch_hh import HH_API_URL, parse_vacancy
+
+# Лимиты для api.hh.ru (можно переопределить в .env)
+HH_RATE_PER_SEC = float(os.getenv('HH_RATE_PER_SEC', 5))     # запросов в секунду на всех
+HH_CONCURRENCY = int(os.getenv('HH_CONCURRENCY', 8))          # одновременных запросов
+HH_MAX_RETRIES = int(os.getenv('HH_MAX_RETRIES', 5))
+HH_USER_AGENT = os.getenv('HH_USER_AGENT', 'hh-hr-bot/1.0')  # hh.ru требует HH-User-Agent
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket: в среднем не больше rate запросов в секунду, всплески до capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HHFetcher:
+    """
+    Асинхронный клиент hh.ru: один пул соединений, общий rate limit, ограничение
+    параллелизма, повторы с экспоненциальной паузой на 429/5xx и чекпоинт для докачки.
+
+        async with HHFetcher() as fetcher:
+            ids = await fetcher.fetch_vacancy_ids(pages=5, per_page=100, area="1")
+            df = await fetcher.fetch_full_vacancies(ids)
+
+    base_url можно направить на локальный стаб-сервер.
+    """
+
+    def __init__(self, base_url=HH_API_URL, rate=HH_RATE_PER_SEC, concurrency=HH_CONCURRENCY,
+                 max_retries=HH_MAX_RETRIES, checkpoint_path=None, backoff=1.0, bucket=None):
+        self.base_url = base_url.rstrip('/')
+        self.bucket = bucket or TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.checkpoint_path = checkpoint_path
+        self.backoff = backoff
+        self.session = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+            headers={'HH-User-Agent': HH_USER_AGENT, 'User-Agent': HH_USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=30),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def get_json(self, path, params=None):
+        """GET с лимитами и повторами. Возвращает JSON или None (404 / исчерпаны попытки)."""
+        status, data = await self.get_json_status(path, params)
+        return data
+
+    async def get_json_status(self, path, params=None):
+        """
+        Как get_json, но возвращает (HTTP-статус, JSON). Статус None — сетевые ошибки
+        или исчерпаны повторы, т.е. запрос имеет смысл повторить позже.
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            retry_after = None
+            async with self._semaphore:
+                self.stats["requests"] += 1
+                try:
+                    async with self.session.get(url, params=params) as r:
+                        if r.status == 200:
+                            return r.status, await r.json()
+                        if r.status == 404:
+                            return r.status, None
+                        if r.status not in RETRY_STATUSES:
+                            print(f"{url}: HTTP {r.status}, пропускаем")
+                            self.stats["errors"] += 1
+                            return r.status, None
+                        retry_after = r.headers.get('Retry-After')
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"{url}: {e!r}")
+            if attempt == self.max_retries:
+                break
+            self.stats["retries"] += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+            await asyncio.sleep(delay + random.uniform(0, self.backoff / 2))
+        self.stats["errors"] += 1
+        print(f"{url}: не удалось после {self.max_retries + 1} попыток")
+        return None, None
+
+    async def fetch_vacancy_ids(self, pages=1, per_page=10, area="1"):
+        """Собирает id вакансий по поиску (страницы запрашиваются параллельно)."""
+        async def one_page(page):
+            data = await self.get_json("/vacancies", dict(area=area, per_page=per_page, page=page, text="*"))
+            return [item["id"] for item in (data or {}).get("items", [])]
+
+        results = await asyncio.gather(*[one_page(page) for page in range(pages)])
+        return [vid for page_ids in results for vid in page_ids]
+
+    def _load_checkpoint(self):
+        """id -> строка вакансии (None — вакансии нет, 404)."""
+        done = {}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        rec = json.loads(line)
+                        done[str(rec["id"])] = rec["row"]
+        return done
+
+    async def fetch_full_vacancies(self, vac_ids):
+        """
+        Детально собирает вакансии по id. Каждая готовая вакансия (и каждый 404) сразу пишется
+        в чекпоинт (jsonl), поэтому после обрыва повторный запуск докачивает только оставшиеся id.
+        Запросы, не удавшиеся после всех повторов, в чекпоинт не попадают и повторяются
+        при следующем запуске; их id — в stats["failed_ids"].
+        """
+        done = self._load_checkpoint()
+        todo = [vid for vid in dict.fromkeys(str(v) for v in vac_ids) if vid not in done]
+        if done:
+            print(f"Чекпоинт: уже загружено {len(done)}, осталось {len(todo)}")
+        checkpoint = open(self.checkpoint_path, 'a', encoding='utf-8') if self.checkpoint_path else None
+        progress = tqdm(total=len(todo), desc="Грузим вакансии по id")
+        failed = []
+
+        async def one(vid):
+            status, v = await self.get_json_status(f"/vacancies/{vid}")
+            row = parse_vacancy(v) if v and 'id' in v else None
+            if row is not None or status == 404:
+                done[vid] = row
+                if checkpoint:
+                    checkpoint.write(json.dumps({"id": vid, "status": status, "row": row}, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+            else:
+                print(f"Нет id для {vid}, ответ: HTTP {status} {v}")
+                failed.append(vid)
+            progress.update(1)
+
+        try:
+            await asyncio.gather(*[one(vid) for vid in todo])
+        finally:
+            progress.close()
+            if checkpoint:
+                checkpoint.close()
+        self.stats["failed_ids"] = failed
+        if failed:
+            print(f"Не загружено {len(failed)} вакансий, они будут запрошены при следующем запуске")
+        rows = [done[str(vid)] for vid in dict.fromkeys(str(v) for v in vac_ids) if done.get(str(vid))]
+        return pd.DataFrame(rows)
+
+
+# === Drop-in замена синхронных fetch_hh.fetch_vacancy_ids / fetch_full_vacancies ===
+
+def fetch_vacancy_ids(pages=1, per_page=10, area="1", **fetcher_kwargs):
+    """Собирает id вакансий по поиску"""
+    async def run():
+        async with HHFetcher(**fetcher_kwargs) as fetcher:
+            return await fetcher.fetch_vacancy_ids(pages=pages, per_page=per_page, area=area)
+    return asyncio.run(run())
+
+
+def fetch_full_vacancies(vac_ids, **fetcher_kwargs):
+    """Детально собирает вакансии по id (description, key_skills и др.)"""
+    async def run():
+        async with HHFetcher(**fetcher_kwargs) as fetcher:
+            df = await fetcher.fetch_full_vacancies(vac_ids)
+            print(f"Запросов: {fetcher.stats['requests']}, повторов: {fetcher.stats['retries']}, "
+                  f"ошибок: {fetcher.stats['errors']}")
+            return df
+    return asyncio.run(run())
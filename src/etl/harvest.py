@@ -0,0 +1,359 @@
+"""
+Параллельный сбор вакансий по многим регионам через постоянную очередь задач.
+
+    python src/etl/harvest.py --regions 1,2,3,4,78 --pages 20 --deadline 3600
+
+Работа режется на задачи «регион × страница поиска» и «вакансия по id» и хранится
+в DuckDB-файле очереди (HARVEST_QUEUE_PATH): после обрыва или по истечении --deadline
+следующий запуск продолжает с того же места. Воркеры работают параллельно, но через
+один HHFetcher — общий rate limit (HH_RATE_PER_SEC) на все регионы. id, найденные
+в нескольких регионах, ставятся в очередь деталей один раз.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+
+import duckdb
+import pandas as pd
+
+from hh_database import DB_PATH, connect_writer
+from fetch_hh import REGIONS, parse_vacancy
+from fetch_hh_async import HH_CONCURRENCY, HHFetcher
+from loader import load_vacancies
+from preprocess import preprocess_pending
+from raw_store import RAW_PARQUET_ROOT, append_parquet
+
+HARVEST_QUEUE_PATH = os.getenv('HARVEST_QUEUE_PATH', 'data/raw/harvest_queue.duckdb')
+HH_MAX_DEPTH = 2000      # hh.ru отдаёт не больше 2000 результатов одного поиска
+MAX_ATTEMPTS = 3         # после стольких неудач задача помечается failed
+LOAD_CHUNK = 5000        # вакансий на одну загрузку в базу
+
+
+class HarvestQueue:
+    """Постоянная очередь задач сбора (DuckDB-файл)."""
+
+    def __init__(self, path=HARVEST_QUEUE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.con = duckdb.connect(path)
+        self.con.execute("""
+        CREATE TABLE IF NOT EXISTS harvest_page (
+            area_id BIGINT, page INTEGER,
+            status VARCHAR DEFAULT 'pending',   -- pending / done / failed
+            attempts INTEGER DEFAULT 0,
+            n_items INTEGER,
+            PRIMARY KEY (area_id, page)
+        )""")
+        self.con.execute("""
+        CREATE TABLE IF NOT EXISTS harvest_detail (
+            vacancy_id BIGINT PRIMARY KEY,
+            area_id BIGINT,                     -- регион, в котором id нашли первым
+            status VARCHAR DEFAULT 'pending',   -- pending / done / missing / failed / loaded
+            attempts INTEGER DEFAULT 0,
+            row_json VARCHAR
+        )""")
+
+    def close(self):
+        self.con.close()
+
+    def reset(self):
+        self.con.execute("DELETE FROM harvest_page")
+        self.con.execute("DELETE FROM harvest_detail")
+
+    def seed(self, regions):
+        """
+        Первая страница каждого региона; остальные добавятся, когда станет известно их число.
+        Регион, у которого не осталось pending-страниц, прошлый обход закончил — начинаем новый:
+        страница 0 снова pending, остальные удаляются и добавятся заново по свежему числу страниц.
+        Недоделанный (по deadline или после обрыва) обход продолжается с того же места.
+        """
+        regions = [int(a) for a in regions]
+        finished = [r[0] for r in self.con.execute(f"""
+            SELECT area_id FROM harvest_page
+            WHERE area_id IN ({', '.join('?' * len(regions))})
+            GROUP BY area_id HAVING COUNT(*) FILTER (WHERE status = 'pending') = 0
+        """, regions).fetchall()]
+        for area in finished:
+            self.con.execute("DELETE FROM harvest_page WHERE area_id = ? AND page > 0", [area])
+            self.con.execute(
+                "UPDATE harvest_page SET status = 'pending', attempts = 0, n_items = NULL "
+                "WHERE area_id = ? AND page = 0", [area])
+        for area in regions:
+            self.add_pages(area, [0])
+        return finished
+
+    def add_pages(self, area, pages):
+        self.con.executemany(
+            "INSERT INTO harvest_page (area_id, page) VALUES (?, ?) ON CONFLICT DO NOTHING",
+            [(int(area), int(p)) for p in pages],
+        )
+
+    def add_ids(self, area, ids, known_ids=frozenset()):
+        """Ставит id в очередь деталей; уже стоящие (из любого региона) и уже загруженные пропускаются."""
+        rows = [(int(v), int(area)) for v in ids if int(v) not in known_ids]
+        if not rows:
+            return 0
+        before = self.con.execute("SELECT COUNT(*) FROM harvest_detail").fetchone()[0]
+        self.con.executemany(
+            "INSERT INTO harvest_detail (vacancy_id, area_id) VALUES (?, ?) ON CONFLICT DO NOTHING", rows
+        )
+        return self.con.execute("SELECT COUNT(*) FROM harvest_detail").fetchone()[0] - before
+
+    def pending_pages(self, regions):
+        return self.con.execute(f"""
+            SELECT area_id, page FROM harvest_page
+            WHERE status = 'pending' AND area_id IN ({', '.join('?' * len(regions))})
+            ORDER BY page, area_id
+        """, [int(a) for a in regions]).fetchall()
+
+    def pending_details(self):
+        return self.con.execute(
+            "SELECT vacancy_id, area_id FROM harvest_detail WHERE status = 'pending' ORDER BY vacancy_id"
+        ).fetchall()
+
+    def finish_page(self, area, page, n_items):
+        self.con.execute(
+            "UPDATE harvest_page SET status = 'done', n_items = ?, attempts = attempts + 1 "
+            "WHERE area_id = ? AND page = ?", [n_items, int(area), int(page)])
+
+    def fail_page(self, area, page):
+        self.con.execute(f"""
+            UPDATE harvest_page SET attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 >= {MAX_ATTEMPTS} THEN 'failed' ELSE 'pending' END
+            WHERE area_id = ? AND page = ?""", [int(area), int(page)])
+
+    def finish_detail(self, vacancy_id, row):
+        self.con.execute(
+            "UPDATE harvest_detail SET status = ?, row_json = ?, attempts = attempts + 1 WHERE vacancy_id = ?",
+            ['done' if row else 'missing', json.dumps(row, ensure_ascii=False) if row else None, int(vacancy_id)])
+
+    def fail_detail(self, vacancy_id):
+        self.con.execute(f"""
+            UPDATE harvest_detail SET attempts = attempts + 1,
+                status = CASE WHEN attempts + 1 >= {MAX_ATTEMPTS} THEN 'failed' ELSE 'pending' END
+            WHERE vacancy_id = ?""", [int(vacancy_id)])
+
+    def unloaded_rows(self, limit=LOAD_CHUNK):
+        return self.con.execute(
+            "SELECT vacancy_id, row_json FROM harvest_detail WHERE status = 'done' LIMIT ?", [limit]
+        ).fetchall()
+
+    def mark_loaded(self, ids):
+        self.con.executemany("UPDATE harvest_detail SET status = 'loaded', row_json = NULL WHERE vacancy_id = ?",
+                             [(int(i),) for i in ids])
+
+    def summary(self):
+        """Состояние очереди по регионам: страницы и вакансии по статусам."""
+        pages = self.con.execute("""
+            SELECT area_id, COUNT(*) FILTER (WHERE status = 'done'), COUNT(*),
+                   COALESCE(SUM(n_items), 0)
+            FROM harvest_page GROUP BY area_id ORDER BY area_id
+        """).fetchall()
+        details = dict(((a, s), n) for a, s, n in self.con.execute(
+            "SELECT area_id, status, COUNT(*) FROM harvest_detail GROUP BY ALL").fetchall())
+        return {
+            area: {
+                "pages_done": done, "pages_total": total, "ids_found": found,
+                **{s: details.get((area, s), 0) for s in ('pending', 'done', 'loaded', 'missing', 'failed')},
+            }
+            for area, done, total, found in pages
+        }
+
+
+class HarvestProgress:
+    """Счётчики по регионам за текущий запуск: страницы, найденные/новые id, детали, ошибки."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.by_region = defaultdict(lambda: defaultdict(int))
+
+    def add(self, area, **counts):
+        for key, n in counts.items():
+            self.by_region[int(area)][key] += n
+
+    def report(self, queue=None):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        total = sum(r['details'] for r in self.by_region.values())
+        lines = [f"[{elapsed:.0f} c] вакансий: {total} ({total / elapsed:.2f}/с)"]
+        state = queue.summary() if queue else {}
+        for area in sorted(set(self.by_region) | set(state)):
+            r, s = self.by_region[area], state.get(area, {})
+            left = s.get('pending', 0)
+            lines.append(
+                f"  area_id={area}: страниц {r['pages']} "
+                f"(всего {s.get('pages_done', 0)}/{s.get('pages_total', 0)}), "
+                f"id {r['ids']} (новых {r['new_ids']}), деталей {r['details']} "
+                f"({r['details'] / elapsed:.2f}/с), осталось {left}, ошибок {r['errors']}"
+            )
+        return "\n".join(lines)
+
+
+class _TaskList:
+    """
+    Общий список задач воркеров. Пока какая-то задача в работе, пустой список не значит «всё
+    сделано»: из неё могут появиться новые (первая страница региона добавляет остальные),
+    поэтому pop() ждёт, а не возвращает None сразу.
+    """
+
+    def __init__(self, tasks):
+        self.tasks = list(tasks)
+        self.in_progress = 0
+        self._cond = asyncio.Condition()
+
+    async def pop(self):
+        """Следующая задача (с конца списка) или None, если задач нет и не появится."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.tasks or not self.in_progress)
+            if not self.tasks:
+                return None
+            self.in_progress += 1
+            return self.tasks.pop()
+
+    async def done(self, new_tasks=()):
+        """Задача выполнена; new_tasks встают в начало списка (берутся после уже стоящих)."""
+        async with self._cond:
+            self.tasks[0:0] = new_tasks
+            self.in_progress -= 1
+            self._cond.notify_all()
+
+
+async def _page_worker(fetcher, queue, progress, tasks, per_page, max_pages, known_ids, search_params, deadline):
+    while time.monotonic() < deadline:
+        task = await tasks.pop()
+        if task is None:
+            return
+        area, page = task
+        new_tasks = []
+        try:
+            data = await fetcher.get_json("/vacancies", dict(search_params, area=area, per_page=per_page, page=page))
+            if data is None:
+                queue.fail_page(area, page)
+                progress.add(area, errors=1)
+                continue
+            if page == 0:
+                # Остальные страницы региона — в начало списка, после первых страниц других регионов
+                last_page = min(data.get("pages", 1), max_pages, HH_MAX_DEPTH // per_page)
+                queue.add_pages(area, range(1, last_page))
+                new_tasks = [(area, p) for p in range(last_page - 1, 0, -1)]
+            ids = [item["id"] for item in data.get("items", [])]
+            new = queue.add_ids(area, ids, known_ids)
+            queue.finish_page(area, page, len(ids))
+            progress.add(area, pages=1, ids=len(ids), new_ids=new)
+        finally:
+            await tasks.done(new_tasks)
+
+
+async def _detail_worker(fetcher, queue, progress, tasks, deadline):
+    while tasks and time.monotonic() < deadline:
+        vacancy_id, area = tasks.pop()
+        status, v = await fetcher.get_json_status(f"/vacancies/{vacancy_id}")
+        if v is None and status != 404:
+            queue.fail_detail(vacancy_id)
+            progress.add(area, errors=1)
+            continue
+        queue.finish_detail(vacancy_id, parse_vacancy(v) if v and 'id' in v else None)
+        progress.add(area, details=1)
+
+
+async def _reporter(queue, progress, every):
+    while True:
+        await asyncio.sleep(every)
+        print(progress.report(queue))
+
+
+async def harvest_async(queue, regions, max_pages=20, per_page=100, workers=HH_CONCURRENCY,
+                        deadline=None, known_ids=frozenset(), search_params=None,
+                        report_every=30, **fetcher_kwargs):
+    """
+    Выполняет задачи очереди: сначала страницы поиска всех регионов, затем детали.
+    deadline — секунды на запуск; недоделанные задачи остаются в очереди до следующего раза.
+    """
+    progress = HarvestProgress()
+    stop_at = time.monotonic() + deadline if deadline else float('inf')
+    search_params = dict(search_params or {"text": "*"})
+    queue.seed(regions)
+    reporter = asyncio.create_task(_reporter(queue, progress, report_every)) if report_every else None
+    try:
+        async with HHFetcher(concurrency=workers, **fetcher_kwargs) as fetcher:
+            # Страницы берутся с конца списка: сначала первые страницы всех регионов
+            page_tasks = _TaskList(reversed(queue.pending_pages(regions)))
+            await asyncio.gather(*[
+                _page_worker(fetcher, queue, progress, page_tasks, per_page, max_pages, known_ids,
+                             search_params, stop_at)
+                for _ in range(workers)
+            ])
+            detail_tasks = list(reversed(queue.pending_details()))
+            await asyncio.gather(*[
+                _detail_worker(fetcher, queue, progress, detail_tasks, stop_at) for _ in range(workers)
+            ])
+            progress.fetcher_stats = dict(fetcher.stats)
+    finally:
+        if reporter:
+            reporter.cancel()
+    return progress
+
+
+def load_harvested(queue, con=None, parquet_root=RAW_PARQUET_ROOT):
+    """Переносит скачанные вакансии из очереди в Parquet и базу пачками по LOAD_CHUNK."""
+    total = 0
+    while True:
+        rows = queue.unloaded_rows()
+        if not rows:
+            return total
+        df = pd.DataFrame([json.loads(r) for _, r in rows])
+        append_parquet(df, parquet_root)
+        if con is not None:
+            load_vacancies(con, df, update_existing=True)
+        queue.mark_loaded([vid for vid, _ in rows])
+        total += len(rows)
+
+
+def _loaded_ids(con):
+    return frozenset(r[0] for r in con.execute("SELECT CAST(id AS BIGINT) FROM vacancy").fetchall())
+
+
+def harvest(regions=REGIONS, db_path=DB_PATH, queue_path=HARVEST_QUEUE_PATH, max_pages=20, per_page=100,
+            workers=HH_CONCURRENCY, deadline=None, skip_loaded=True, reset=False, **kwargs):
+    """Собирает вакансии по регионам и загружает их в базу. Возвращает итоговую сводку очереди."""
+    queue = HarvestQueue(queue_path)
+    con = connect_writer(db_path) if db_path else None
+    try:
+        if reset:
+            queue.reset()
+        known_ids = _loaded_ids(con) if con is not None and skip_loaded else frozenset()
+        progress = asyncio.run(harvest_async(
+            queue, regions, max_pages=max_pages, per_page=per_page, workers=workers,
+            deadline=deadline, known_ids=known_ids, **kwargs,
+        ))
+        print(progress.report(queue))
+        print(f"Запросов: {progress.fetcher_stats['requests']}, повторов: {progress.fetcher_stats['retries']}, "
+              f"ошибок: {progress.fetcher_stats['errors']}")
+        print(f"Загружено в базу: {load_harvested(queue, con)}")
+        if con is not None:
+            preprocess_pending(con)
+        return queue.summary()
+    finally:
+        queue.close()
+        if con is not None:
+            con.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Параллельный сбор вакансий hh.ru по регионам")
+    parser.add_argument('--regions', default=','.join(map(str, REGIONS)), help="id регионов через запятую")
+    parser.add_argument('--pages', type=int, default=20, help="страниц поиска на регион")
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=HH_CONCURRENCY)
+    parser.add_argument('--deadline', type=float, default=None, help="секунд на запуск")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--queue', default=HARVEST_QUEUE_PATH)
+    parser.add_argument('--reset', action='store_true', help="начать с пустой очереди")
+    args = parser.parse_args()
+
+    harvest(
+        regions=[int(a) for a in args.regions.split(',') if a.strip()],
+        db_path=args.db, queue_path=args.queue, max_pages=args.pages, per_page=args.per_page,
+        workers=args.workers, deadline=args.deadline, reset=args.reset,
+    )
@@ -0,0 +1,96 @@
+import os
+import shutil
+import sys
+
+import duckdb
+
+# База проекта и настройки DuckDB — общие для ETL и пула бота (src/bot/db_pool.py импортирует их отсюда)
+DB_PATH = '/content/drive/MyDrive/hh-hr-bot/data/hh.duckdb_3000'
+DUCKDB_THREADS = int(os.getenv('DUCKDB_THREADS', 0))      # 0 — по умолчанию DuckDB (все ядра)
+DUCKDB_MEMORY_LIMIT = os.getenv('DUCKDB_MEMORY_LIMIT')    # например, '2GB'; не задан — по умолчанию
+
+
+def duckdb_config(threads=DUCKDB_THREADS, memory_limit=DUCKDB_MEMORY_LIMIT) -> dict:
+    """config для duckdb.connect: только заданные настройки."""
+    config = {}
+    if threads:
+        config['threads'] = threads
+    if memory_limit:
+        config['memory_limit'] = memory_limit
+    return config
+
+
+def connect_writer(db_path=DB_PATH, threads=DUCKDB_THREADS, memory_limit=DUCKDB_MEMORY_LIMIT):
+    """Соединение на запись (ETL-шаги, batch_score, vector_store). Бот читает базу через свой пул."""
+    return duckdb.connect(db_path, config=duckdb_config(threads, memory_limit))
+
+
+# Версия данных — файл "<база>.version" рядом с базой. ETL увеличивает её после каждой загрузки
+# (и пересборки индекса эмбеддингов), а кэш аналитики бота (src/bot/analytics_cache.py) по ней
+# сбрасывается. Бот импортирует эти функции отсюда через src/bot/db_pool.py.
+VERSION_SUFFIX = '.version'
+
+# Снимки для бота. DuckDB блокирует файл базы между процессами: пока бот держит соединение
+# (даже только на чтение), ETL не может открыть базу на запись. Поэтому бот рабочий файл
+# не открывает: вместе с новой версией ETL публикует копию базы "<база>.v<версия>", а пул бота,
+# увидев новую версию, переключается на её снимок. Хранятся KEEP_DB_SNAPSHOTS последних снимков
+# (предыдущий — для запросов, начатых до переключения).
+KEEP_DB_SNAPSHOTS = 2
+
+
+def read_data_version(db_path) -> int:
+    """Текущая версия данных базы (0, если ETL ещё ни разу её не увеличивал)."""
+    try:
+        with open(f"{db_path}{VERSION_SUFFIX}") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def snapshot_path(db_path, version) -> str:
+    return f"{db_path}.v{version}"
+
+
+def published_snapshot(db_path):
+    """Снимок базы для текущей версии данных (None — ещё не опубликован)."""
+    path = snapshot_path(db_path, read_data_version(db_path))
+    return path if os.path.exists(path) else None
+
+
+def bump_data_version(con):
+    """
+    Увеличивает версию данных базы, к которой подключён con, и публикует снимок базы для бота
+    (для базы в памяти — ничего). Вызывать вне транзакции: перед копированием делается CHECKPOINT.
+    """
+    db_path = con.execute(
+        "SELECT path FROM duckdb_databases() WHERE database_name = current_database()"
+    ).fetchone()[0]
+    if not db_path:
+        return None
+    version = read_data_version(db_path) + 1
+    # После CHECKPOINT все данные в основном файле, а соединение простаивает — копия согласована
+    con.execute("CHECKPOINT")
+    snapshot = snapshot_path(db_path, version)
+    shutil.copyfile(db_path, f"{snapshot}.tmp")
+    os.replace(f"{snapshot}.tmp", snapshot)
+    version_path = f"{db_path}{VERSION_SUFFIX}"
+    with open(f"{version_path}.tmp", 'w') as f:
+        f.write(str(version))
+    os.replace(f"{version_path}.tmp", version_path)
+    # Бот мог ещё не закрыть старый снимок: на Linux открытый файл живёт до закрытия
+    db_dir, prefix = os.path.split(os.path.abspath(db_path))
+    prefix += '.v'
+    for name in os.listdir(db_dir):
+        old = name[len(prefix):]
+        if name.startswith(prefix) and old.isdigit() and int(old) <= version - KEEP_DB_SNAPSHOTS:
+            os.remove(os.path.join(db_dir, name))
+    return version
+
+
+if __name__ == "__main__":
+    # Опубликовать снимок для бота без загрузки данных: python src/etl/hh_database.py [путь к базе]
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    con = connect_writer(db_path)
+    version = bump_data_version(con)
+    con.close()
+    print(f"Версия данных {version}, снимок для бота: {published_snapshot(db_path)}")
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from hh_database import DB_PATH, connect_writer
+from fetch_hh_async import HHFetcher
+from loader import load_vacancies
+from preprocess import preprocess_pending
+from raw_store import RAW_PARQUET_ROOT, append_parquet
+
+# Инкрементальная загрузка: для каждого региона храним watermark —
+# дату публикации самой свежей загруженной вакансии и id вакансий с этой датой.
+# Следующий запуск запрашивает у hh.ru только более свежие (новые или переопубликованные).
+# Если за запуск список не прочитан до watermark (max_pages, ошибка), рядом хранится курсор
+# resume — верх недочитанного окна, см. advance_state.
+STATE_PATH = "data/etl_state.json"
+CHECKPOINT_PATH = "data/raw/incremental_checkpoint.jsonl"
+HH_MAX_DEPTH = 2000  # hh.ru отдаёт не больше 2000 результатов одного поиска
+
+
+def _parse_ts(value):
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+
+
+def load_state(path=STATE_PATH) -> dict:
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {"regions": {}}
+
+
+def save_state(state, path=STATE_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+async def fetch_new_items(fetcher, area, watermark=None, per_page=100, max_pages=20, resume=None):
+    """
+    Элементы поиска по региону, опубликованные позже watermark (свежие — первыми), и флаг
+    complete: список дошёл до watermark или кончился без ошибок. resume — курсор недочитанного
+    окна (см. advance_state): берутся только вакансии не новее resume['published_at'].
+    """
+    params = dict(area=area, per_page=per_page, text="*", order_by="publication_time")
+    wm_ts, seen_ids = None, set()
+    if watermark:
+        params['date_from'] = watermark['published_at']
+        wm_ts = _parse_ts(watermark['published_at'])
+        seen_ids = set(watermark.get('last_ids', []))
+    top_ts, top_ids = None, set()
+    if resume:
+        params['date_to'] = resume['published_at']
+        top_ts = _parse_ts(resume['published_at'])
+        top_ids = set(resume.get('last_ids', []))
+
+    items, complete = [], False
+    for page in range(min(max_pages, HH_MAX_DEPTH // per_page)):
+        data = await fetcher.get_json("/vacancies", dict(params, page=page))
+        if not data:
+            break  # ошибка: окно не дочитано, complete остаётся False
+        reached_old = False
+        for item in data.get("items", []):
+            ts = _parse_ts(item['published_at'])
+            if top_ts and (ts > top_ts or (ts == top_ts and item['id'] in top_ids)):
+                continue
+            if wm_ts and (ts < wm_ts or (ts == wm_ts and item['id'] in seen_ids)):
+                reached_old = reached_old or ts < wm_ts
+                continue
+            items.append(item)
+        if reached_old or page >= data.get('pages', 0) - 1:
+            complete = True
+            break
+    return items, complete
+
+
+def _newest(items):
+    """Watermark по самым свежим элементам: дата публикации и id вакансий с этой датой."""
+    newest_ts = max(_parse_ts(i['published_at']) for i in items)
+    newest = [i for i in items if _parse_ts(i['published_at']) == newest_ts]
+    return {"published_at": newest[0]['published_at'], "last_ids": [i['id'] for i in newest]}
+
+
+def advance_watermark(watermark, items, loaded_ids):
+    """
+    Новый watermark региона по успешно загруженным вакансиям (список items прочитан до watermark).
+    Не перешагиваем вакансии, детали которых загрузить не удалось: они придут в следующий раз.
+    """
+    failed = [_parse_ts(i['published_at']) for i in items if str(i['id']) not in loaded_ids]
+    ok = [i for i in items if str(i['id']) in loaded_ids]
+    if failed:
+        cutoff = min(failed)
+        ok = [i for i in ok if _parse_ts(i['published_at']) < cutoff]
+    if not ok:
+        return watermark
+    new = _newest(ok)
+    if watermark and watermark['published_at'] == new['published_at']:
+        new['last_ids'] = list(dict.fromkeys(watermark.get('last_ids', []) + new['last_ids']))
+    return new
+
+
+def advance_state(region_state, items, complete, loaded_ids):
+    """
+    Новое состояние региона {watermark, resume} после запуска.
+
+    Список читается от свежих к старым и обрезается max_pages, поэтому watermark сдвигается,
+    только когда окно «watermark .. верх» прочитано целиком (complete). Иначе всё, что новее
+    самой старой прочитанной (и загруженной) вакансии, уже есть в базе, а ниже остаётся
+    дыра до старого watermark: её верх запоминается курсором resume, и следующие запуски
+    дочитывают окно сверху вниз (date_to). Когда окно закрыто, watermark переходит на
+    resume['target'] — самую свежую вакансию, загруженную за всё время дочитывания.
+    Первый запуск (watermark ещё нет) дыр не дочитывает: начальная загрузка — max_pages страниц.
+    """
+    region_state = dict(region_state or {})
+    watermark, resume = region_state.get('watermark'), region_state.get('resume')
+    if complete and not resume:
+        return {'watermark': advance_watermark(watermark, items, loaded_ids)}
+    if watermark is None:
+        # Начальная загрузка: как раньше, watermark — самая свежая загруженная вакансия
+        return {'watermark': advance_watermark(None, items, loaded_ids)}
+
+    target = resume['target'] if resume else (_newest(items) if items else None)
+    failed = [i for i in items if str(i['id']) not in loaded_ids]
+    if complete and not failed:
+        return {'watermark': target or watermark}
+    if not items:
+        return region_state  # ничего не прочитано (ошибка на первой странице) — всё как было
+
+    # Низ прочитанного куска: самая старая вакансия или, если детали не загрузились, самая свежая
+    # из незагруженных — окно ниже неё (включая её саму) дочитывается в следующий раз
+    if failed:
+        edge_ts = max(_parse_ts(i['published_at']) for i in failed)
+        covered = [i for i in items if _parse_ts(i['published_at']) == edge_ts and str(i['id']) in loaded_ids]
+    else:
+        edge_ts = min(_parse_ts(i['published_at']) for i in items)
+        covered = [i for i in items if _parse_ts(i['published_at']) == edge_ts]
+    edge = next(i for i in items if _parse_ts(i['published_at']) == edge_ts)
+    last_ids = [i['id'] for i in covered]
+    if resume and resume['published_at'] == edge['published_at']:
+        last_ids = list(dict.fromkeys(resume.get('last_ids', []) + last_ids))
+    return {'watermark': watermark,
+            'resume': {'published_at': edge['published_at'], 'last_ids': last_ids, 'target': target}}
+
+
+def _region_cursors(state, area):
+    """(watermark, resume) региона."""
+    region_state = state["regions"].get(str(area)) or {}
+    return region_state.get('watermark'), region_state.get('resume')
+
+
+async def _collect(regions, state, per_page, max_pages, checkpoint_path, fetcher_kwargs):
+    async with HHFetcher(checkpoint_path=checkpoint_path, **fetcher_kwargs) as fetcher:
+        per_region = await asyncio.gather(*[
+            fetch_new_items(fetcher, str(area), *_region_cursors(state, area), per_page=per_page, max_pages=max_pages)
+            for area in regions
+        ])
+        ids = list(dict.fromkeys(item['id'] for items, _ in per_region for item in items))
+        df = await fetcher.fetch_full_vacancies(ids)
+    return per_region, df
+
+
+def run_incremental(regions, db_path=DB_PATH, state_path=STATE_PATH, parquet_root=RAW_PARQUET_ROOT,
+                    per_page=100, max_pages=20, checkpoint_path=CHECKPOINT_PATH, **fetcher_kwargs):
+    """
+    Загружает только новые/изменённые вакансии по регионам: дописывает их в Parquet
+    (партиции по дате и региону), обновляет базу и сдвигает watermark'и.
+    """
+    state = load_state(state_path)
+    per_region, df = asyncio.run(
+        _collect(regions, state, per_page, max_pages, checkpoint_path, fetcher_kwargs)
+    )
+    for area, (items, complete) in zip(regions, per_region):
+        print(f"area_id={area}: новых или изменённых вакансий {len(items)}"
+              + ("" if complete else " (список прочитан не до конца, остаток — в следующий запуск)"))
+
+    loaded_ids = set()
+    if not df.empty:
+        append_parquet(df, parquet_root)
+        con = connect_writer(db_path)
+        load_vacancies(con, df, update_existing=True)
+        preprocess_pending(con)
+        con.close()
+        loaded_ids = set(df['id'].astype(str))
+
+    # watermark сдвигаем только после того, как данные сохранены
+    for area, (items, complete) in zip(regions, per_region):
+        watermark, resume = _region_cursors(state, area)
+        state["regions"][str(area)] = advance_state(
+            {'watermark': watermark, 'resume': resume}, items, complete, loaded_ids)
+    save_state(state, state_path)
+    Path(checkpoint_path).unlink(missing_ok=True)
+    return df
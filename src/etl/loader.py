@@ -0,0 +1,135 @@
+import time
+import pandas as pd
+
+from hh_database import bump_data_version
+from market_cube import refresh_skill_cube, remove_from_skill_cube
+from title_index import refresh_title_index
+
+VACANCY_COLS = ['id', 'title', 'published_at', 'description', 'salary_from', 'salary_to',
+                'salary_currency', 'experience_hh', 'area_id', 'skills_raw', 'employer']
+
+# Таблицы, построчно посчитанные по vacancy (ключ id): при перезаписи вакансии их строки удаляются
+DERIVED_TABLES = ('vacancy_proc', 'vacancy_pred', 'vacancy_emb')
+
+
+def _delete_existing(con, refresh_derived):
+    """Удаляет из базы вакансии пачки, которые уже были загружены раньше."""
+    old_ids = [r[0] for r in con.execute("""
+        SELECT DISTINCT CAST(v.id AS BIGINT) FROM vacancy v
+        WHERE CAST(v.id AS BIGINT) IN (SELECT CAST(id AS BIGINT) FROM _staged_vacancy)
+    """).fetchall()]
+    if not old_ids:
+        return 0
+    if refresh_derived:
+        remove_from_skill_cube(con, old_ids)
+    con.register('_old_vacancy_ids', pd.DataFrame({'id': old_ids}))
+    try:
+        con.execute("DELETE FROM vacancy_skill WHERE vacancy_id IN (SELECT id FROM _old_vacancy_ids)")
+        con.execute("DELETE FROM vacancy WHERE CAST(id AS BIGINT) IN (SELECT id FROM _old_vacancy_ids)")
+        # Производные строки пересчитаются по новой версии вакансии: vacancy_proc — preprocess.py,
+        # прогнозы и эмбеддинги — src/bot/batch_score.py и vector_store.py (досчитывают отсутствующие)
+        existing = {r[0] for r in con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+        for table in DERIVED_TABLES:
+            if table in existing:
+                con.execute(f"DELETE FROM {table} WHERE CAST(id AS BIGINT) IN (SELECT id FROM _old_vacancy_ids)")
+    finally:
+        con.unregister('_old_vacancy_ids')
+    return len(old_ids)
+
+
+def load_vacancies(con, vacancies, refresh_derived=True, update_existing=False) -> dict:
+    """
+    Множественная загрузка пачки вакансий в DuckDB (vacancy, skill, vacancy_skill).
+
+    vacancies — pandas DataFrame или pyarrow Table с колонками VACANCY_COLS.
+    Пачка регистрируется как relation, а вставки делаются set-based запросами
+    (INSERT ... SELECT с anti-join по уже существующим записям) в одной транзакции.
+    Если refresh_derived — в той же транзакции обновляются куб навыков и индекс названий.
+    Если update_existing — уже загруженные вакансии из пачки перезаписываются
+    (для изменённых/переопубликованных вакансий в инкрементальной загрузке).
+    Возвращает статистику загрузки (строки и строки/с).
+    """
+    t0 = time.perf_counter()
+    if isinstance(vacancies, pd.DataFrame):
+        vacancies = vacancies.reindex(columns=VACANCY_COLS)
+    con.register('_staged_vacancy', vacancies)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        n_updated = 0
+        if update_existing:
+            n_updated = _delete_existing(con, refresh_derived)
+
+        # 1. Новые вакансии: дубли внутри пачки и уже загруженные id отбрасываем
+        con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _new_vacancy AS
+        SELECT {', '.join(VACANCY_COLS)}
+        FROM _staged_vacancy s
+        WHERE s.id IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM vacancy v WHERE CAST(v.id AS BIGINT) = CAST(s.id AS BIGINT)
+          )
+        QUALIFY row_number() OVER (PARTITION BY CAST(s.id AS BIGINT)) = 1
+        """)
+        n_vacancy = con.execute("SELECT COUNT(*) FROM _new_vacancy").fetchone()[0]
+        con.execute(f"INSERT INTO vacancy ({', '.join(VACANCY_COLS)}) SELECT * FROM _new_vacancy")
+
+        # 2. Пары вакансия-навык из skills_raw ("Python, SQL, ...")
+        con.execute("""
+        CREATE OR REPLACE TEMP TABLE _new_vacancy_skill AS
+        SELECT DISTINCT vacancy_id, skill_name FROM (
+            SELECT CAST(id AS BIGINT) AS vacancy_id,
+                   trim(unnest(string_split(skills_raw, ','))) AS skill_name
+            FROM _new_vacancy
+            WHERE skills_raw IS NOT NULL
+        )
+        WHERE skill_name <> ''
+        """)
+
+        # 3. Новые навыки в справочник — в нижнем регистре (в vacancy_skill название как в вакансии)
+        n_skill = con.execute("""
+        INSERT INTO skill (name)
+        SELECT DISTINCT lower(skill_name)
+        FROM _new_vacancy_skill ns
+        WHERE NOT EXISTS (SELECT 1 FROM skill s WHERE lower(s.name) = lower(ns.skill_name))
+        """).fetchone()[0]
+
+        # 4. Связи vacancy_skill
+        n_vacancy_skill = con.execute("""
+        INSERT INTO vacancy_skill (vacancy_id, skill_name)
+        SELECT ns.vacancy_id, ns.skill_name
+        FROM _new_vacancy_skill ns
+        WHERE NOT EXISTS (
+            SELECT 1 FROM vacancy_skill vs
+            WHERE vs.vacancy_id = ns.vacancy_id AND vs.skill_name = ns.skill_name
+        )
+        """).fetchone()[0]
+
+        new_ids = [r[0] for r in con.execute("SELECT CAST(id AS BIGINT) FROM _new_vacancy").fetchall()]
+        if refresh_derived:
+            refresh_skill_cube(con, new_ids)
+            refresh_title_index(con, new_ids)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister('_staged_vacancy')
+        con.execute("DROP TABLE IF EXISTS _new_vacancy")
+        con.execute("DROP TABLE IF EXISTS _new_vacancy_skill")
+    if n_vacancy or n_updated:
+        bump_data_version(con)
+
+    seconds = time.perf_counter() - t0
+    rows = n_vacancy + n_skill + n_vacancy_skill
+    stats = {
+        "vacancy": n_vacancy,
+        "updated": n_updated,
+        "skill": n_skill,
+        "vacancy_skill": n_vacancy_skill,
+        "new_ids": new_ids,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds) if seconds > 0 else None,
+    }
+    print(f"Загружено: вакансий {n_vacancy} (из них обновлено {n_updated}), новых навыков {n_skill}, "
+          f"связей {n_vacancy_skill} за {seconds:.2f} c ({stats['rows_per_sec']} строк/с)")
+    return stats
@@ -0,0 +1,207 @@
+import sys
+import pandas as pd
+
+from hh_database import DB_PATH, bump_data_version, connect_writer
+
+# Предагрегированный «куб» навыков для market_analytics:
+# навык × регион × опыт × токен названия -> частота и сумма/число зарплат.
+# Токен '' означает «любое название» (запрос без фильтра по профессии).
+# Рядом — число вакансий в тех же разрезах (без навыка): знаменатель для долей по грейдам.
+CUBE_TABLE = "skill_market_agg"
+VACANCY_CUBE_TABLE = "vacancy_market_agg"
+
+# Токенизация названия: нижний регистр, ё -> е, разбиение по всему, кроме букв/цифр/+/#;
+# у токенов длиннее 4 символов отрезается окончание («водителя», «водители» -> «водител»).
+# Запрос по одному слову ищется точным совпадением токена: при поиске по префиксу вакансия
+# попадала в сумму по разу на каждый подходящий токен («Java / JavaScript» — дважды).
+# Должна совпадать с market_analytics._title_tokens
+TITLE_ENDINGS = 'ами|ями|ого|его|ому|ему|ыми|ими|ов|ев|ей|ом|ем|ах|ях|ия|ие|ий|ый|ой|ая|яя|ое|ее|ые|а|я|ы|и|у|ю|е|о|ь|й'
+TITLE_TOKENS_SQL = (
+    "list_distinct(list_transform(list_filter("
+    "regexp_split_to_array(replace(lower(v.title), 'ё', 'е'), '[^a-z0-9а-я+#]+'), "
+    "t -> t <> ''), "
+    f"t -> CASE WHEN length(t) > 4 THEN regexp_replace(t, '({TITLE_ENDINGS})$', '') ELSE t END)) || ['']"
+)
+# Версия токенизации: хранится комментарием таблиц куба; куб другой версии пересобирается
+CUBE_FORMAT = 'stem-v1'
+
+
+def _table_format(con, name):
+    """Комментарий таблицы (версия формата куба); False — таблицы нет."""
+    rows = con.execute(
+        "SELECT comment FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()", [name]
+    ).fetchall()
+    return rows[0][0] if rows else False
+
+
+def create_skill_cube(con) -> set:
+    """
+    Создаёт таблицы куба. Таблицу, которой не было или которая собрана в другом формате
+    токенов (CUBE_FORMAT), сразу заполняет по текущим вакансиям; возвращает имена таких таблиц.
+    """
+    formats = {table: _table_format(con, table) for table in (CUBE_TABLE, VACANCY_CUBE_TABLE)}
+    for table, fmt in formats.items():
+        if fmt is not False and fmt != CUBE_FORMAT:
+            con.execute(f"DROP TABLE {table}")
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {CUBE_TABLE} (
+        skill_name VARCHAR NOT NULL,
+        area_id BIGINT NOT NULL,
+        experience_hh VARCHAR NOT NULL,   -- '' если опыт не указан
+        title_token VARCHAR NOT NULL,     -- '' — все названия
+        freq BIGINT,                      -- вакансий с навыком
+        proc_freq BIGINT,                 -- из них есть строка в vacancy_proc
+        salary_sum DOUBLE,
+        salary_cnt BIGINT,
+        PRIMARY KEY (skill_name, area_id, experience_hh, title_token)
+    )
+    """)
+    con.execute(f"""
+    CREATE TABLE IF NOT EXISTS {VACANCY_CUBE_TABLE} (
+        area_id BIGINT NOT NULL,
+        experience_hh VARCHAR NOT NULL,
+        title_token VARCHAR NOT NULL,
+        vacancies BIGINT,
+        PRIMARY KEY (area_id, experience_hh, title_token)
+    )
+    """)
+    filled = set()
+    for table, delta_sql in ((CUBE_TABLE, _cube_delta_sql), (VACANCY_CUBE_TABLE, _vacancy_delta_sql)):
+        if formats[table] != CUBE_FORMAT:
+            con.execute(f"INSERT INTO {table} BY NAME {delta_sql()}")
+            con.execute(f"COMMENT ON TABLE {table} IS '{CUBE_FORMAT}'")
+            filled.add(table)
+    return filled
+
+
+def _vacancy_tokens_sql(id_filter=""):
+    return f"""
+    WITH vt AS (
+        SELECT
+            CAST(v.id AS BIGINT) AS id,
+            COALESCE(v.area_id, 0) AS area_id,
+            COALESCE(v.experience_hh, '') AS experience_hh,
+            vp.salary_rub,
+            vp.id IS NOT NULL AS has_proc,
+            unnest({TITLE_TOKENS_SQL}) AS title_token
+        FROM vacancy v
+        LEFT JOIN vacancy_proc vp ON v.id = vp.id
+        WHERE 1=1 {id_filter}
+    )"""
+
+
+def _cube_delta_sql(id_filter=""):
+    return f"""{_vacancy_tokens_sql(id_filter)}
+    SELECT
+        vs.skill_name,
+        vt.area_id,
+        vt.experience_hh,
+        vt.title_token,
+        COUNT(*) AS freq,
+        COUNT(*) FILTER (WHERE vt.has_proc) AS proc_freq,
+        SUM(vt.salary_rub) AS salary_sum,
+        COUNT(vt.salary_rub) AS salary_cnt
+    FROM vacancy_skill vs
+    JOIN vt ON vs.vacancy_id = vt.id
+    GROUP BY ALL
+    """
+
+
+def _vacancy_delta_sql(id_filter=""):
+    return f"""{_vacancy_tokens_sql(id_filter)}
+    SELECT area_id, experience_hh, title_token, COUNT(*) AS vacancies
+    FROM vt
+    GROUP BY ALL
+    """
+
+
+def rebuild_skill_cube(con):
+    """Полностью пересобирает куб по текущим vacancy / vacancy_proc / vacancy_skill."""
+    filled = create_skill_cube(con)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for table, delta_sql in ((CUBE_TABLE, _cube_delta_sql), (VACANCY_CUBE_TABLE, _vacancy_delta_sql)):
+            if table not in filled:
+                con.execute(f"DELETE FROM {table}")
+                con.execute(f"INSERT INTO {table} BY NAME {delta_sql()}")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return con.execute(f"SELECT COUNT(*) FROM {CUBE_TABLE}").fetchone()[0]
+
+
+def refresh_skill_cube(con, vacancy_ids):
+    """
+    Инкрементально добавляет в куб только что загруженные вакансии.
+    Вызывать ровно один раз для каждой новой вакансии (после вставки её навыков).
+    """
+    ids = [int(i) for i in vacancy_ids]
+    if not ids:
+        return 0
+    if _table_format(con, 'vacancy_proc') is False:
+        return 0  # куб считается по vacancy_proc; до первой предобработки его не ведём
+    filled = create_skill_cube(con)  # заполненные с нуля таблицы уже учитывают новые вакансии
+    con.register('_cube_new_ids', pd.DataFrame({'id': ids}))
+    try:
+        id_filter = "AND CAST(v.id AS BIGINT) IN (SELECT id FROM _cube_new_ids)"
+        if CUBE_TABLE not in filled:
+            con.execute(f"""
+            INSERT INTO {CUBE_TABLE} BY NAME {_cube_delta_sql(id_filter)}
+            ON CONFLICT DO UPDATE SET
+                freq = freq + EXCLUDED.freq,
+                proc_freq = proc_freq + EXCLUDED.proc_freq,
+                salary_sum = COALESCE(salary_sum, 0) + COALESCE(EXCLUDED.salary_sum, 0),
+                salary_cnt = salary_cnt + EXCLUDED.salary_cnt
+            """)
+        if VACANCY_CUBE_TABLE not in filled:
+            con.execute(f"""
+            INSERT INTO {VACANCY_CUBE_TABLE} BY NAME {_vacancy_delta_sql(id_filter)}
+            ON CONFLICT DO UPDATE SET vacancies = vacancies + EXCLUDED.vacancies
+            """)
+    finally:
+        con.unregister('_cube_new_ids')
+    return len(ids)
+
+
+def remove_from_skill_cube(con, vacancy_ids):
+    """
+    Вычитает из куба вклад уже загруженных вакансий (перед их обновлением или удалением).
+    Вызывать до изменения строк vacancy / vacancy_skill.
+    """
+    ids = [int(i) for i in vacancy_ids]
+    if not ids:
+        return 0
+    if _table_format(con, 'vacancy_proc') is False:
+        return 0  # куб считается по vacancy_proc; до первой предобработки его не ведём
+    create_skill_cube(con)
+    con.register('_cube_old_ids', pd.DataFrame({'id': ids}))
+    try:
+        id_filter = "AND CAST(v.id AS BIGINT) IN (SELECT id FROM _cube_old_ids)"
+        con.execute(f"""
+        INSERT INTO {CUBE_TABLE} BY NAME {_cube_delta_sql(id_filter)}
+        ON CONFLICT DO UPDATE SET
+            freq = freq - EXCLUDED.freq,
+            proc_freq = proc_freq - EXCLUDED.proc_freq,
+            salary_sum = COALESCE(salary_sum, 0) - COALESCE(EXCLUDED.salary_sum, 0),
+            salary_cnt = salary_cnt - EXCLUDED.salary_cnt
+        """)
+        con.execute(f"DELETE FROM {CUBE_TABLE} WHERE freq <= 0")
+        con.execute(f"""
+        INSERT INTO {VACANCY_CUBE_TABLE} BY NAME {_vacancy_delta_sql(id_filter)}
+        ON CONFLICT DO UPDATE SET vacancies = vacancies - EXCLUDED.vacancies
+        """)
+        con.execute(f"DELETE FROM {VACANCY_CUBE_TABLE} WHERE vacancies <= 0")
+    finally:
+        con.unregister('_cube_old_ids')
+    return len(ids)
+
+
+if __name__ == "__main__":
+    # Полная пересборка: python src/etl/market_cube.py [путь к базе]
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    con = connect_writer(db_path)
+    print(f"Строк в {CUBE_TABLE}: {rebuild_skill_cube(con)}")
+    print(f"Строк в {VACANCY_CUBE_TABLE}: {con.execute(f'SELECT COUNT(*) FROM {VACANCY_CUBE_TABLE}').fetchone()[0]}")
+    bump_data_version(con)  # новый снимок для бота
+    con.close()
@@ -0,0 +1,215 @@
+"""
+Предобработка вакансий в vacancy_proc: очистка HTML описаний, нормализация текста,
+зарплата в рублях, длины и число слов (то, что раньше делалось в 02_preprocessing.ipynb).
+
+    python src/etl/preprocess.py --db data/hh.duckdb_3000 --chunk 5000 --workers 4
+
+Необработанные вакансии (нет строки в vacancy_proc или она из ноутбука, без признаков)
+читаются из vacancy пачками по --chunk строк (по возрастанию id) и считаются в пуле процессов;
+в работе одновременно не больше 2 × --workers пачек, так что память не растёт с размером базы.
+Каждая пачка пишется в vacancy_proc отдельной транзакцией вместе с поправкой куба навыков,
+поэтому после обрыва повторный запуск продолжает с необработанных (--rebuild — пересчитать всё).
+"""
+import argparse
+import html
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from hh_database import DB_PATH, bump_data_version, connect_writer
+from loader import VACANCY_COLS
+from market_cube import CUBE_TABLE, refresh_skill_cube, remove_from_skill_cube
+from raw_store import PROC_PARQUET_ROOT, export_proc, export_proc_changes
+
+PROC_TABLE = 'vacancy_proc'
+PREPROCESS_CHUNK = int(os.getenv('PREPROCESS_CHUNK', 5000))
+PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', os.cpu_count() or 1))
+
+# Курсы валют к рублю (как в 02_preprocessing.ipynb); зарплата в неизвестной валюте — NULL
+CURRENCY_RATE = {'RUR': 1, 'KZT': 0.16, 'USD': 90, 'EUR': 98}
+
+# Колонки, которые стадия добавляет к колонкам vacancy
+PROC_COLS = {
+    'salary_rub': 'DOUBLE',
+    'description_clean': 'VARCHAR',
+    'desc_len': 'INTEGER',
+    'desc_words': 'INTEGER',
+    'title_len': 'INTEGER',
+    'num_skills': 'INTEGER',
+}
+
+# Блочные теги становятся переводами строк, остальные просто убираются
+_BLOCK_TAGS = r'<\s*/?\s*(?:p|br|li|ul|ol|div|h[1-6]|tr|table)\b[^>]*>'
+
+
+def clean_descriptions(descriptions: pd.Series) -> pd.Series:
+    """HTML описания -> текст: абзацы и пункты списков по строкам, сущности раскрыты, пробелы схлопнуты."""
+    text = descriptions.fillna('').astype(str)
+    text = text.str.replace(_BLOCK_TAGS, '\n', regex=True, case=False)
+    text = text.str.replace(r'<[^>]*>', '', regex=True)
+    text = text.map(html.unescape)
+    text = text.str.replace(r'[^\S\n]+', ' ', regex=True)       # пробелы, табы, nbsp
+    text = text.str.replace(r' ?\n[\s]*', '\n', regex=True)      # пустые строки и пробелы у переводов строк
+    return text.str.strip()
+
+
+def salary_to_rub(df: pd.DataFrame) -> pd.Series:
+    """Среднее вилки (или одна из границ) по курсу CURRENCY_RATE."""
+    bounds = df[['salary_from', 'salary_to']].apply(pd.to_numeric, errors='coerce')
+    return bounds.mean(axis=1, skipna=True) * df['salary_currency'].map(CURRENCY_RATE).astype(float)
+
+
+def preprocess_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Строки vacancy_proc для пачки вакансий (колонки VACANCY_COLS + PROC_COLS).
+
+    desc_len / desc_words / title_len / num_skills считаются так же, как в
+    model_inference.vacancies_to_features_frame (описание без тегов, без нормализации),
+    чтобы признаки обучения совпадали с признаками инференса.
+    """
+    out = df.reindex(columns=VACANCY_COLS).copy()
+    stripped = out['description'].fillna('').astype(str).str.replace(r'<.*?>', '', regex=True)
+    skills = out['skills_raw'].where(out['skills_raw'].map(lambda v: isinstance(v, str)), '')
+    out['salary_rub'] = salary_to_rub(out)
+    out['description_clean'] = clean_descriptions(out['description'])
+    out['desc_len'] = stripped.str.len()
+    out['desc_words'] = stripped.str.split().str.len().fillna(0).astype(int)
+    out['title_len'] = out['title'].fillna('').astype(str).str.len()
+    out['num_skills'] = skills.str.split(',').map(lambda parts: sum(1 for s in parts if s.strip()))
+    return out
+
+
+def create_proc_table(con):
+    """vacancy_proc с колонками vacancy; таблицу из ноутбука дополняет недостающими колонками."""
+    con.execute(f"CREATE TABLE IF NOT EXISTS {PROC_TABLE} AS SELECT * FROM vacancy LIMIT 0")
+    for column, sql_type in PROC_COLS.items():
+        con.execute(f"ALTER TABLE {PROC_TABLE} ADD COLUMN IF NOT EXISTS {column} {sql_type}")
+
+
+def _has_table(con, name):
+    return con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()", [name]
+    ).fetchone()[0] > 0
+
+
+def iter_unprocessed(con, chunk_size, limit=None, everything=False):
+    """
+    Пачки вакансий без строки в vacancy_proc или со строкой без признаков
+    (everything — все вакансии), keyset-пагинация по id.
+    """
+    last_id, total = None, 0
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        df = con.execute(f"""
+            SELECT CAST(v.id AS BIGINT) AS id, {', '.join(f'v.{c}' for c in VACANCY_COLS[1:])}
+            FROM vacancy v
+            LEFT JOIN {PROC_TABLE} vp ON CAST(vp.id AS BIGINT) = CAST(v.id AS BIGINT)
+            WHERE (? IS NULL OR CAST(v.id AS BIGINT) > ?)
+              AND (? OR vp.id IS NULL OR vp.desc_len IS NULL)
+            ORDER BY 1
+            LIMIT ?
+        """, [last_id, last_id, everything, size]).df()
+        if df.empty:
+            return
+        last_id = int(df['id'].iloc[-1])
+        total += len(df)
+        yield df
+
+
+def write_proc(con, proc: pd.DataFrame) -> int:
+    """
+    Пишет пачку в vacancy_proc одной транзакцией. Куб навыков учитывает строки vacancy_proc
+    (proc_freq, зарплаты), поэтому вклад этих вакансий в куб пересчитывается тут же.
+    """
+    if proc.empty:
+        return 0
+    ids = proc['id'].astype('int64').tolist()
+    maintain_cube = _has_table(con, CUBE_TABLE)
+    con.register('_staged_proc', proc)
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if maintain_cube:
+            remove_from_skill_cube(con, ids)
+        con.execute(f"""
+            DELETE FROM {PROC_TABLE}
+            WHERE CAST(id AS BIGINT) IN (SELECT CAST(id AS BIGINT) FROM _staged_proc)
+        """)
+        con.execute(f"INSERT INTO {PROC_TABLE} BY NAME SELECT * FROM _staged_proc")
+        if maintain_cube:
+            refresh_skill_cube(con, ids)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister('_staged_proc')
+    return len(proc)
+
+
+def preprocess_pending(con, chunk_size=PREPROCESS_CHUNK, workers=PREPROCESS_WORKERS, limit=None,
+                       rebuild=False, parquet_root=PROC_PARQUET_ROOT) -> dict:
+    """
+    Обрабатывает все вакансии, которых ещё нет в vacancy_proc, и (parquet_root) выгружает
+    новый Parquet-снимок vacancy_proc для market_analytics: заново пишутся только партиции
+    area_id/month с обработанными вакансиями. Возвращает статистику.
+    """
+    create_proc_table(con)
+    t0 = time.perf_counter()
+    done = 0
+    written_ids = []
+
+    def write(proc):
+        written_ids.extend(proc['id'].astype('int64').tolist())
+        return write_proc(con, proc)
+
+    # rebuild перезаписывает строки по пачкам, а не удаляет таблицу: вклад старых строк
+    # в куб навыков вычитается перед перезаписью каждой пачки
+    chunks = iter_unprocessed(con, chunk_size, limit, everything=rebuild)
+    if workers <= 1:
+        for df in chunks:
+            done += write(preprocess_chunk(df))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            pending = set()
+            for df in chunks:
+                pending.add(pool.submit(preprocess_chunk, df))
+                if len(pending) < 2 * workers:
+                    continue
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    done += write(fut.result())
+            for fut in pending:
+                done += write(fut.result())
+    if done and parquet_root:
+        # Снимок целиком — только при пересчёте всех строк; иначе перезаписываются изменённые партиции
+        if rebuild:
+            export_proc(con, parquet_root)
+        else:
+            export_proc_changes(con, written_ids, parquet_root)
+    if done:
+        bump_data_version(con)
+    seconds = time.perf_counter() - t0
+    stats = {"processed": done, "seconds": round(seconds, 3),
+             "rows_per_sec": round(done / seconds) if seconds > 0 else None}
+    print(f"vacancy_proc: обработано {done} вакансий за {seconds:.2f} c ({stats['rows_per_sec']} в секунду)")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Очистка описаний и признаки вакансий в vacancy_proc")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--chunk', type=int, default=PREPROCESS_CHUNK, help="вакансий в пачке")
+    parser.add_argument('--workers', type=int, default=PREPROCESS_WORKERS, help="процессов (1 — без пула)")
+    parser.add_argument('--limit', type=int, default=None, help="не больше стольких вакансий за запуск")
+    parser.add_argument('--rebuild', action='store_true', help="пересчитать все строки vacancy_proc")
+    parser.add_argument('--parquet-root', default=PROC_PARQUET_ROOT, help="куда выгружать снимок ('' — не выгружать)")
+    args = parser.parse_args()
+
+    con = connect_writer(args.db)
+    try:
+        preprocess_pending(con, chunk_size=args.chunk, workers=args.workers, limit=args.limit, rebuild=args.rebuild,
+                           parquet_root=args.parquet_root or None)
+    finally:
+        con.close()
@@ -0,0 +1,239 @@
+"""
+Parquet-хранилище вакансий (zstd, партиции по региону и месяцу публикации).
+
+    python src/etl/raw_store.py compact                       # сырые: слить дописанные файлы по партициям
+    python src/etl/raw_store.py export-proc --db data/hh.duckdb_3000   # снимок vacancy_proc для бота
+
+Сырые вакансии дописываются новыми файлами:
+    data/raw/vacancies/area_id=1/month=2025-05/part-....parquet
+Обработанные (vacancy_proc) выгружаются снимками, чтобы бот никогда не видел наполовину
+записанную выгрузку; после предобработки в новом снимке перезаписываются только партиции
+с изменёнными вакансиями, остальные файлы — жёсткие ссылки на предыдущий снимок:
+    data/proc/vacancies/snapshot-.../area_id=1/month=2025-05/data_0.parquet
+    data/proc/vacancies/CURRENT  — имя текущего снимка
+market_analytics читает снимок через read_parquet и по area_id открывает только файлы региона.
+"""
+import argparse
+import os
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+RAW_PARQUET_ROOT = "data/raw/vacancies"
+PROC_PARQUET_ROOT = os.getenv('PROC_PARQUET_ROOT', "data/proc/vacancies")
+PARQUET_COMPRESSION = os.getenv('PARQUET_COMPRESSION', 'zstd')
+CURRENT_FILE = 'CURRENT'
+KEEP_SNAPSHOTS = 2  # предыдущий снимок остаётся для запросов, начатых до переключения
+
+RAW_DTYPES = {
+    'id': 'int64',
+    'title': 'string',
+    'published_at': 'string',
+    'description': 'string',
+    'salary_from': 'float64',
+    'salary_to': 'float64',
+    'salary_currency': 'string',
+    'experience_hh': 'string',
+    'area_id': 'int64',
+    'skills_raw': 'string',
+    'employer': 'string',
+}
+
+# Месяц публикации из published_at ('2025-05-19T10:00:00+0300' -> '2025-05')
+MONTH_SQL = "COALESCE(substr(CAST(published_at AS VARCHAR), 1, 7), 'unknown')"
+
+
+def _sql_path(path) -> str:
+    return str(path).replace("'", "''")
+
+
+def append_parquet(df, root=RAW_PARQUET_ROOT):
+    """Дописывает вакансии новыми файлами в партиции area_id/month. Старые файлы не трогает."""
+    if df is None or df.empty:
+        return []
+    df = df.reindex(columns=list(RAW_DTYPES)).astype(RAW_DTYPES)
+    month = df['published_at'].str.slice(0, 7).fillna('unknown')
+    batch = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+    written = []
+    for (area_id, part_month), part in df.groupby([df['area_id'], month]):
+        part_dir = Path(root) / f"area_id={area_id}" / f"month={part_month}"
+        part_dir.mkdir(parents=True, exist_ok=True)
+        path = part_dir / f"part-{batch}.parquet"
+        part.to_parquet(path, index=False, compression=PARQUET_COMPRESSION)
+        written.append(str(path))
+    return written
+
+
+def read_parquet(root=RAW_PARQUET_ROOT):
+    """Все сырые вакансии из Parquet-хранилища (для ноутбуков и пересборки базы)."""
+    if not Path(root).exists():
+        return pd.DataFrame(columns=list(RAW_DTYPES))
+    # Партиции только для навигации по файлам: area_id уже есть в самих файлах
+    return pd.read_parquet(root, partitioning=None, columns=list(RAW_DTYPES)).astype(RAW_DTYPES)
+
+
+def compact_raw(root=RAW_PARQUET_ROOT) -> dict:
+    """
+    Переписывает сырое хранилище по одному файлу на партицию area_id/month (zstd);
+    читает потоково через DuckDB.
+    """
+    if not Path(root).exists():
+        return {"files_before": 0, "files": 0, "bytes_before": 0, "bytes_after": 0}
+    files_before = list(Path(root).rglob('*.parquet'))
+    bytes_before = sum(p.stat().st_size for p in files_before)
+    tmp_root = f"{root}.compact"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    con = duckdb.connect()
+    try:
+        con.execute(f"""
+            COPY (
+                SELECT {', '.join(RAW_DTYPES)}, {MONTH_SQL} AS month
+                FROM read_parquet('{_sql_path(root)}/**/*.parquet', hive_partitioning = false, union_by_name = true)
+            ) TO '{_sql_path(tmp_root)}'
+            (FORMAT parquet, COMPRESSION {PARQUET_COMPRESSION}, PARTITION_BY (area_id, month),
+             WRITE_PARTITION_COLUMNS true, FILENAME_PATTERN 'part-compact-{{i}}')
+        """)
+    finally:
+        con.close()
+    old_root = f"{root}.old"
+    os.replace(root, old_root)
+    os.replace(tmp_root, root)
+    shutil.rmtree(old_root)
+    after = list(Path(root).rglob('*.parquet'))
+    return {"files_before": len(files_before), "files": len(after),
+            "bytes_before": bytes_before, "bytes_after": sum(p.stat().st_size for p in after)}
+
+
+def current_snapshot(root=PROC_PARQUET_ROOT):
+    """Каталог текущего снимка vacancy_proc (None — выгрузки ещё не было)."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(root, name) if name else None
+
+
+def _proc_columns_sql(con) -> str:
+    """Колонки vacancy_proc для выгрузки: без сырого HTML description (для аналитики есть description_clean)."""
+    columns = [r[0] for r in con.execute("DESCRIBE vacancy_proc").fetchall()]
+    exclude = "EXCLUDE (description)" if 'description' in columns else ""
+    return f"* {exclude}, {MONTH_SQL} AS month"
+
+
+def _publish_snapshot(root, name, keep) -> dict:
+    """Переключает CURRENT на записанный снимок name и удаляет снимки старше keep последних."""
+    with open(os.path.join(root, f"{CURRENT_FILE}.tmp"), 'w') as f:
+        f.write(name)
+    os.replace(os.path.join(root, f"{CURRENT_FILE}.tmp"), os.path.join(root, CURRENT_FILE))
+
+    snapshots = sorted(p for p in os.listdir(root) if p.startswith('snapshot-'))
+    for old in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    files = list(Path(root, name).rglob('*.parquet'))
+    return {"snapshot": name, "files": len(files), "bytes": sum(p.stat().st_size for p in files)}
+
+
+def _new_snapshot(root):
+    os.makedirs(root, exist_ok=True)
+    name = f"snapshot-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+    return name, os.path.join(root, name)
+
+
+def export_proc(con, root=PROC_PARQUET_ROOT, keep=KEEP_SNAPSHOTS) -> dict:
+    """
+    Выгружает vacancy_proc целиком новым снимком (zstd, партиции area_id/month) и переключает
+    на него CURRENT. Полная выгрузка — для первого снимка и пересчёта (preprocess --rebuild);
+    после обычной предобработки достаточно export_proc_changes.
+    """
+    name, path = _new_snapshot(root)
+    con.execute(f"""
+        COPY (SELECT {_proc_columns_sql(con)} FROM vacancy_proc)
+        TO '{_sql_path(path)}'
+        (FORMAT parquet, COMPRESSION {PARQUET_COMPRESSION}, PARTITION_BY (area_id, month))
+    """)
+    return _publish_snapshot(root, name, keep)
+
+
+def export_proc_changes(con, vacancy_ids, root=PROC_PARQUET_ROOT, keep=KEEP_SNAPSHOTS) -> dict:
+    """
+    Новый снимок, в котором заново выгружены только партиции area_id/month с вакансиями
+    vacancy_ids — где они лежат сейчас и где лежали в текущем снимке. Файлы остальных партиций
+    берутся из текущего снимка жёсткими ссылками, без копирования. Без текущего снимка — export_proc.
+    """
+    current = current_snapshot(root)
+    if current is None or not os.path.isdir(current):
+        return export_proc(con, root, keep)
+    con.register('_export_ids', pd.DataFrame({'id': [int(i) for i in vacancy_ids]}))
+    try:
+        changed = con.execute(f"""
+            SELECT DISTINCT CAST(area_id AS BIGINT), {MONTH_SQL}
+            FROM vacancy_proc WHERE CAST(id AS BIGINT) IN (SELECT id FROM _export_ids)
+        """).fetchall()
+        if any(Path(current).rglob('*.parquet')):
+            pattern = _sql_path(os.path.join(current, '*', '*', '*.parquet'))
+            changed += con.execute(f"""
+                SELECT DISTINCT area_id, month
+                FROM read_parquet('{pattern}', hive_partitioning = true,
+                                  hive_types = {{'area_id': BIGINT, 'month': VARCHAR}})
+                WHERE CAST(id AS BIGINT) IN (SELECT id FROM _export_ids)
+            """).fetchall()
+    finally:
+        con.unregister('_export_ids')
+    changed = {(int(area_id), str(month)) for area_id, month in changed}
+
+    name, path = _new_snapshot(root)
+    os.makedirs(path)
+    for part_dir in Path(current).glob('area_id=*/month=*'):
+        area_id, month = part_dir.parent.name.split('=', 1)[1], part_dir.name.split('=', 1)[1]
+        if (int(area_id), month) in changed:
+            continue
+        target = Path(path, part_dir.parent.name, part_dir.name)
+        target.mkdir(parents=True)
+        for file in part_dir.iterdir():
+            try:
+                os.link(file, target / file.name)
+            except OSError:  # ФС без жёстких ссылок
+                shutil.copy2(file, target / file.name)
+    if changed:
+        con.register('_export_parts', pd.DataFrame(sorted(changed), columns=['area_id', 'month']))
+        try:
+            con.execute(f"""
+                COPY (
+                    SELECT p.* FROM (SELECT {_proc_columns_sql(con)} FROM vacancy_proc) p
+                    SEMI JOIN _export_parts c ON CAST(p.area_id AS BIGINT) = c.area_id AND p.month = c.month
+                ) TO '{_sql_path(path)}'
+                (FORMAT parquet, COMPRESSION {PARQUET_COMPRESSION}, PARTITION_BY (area_id, month),
+                 OVERWRITE_OR_IGNORE true)
+            """)
+        finally:
+            con.unregister('_export_parts')
+    stats = _publish_snapshot(root, name, keep)
+    stats["partitions_written"] = len(changed)
+    return stats
+
+
+if __name__ == "__main__":
+    from hh_database import DB_PATH, connect_writer
+
+    parser = argparse.ArgumentParser(description="Parquet-хранилище вакансий")
+    sub = parser.add_subparsers(dest='command', required=True)
+    compact = sub.add_parser('compact', help="переписать сырые вакансии по партициям area_id/month")
+    compact.add_argument('--root', default=RAW_PARQUET_ROOT)
+    export = sub.add_parser('export-proc', help="выгрузить vacancy_proc снимком для market_analytics")
+    export.add_argument('--db', default=DB_PATH)
+    export.add_argument('--root', default=PROC_PARQUET_ROOT)
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        print(compact_raw(args.root))
+    else:
+        con = connect_writer(args.db)
+        try:
+            print(export_proc(con, args.root))
+        finally:
+            con.close()
@@ -0,0 +1,65 @@
+import sys
+import pandas as pd
+
+from hh_database import DB_PATH, bump_data_version, connect_writer
+
+# Триграммный инвертированный индекс title_trigram(trigram, vacancy_id) по названиям вакансий
+# для поиска по подстроке без полного скана (города ищет бот в памяти, src/bot/city_resolver.py).
+# Запрос LOWER(col) LIKE '%term%' заменяется на «все триграммы term есть у записи»
+# + проверку LIKE только на найденных кандидатах (см. market_analytics._title_filter).
+
+def _trigrams_sql(col):
+    # Триграммы строки в нижнем регистре (без повторов); для строк короче 3 символов — пусто
+    return f"unnest(list_distinct(list_transform(range(1, length(lower({col})) - 1), i -> substr(lower({col}), i, 3))))"
+
+
+def create_title_index(con):
+    con.execute("CREATE TABLE IF NOT EXISTS title_trigram (trigram VARCHAR, vacancy_id BIGINT)")
+    con.execute("CREATE INDEX IF NOT EXISTS title_trigram_idx ON title_trigram (trigram)")
+
+
+def rebuild_title_index(con):
+    """Полная пересборка индекса по всей таблице vacancy."""
+    con.execute("DROP TABLE IF EXISTS title_trigram")
+    # Сортировка по триграмме — чтобы зонмапы DuckDB отсекали лишние блоки
+    con.execute(f"""
+    CREATE TABLE title_trigram AS
+    SELECT trigram, vacancy_id FROM (
+        SELECT CAST(v.id AS BIGINT) AS vacancy_id, {_trigrams_sql('v.title')} AS trigram
+        FROM vacancy v
+    )
+    ORDER BY trigram
+    """)
+    create_title_index(con)
+    return con.execute("SELECT COUNT(*) FROM title_trigram").fetchone()[0]
+
+
+def refresh_title_index(con, vacancy_ids):
+    """Добавляет в индекс только что загруженные вакансии."""
+    ids = [int(i) for i in vacancy_ids]
+    if not ids:
+        return 0
+    create_title_index(con)
+    con.register('_title_new_ids', pd.DataFrame({'id': ids}))
+    try:
+        con.execute("DELETE FROM title_trigram WHERE vacancy_id IN (SELECT id FROM _title_new_ids)")
+        con.execute(f"""
+        INSERT INTO title_trigram
+        SELECT trigram, vacancy_id FROM (
+            SELECT CAST(v.id AS BIGINT) AS vacancy_id, {_trigrams_sql('v.title')} AS trigram
+            FROM vacancy v
+            WHERE CAST(v.id AS BIGINT) IN (SELECT id FROM _title_new_ids)
+        )
+        """)
+    finally:
+        con.unregister('_title_new_ids')
+    return len(ids)
+
+
+if __name__ == "__main__":
+    # Полная пересборка: python src/etl/title_index.py [путь к базе]
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    con = connect_writer(db_path)
+    print(f"title_trigram: {rebuild_title_index(con)} строк")
+    bump_data_version(con)  # новый снимок для бота
+    con.close()
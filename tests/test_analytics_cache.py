@@ -0,0 +1,80 @@
+"""
+Кэш аналитики сбрасывается, когда ETL (в другом процессе, пока бот работает) увеличивает
+версию данных. Запуск: python -m pytest tests
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+for sub in ('bot', 'etl', 'bench'):
+    sys.path.insert(0, os.path.join(ROOT, 'src', sub))
+
+import market_analytics  # noqa: E402
+from hh_database import connect_writer  # noqa: E402
+from loader import load_vacancies  # noqa: E402
+from preprocess import preprocess_pending  # noqa: E402
+from synthetic import create_schema, generate_vacancies  # noqa: E402
+
+
+@pytest.fixture
+def analytics(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'hh.duckdb')
+    con = connect_writer(db_path)
+    create_schema(con)
+    load_vacancies(con, generate_vacancies(300, seed=1, start_id=1_000_000))
+    preprocess_pending(con, workers=1, parquet_root=None)
+    con.close()
+    monkeypatch.setattr(market_analytics, 'DB_PATH', db_path)
+    monkeypatch.setattr(market_analytics, 'pool', None)
+    market_analytics._existing_tables.clear()
+    market_analytics.analytics_cache.clear()
+    yield db_path
+    market_analytics.get_pool().close()
+    market_analytics.pool = None
+
+
+def run_etl(db_path, *statements):
+    """Отдельный процесс-«ETL»: выполняет statements и увеличивает версию данных."""
+    code = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {os.path.join(ROOT, 'src', 'etl')!r})
+        from hh_database import bump_data_version, connect_writer
+        con = connect_writer({db_path!r})
+        for sql in {list(statements)!r}:
+            con.execute(sql)
+        bump_data_version(con)
+        con.close()
+    """)
+    subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+
+
+def test_version_bump_invalidates_cache(analytics):
+    cache = market_analytics.analytics_cache
+    first = market_analytics.top_5_skills()
+    market_analytics.top_5_skills()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    run_etl(analytics, "UPDATE vacancy_proc SET salary_rub = salary_rub * 2")
+
+    after = market_analytics.top_5_skills()
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert list(after['skill_name']) == list(first['skill_name'])
+    assert list(after['mean_salary']) == pytest.approx([2 * s for s in first['mean_salary']], rel=1e-3)
+
+
+def test_tables_are_rechecked_after_version_bump(analytics):
+    assert market_analytics._table_exists('cities')
+
+    run_etl(analytics, "DROP TABLE cities")
+    assert not market_analytics._table_exists('cities')
+    assert market_analytics._load_cities() == []
+
+    run_etl(analytics, "CREATE TABLE cities (area_id BIGINT, area_name VARCHAR, parent_area VARCHAR)",
+            "INSERT INTO cities VALUES (999999, 'Тестоград', NULL)")
+    assert market_analytics._table_exists('cities')
+    market_analytics.city_resolver.refresh(force=True)
+    assert market_analytics.get_area_id_by_city('тестоград') == 999999
@@ -0,0 +1,90 @@
+"""
+compare_vacancy_to_market против исходной реализации: навыки рынка считаются по всем
+вакансиям из vacancy, в том числе ещё не предобработанным. Запуск: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+for sub in ('bot', 'etl', 'bench'):
+    sys.path.insert(0, os.path.join(ROOT, 'src', sub))
+
+import market_analytics  # noqa: E402
+from hh_database import connect_writer  # noqa: E402
+from loader import load_vacancies  # noqa: E402
+from preprocess import preprocess_pending  # noqa: E402
+from synthetic import create_schema, generate_vacancies  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'hh.duckdb')
+    con = connect_writer(path)
+    create_schema(con)
+    load_vacancies(con, generate_vacancies(300, seed=1, start_id=1_000_000))
+    preprocess_pending(con, workers=1, parquet_root=None)
+    load_vacancies(con, generate_vacancies(300, seed=2, start_id=2_000_000))  # без предобработки
+    con.close()
+    monkeypatch.setattr(market_analytics, 'DB_PATH', path)
+    monkeypatch.setattr(market_analytics, 'pool', None)
+    market_analytics._existing_tables.clear()
+    market_analytics.analytics_cache.clear()
+    yield path
+    market_analytics.get_pool().close()
+    market_analytics.pool = None
+
+
+def baseline_market(db_path, title, area_id, experience_hh):
+    """Запросы исходной compare_vacancy_to_market: (медиана зарплаты, частоты навыков)."""
+    con = connect_writer(db_path)
+    try:
+        params = [area_id, experience_hh, f"%{title.lower()}%"]
+        df_market = con.execute("""
+        SELECT v.id, v.title, v.area_id, v.experience_hh, vp.salary_rub
+        FROM vacancy v
+        JOIN vacancy_proc vp ON v.id = vp.id
+        WHERE v.area_id = ?
+          AND v.experience_hh = ?
+          AND LOWER(v.title) LIKE ?
+          AND vp.salary_rub IS NOT NULL
+        """, params).fetchdf()
+        skills_df = con.execute("""
+        SELECT vs.skill_name
+        FROM vacancy_skill vs
+        WHERE vs.vacancy_id IN (
+            SELECT CAST(v.id AS BIGINT)
+            FROM vacancy v
+            WHERE v.area_id = ?
+              AND v.experience_hh = ?
+              AND LOWER(v.title) LIKE ?
+        )
+        """, params).fetchdf()
+    finally:
+        con.close()
+    return df_market['salary_rub'].median(), skills_df['skill_name'].value_counts().to_dict()
+
+
+def most_common_market(db_path):
+    con = connect_writer(db_path)
+    try:
+        return con.execute("""
+            SELECT area_id, experience_hh FROM vacancy GROUP BY 1, 2 ORDER BY COUNT(*) DESC, 1, 2 LIMIT 1
+        """).fetchone()
+    finally:
+        con.close()
+
+
+def test_market_matches_baseline(db_path):
+    area_id, experience_hh = most_common_market(db_path)
+    title = 'разработчик'
+    median, skill_counts = baseline_market(db_path, title, area_id, experience_hh)
+    assert skill_counts
+
+    report = market_analytics.compare_vacancy_to_market({
+        'title': title, 'area_id': area_id, 'experience_hh': experience_hh, 'skills': [],
+    }, top_n=len(skill_counts))
+    assert report['median'] == pytest.approx(median)
+    counts = {name.lower(): round(share * report['vacancies']) for name, share in report['top_skills']}
+    assert counts == {name.lower(): n for name, n in skill_counts.items()}
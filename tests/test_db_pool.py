@@ -0,0 +1,88 @@
+"""
+Пул бота и снимки базы: ETL пишет в базу из другого процесса, пока бот читает,
+а пул переключается на снимок новой версии. Запуск: python -m pytest tests
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'src', 'bot'))
+
+from db_pool import ConnectionPool, open_writer, read_data_version  # noqa: E402
+
+
+def etl_insert(db_path, n):
+    """Отдельный процесс-«ETL»: дописывает n строк в t и публикует новую версию."""
+    code = textwrap.dedent(f"""
+        import sys
+        sys.path.insert(0, {os.path.join(ROOT, 'src', 'etl')!r})
+        from hh_database import bump_data_version, connect_writer
+        con = connect_writer({db_path!r})
+        con.execute("INSERT INTO t SELECT range FROM range({n})")
+        bump_data_version(con)
+        con.close()
+    """)
+    subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'hh.duckdb')
+    con = open_writer(path)
+    con.execute("CREATE TABLE t (x INTEGER)")
+    con.close()
+    return path
+
+
+def count(pool):
+    with pool.acquire() as cur:
+        return cur.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_etl_writes_while_bot_reads(db_path):
+    etl_insert(db_path, 1)
+    pool = ConnectionPool(db_path, size=2)
+    try:
+        assert count(pool) == 1
+        assert pool.path == f"{db_path}.v1"
+        etl_insert(db_path, 2)  # без снимков здесь был бы «Conflicting lock»
+        assert read_data_version(db_path) == 2
+        assert count(pool) == 3
+        assert pool.path == f"{db_path}.v2"
+        assert pool.stats()["reopened"] == 1
+    finally:
+        pool.close()
+
+
+def test_cursor_in_use_survives_switch(db_path):
+    etl_insert(db_path, 1)
+    pool = ConnectionPool(db_path, size=1)
+    try:
+        with pool.acquire() as old:
+            etl_insert(db_path, 1)
+            assert count(pool) == 2        # новый снимок, хотя единственный старый курсор занят
+            assert old.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
+        assert pool.stats()["in_use"] == 0
+        assert count(pool) == 2
+    finally:
+        pool.close()
+
+
+def test_old_snapshots_are_removed(db_path):
+    for _ in range(3):
+        etl_insert(db_path, 1)
+    snapshots = sorted(p for p in os.listdir(os.path.dirname(db_path)) if '.v' in p and not p.endswith('.version'))
+    assert snapshots == ['hh.duckdb.v2', 'hh.duckdb.v3']
+
+
+def test_without_snapshot_reads_database(db_path):
+    pool = ConnectionPool(db_path)
+    try:
+        assert count(pool) == 0
+        assert pool.path == db_path
+    finally:
+        pool.close()
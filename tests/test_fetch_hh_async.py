@@ -0,0 +1,167 @@
+"""
+Тесты асинхронного загрузчика на локальном стаб-сервере hh.ru: повторы на 429/5xx и их
+исчерпание, 404/4xx без повторов, token bucket, rate limit и докачка по чекпоинту. Запуск: python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'etl'))
+
+from fetch_hh_async import HHFetcher, TokenBucket  # noqa: E402
+
+
+def vacancy(vid):
+    return {
+        "id": str(vid), "name": f"Вакансия {vid}", "published_at": "2024-05-01T10:00:00+0300",
+        "description": "", "salary": None, "experience": {"name": "Нет опыта"},
+        "area": {"id": "1"}, "key_skills": [{"name": "Python"}], "employer": {"name": "Рога и копыта"},
+    }
+
+
+class StubHH:
+    """
+    Стаб /vacancies/{id}: script[id] — список ответов по очереди (HTTP-статус или 'ok'),
+    последний повторяется. Без сценария — 200. hits[id] — сколько раз запрашивали.
+    """
+
+    def __init__(self, script=None):
+        self.script = script or {}
+        self.hits = {}
+
+    async def vacancy(self, request):
+        vid = request.match_info['vid']
+        n = self.hits.get(vid, 0)
+        self.hits[vid] = n + 1
+        answers = self.script.get(vid, ['ok'])
+        answer = answers[min(n, len(answers) - 1)]
+        if answer == 'ok':
+            return web.json_response(vacancy(vid))
+        return web.json_response({"errors": []}, status=answer, headers={'Retry-After': '0'})
+
+
+async def serve(stub):
+    app = web.Application()
+    app.router.add_get('/vacancies/{vid}', stub.vacancy)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def run_fetcher(stub, job, **kwargs):
+    """Запускает стаб и HHFetcher(**kwargs); возвращает await job(fetcher)."""
+    async def run():
+        runner, url = await serve(stub)
+        try:
+            kwargs.setdefault('rate', 1000)
+            kwargs.setdefault('backoff', 0.01)
+            async with HHFetcher(base_url=url, **kwargs) as fetcher:
+                return await job(fetcher)
+        finally:
+            await runner.cleanup()
+    return asyncio.run(run())
+
+
+def fetch(stub, ids, **kwargs):
+    """HHFetcher.fetch_full_vacancies на стабе; возвращает (DataFrame, stats)."""
+    async def job(fetcher):
+        return await fetcher.fetch_full_vacancies(ids), fetcher.stats
+    return run_fetcher(stub, job, **kwargs)
+
+
+def get_status(stub, vid, **kwargs):
+    """HHFetcher.get_json_status для /vacancies/{vid}; возвращает ((статус, JSON), stats)."""
+    async def job(fetcher):
+        return await fetcher.get_json_status(f"/vacancies/{vid}"), fetcher.stats
+    return run_fetcher(stub, job, **kwargs)
+
+
+def read_checkpoint(path):
+    with open(path, encoding='utf-8') as f:
+        return {rec["id"]: rec for rec in map(json.loads, f)}
+
+
+def test_retries_rate_limited_and_server_errors():
+    stub = StubHH({'1': [429, 'ok'], '2': [503, 502, 'ok']})
+    df, stats = fetch(stub, [1, 2, 3], max_retries=3)
+    assert sorted(df['id']) == ['1', '2', '3']
+    assert stub.hits == {'1': 2, '2': 3, '3': 1}
+    assert stats['retries'] == 3
+    assert stats['failed_ids'] == []
+
+
+def test_failed_fetch_is_not_checkpointed_and_resumes(tmp_path):
+    checkpoint = str(tmp_path / 'checkpoint.jsonl')
+    stub = StubHH({'2': [503], '3': [404]})
+    df, stats = fetch(stub, [1, 2, 3], max_retries=1, checkpoint_path=checkpoint)
+    assert list(df['id']) == ['1']
+    assert stats['failed_ids'] == ['2']
+    saved = read_checkpoint(checkpoint)
+    assert set(saved) == {'1', '3'}
+    assert saved['3']['status'] == 404 and saved['3']['row'] is None
+
+    # hh снова отвечает: докачивается только неудавшийся id, 404 повторно не запрашивается
+    stub.script = {'3': [404]}
+    stub.hits = {}
+    df, stats = fetch(stub, [1, 2, 3], max_retries=1, checkpoint_path=checkpoint)
+    assert stub.hits == {'2': 1}
+    assert list(df['id']) == ['1', '2']
+    assert stats['failed_ids'] == []
+    assert set(read_checkpoint(checkpoint)) == {'1', '2', '3'}
+
+
+def test_retries_exhausted_returns_no_status():
+    stub = StubHH({'1': [503]})
+    (status, data), stats = get_status(stub, 1, max_retries=2)
+    assert (status, data) == (None, None)
+    assert stub.hits == {'1': 3}
+    assert stats['retries'] == 2 and stats['errors'] == 1
+
+
+def test_not_found_is_not_retried():
+    stub = StubHH({'1': [404]})
+    (status, data), stats = get_status(stub, 1, max_retries=3)
+    assert (status, data) == (404, None)
+    assert stub.hits == {'1': 1}
+    assert stats['retries'] == 0 and stats['errors'] == 0
+
+
+def test_client_error_is_not_retried():
+    stub = StubHH({'1': [400]})
+    (status, data), stats = get_status(stub, 1, max_retries=3)
+    assert (status, data) == (400, None)
+    assert stub.hits == {'1': 1}
+    assert stats['retries'] == 0 and stats['errors'] == 1
+
+
+def test_token_bucket_burst_then_rate():
+    async def timings():
+        bucket = TokenBucket(rate=50, capacity=5)
+        t0 = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        burst = time.monotonic() - t0
+        for _ in range(10):
+            await bucket.acquire()
+        return burst, time.monotonic() - t0
+
+    burst, total = asyncio.run(timings())
+    # запас capacity расходуется сразу, дальше — не чаще rate в секунду
+    assert burst < 0.05
+    assert total >= 10 / 50
+
+
+def test_rate_limit_spreads_requests():
+    stub = StubHH()
+    t0 = time.monotonic()
+    df, stats = fetch(stub, range(1, 7), bucket=TokenBucket(rate=20, capacity=1))
+    # первый запрос — из запаса, остальные 5 — не чаще 20 в секунду
+    assert time.monotonic() - t0 >= 5 / 20
+    assert len(df) == 6 and stats['requests'] == 6
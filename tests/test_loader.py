@@ -0,0 +1,53 @@
+"""
+Set-based загрузка вакансий: справочник навыков в нижнем регистре, перезапись вакансий
+удаляет их производные строки. Запуск: python -m pytest tests
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+for sub in ('etl', 'bench'):
+    sys.path.insert(0, os.path.join(ROOT, 'src', sub))
+
+from hh_database import connect_writer  # noqa: E402
+from loader import VACANCY_COLS, load_vacancies  # noqa: E402
+from synthetic import create_schema  # noqa: E402
+
+
+def vacancies(*rows):
+    """DataFrame вакансий из пар (id, skills_raw)."""
+    return pd.DataFrame([{
+        'id': str(vid), 'title': 'Аналитик', 'published_at': '2024-05-01T10:00:00+0300', 'description': '',
+        'salary_from': None, 'salary_to': None, 'salary_currency': None, 'experience_hh': 'Нет опыта',
+        'area_id': 1, 'skills_raw': skills, 'employer': '',
+    } for vid, skills in rows], columns=VACANCY_COLS)
+
+
+@pytest.fixture
+def con(tmp_path):
+    con = connect_writer(str(tmp_path / 'hh.duckdb'))
+    create_schema(con)
+    yield con
+    con.close()
+
+
+def test_skill_names_are_lowercased(con):
+    load_vacancies(con, vacancies((1, 'Python, SQL'), (2, 'python, Docker')), refresh_derived=False)
+    assert sorted(r[0] for r in con.execute("SELECT name FROM skill").fetchall()) == ['docker', 'python', 'sql']
+    assert sorted(con.execute("SELECT * FROM vacancy_skill").fetchall()) == [
+        (1, 'Python'), (1, 'SQL'), (2, 'Docker'), (2, 'python')]
+
+
+def test_update_removes_derived_rows(con):
+    load_vacancies(con, vacancies((1, 'Python'), (2, 'SQL')), refresh_derived=False)
+    for table in ('vacancy_proc', 'vacancy_pred', 'vacancy_emb'):
+        con.execute(f"CREATE TABLE {table} AS SELECT CAST(id AS BIGINT) AS id FROM vacancy")
+
+    stats = load_vacancies(con, vacancies((1, 'Python, Go')), refresh_derived=False, update_existing=True)
+    assert stats['updated'] == 1
+    for table in ('vacancy_proc', 'vacancy_pred', 'vacancy_emb'):
+        assert con.execute(f"SELECT id FROM {table}").fetchall() == [(2,)]
+    assert sorted(con.execute("SELECT * FROM vacancy_skill").fetchall()) == [(1, 'Go'), (1, 'Python'), (2, 'SQL')]
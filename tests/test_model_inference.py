@@ -0,0 +1,28 @@
+"""
+Категориальные признаки для OHE по пачке вакансий совпадают с признаками по одной вакансии.
+Запуск: python -m pytest tests
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'bot'))
+
+from model_inference import ohe_categories  # noqa: E402
+
+
+def test_area_id_stays_integer_when_some_are_missing():
+    feats = pd.DataFrame.from_records([
+        {'area_id': 1, 'salary_currency': 'RUR'},
+        {'area_id': None, 'salary_currency': None},
+        {'area_id': 2, 'salary_currency': 'USD'},
+    ])
+    assert feats['area_id'].dtype == float
+    assert ohe_categories(feats) == [['1', 'RUR'], ['0', 'RUR'], ['2', 'USD']]
+    single = ohe_categories(pd.DataFrame.from_records([{'area_id': 1, 'salary_currency': 'RUR'}]))
+    assert single == [['1', 'RUR']]
+
+
+def test_missing_columns_use_defaults():
+    assert ohe_categories(pd.DataFrame(index=range(2))) == [['', 'RUR'], ['', 'RUR']]
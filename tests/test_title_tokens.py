@@ -0,0 +1,54 @@
+"""
+Токенизация названий в боте (market_analytics._title_tokens) и в кубе
+(market_cube.TITLE_TOKENS_SQL) должна совпадать, иначе запрос не найдёт строки куба.
+Запуск: python -m pytest tests
+"""
+import os
+import sys
+
+import duckdb
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+for sub in ('bot', 'etl', 'bench'):
+    sys.path.insert(0, os.path.join(ROOT, 'src', sub))
+
+from market_analytics import _cube_title_filter, _title_tokens  # noqa: E402
+from market_cube import TITLE_TOKENS_SQL  # noqa: E402
+from synthetic import generate_vacancies  # noqa: E402
+
+TITLES = [
+    "Ведущий Python-разработчик (удалённо)",
+    "Java / JavaScript developer",
+    "Водитель-экспедитор",
+    "Водителя погрузчика",
+    "Руководителя отдела продаж",
+    "Менеджер по продажам",
+    "Специалисты службы поддержки",
+    "Программист 1С",
+    "C++ / C# разработчик",
+    "Сёрфингисты и ёлочные игрушки",
+    "ИИ-инженер",
+    "Мойщица посуды, 2/2",
+    "",
+]
+
+
+def sql_tokens(titles):
+    con = duckdb.connect()
+    con.execute("CREATE TABLE v (title VARCHAR)")
+    con.executemany("INSERT INTO v VALUES (?)", [[t] for t in titles])
+    return [set(r[0]) for r in con.execute(f"SELECT {TITLE_TOKENS_SQL} FROM v").fetchall()]
+
+
+@pytest.mark.parametrize("titles", [TITLES, list(generate_vacancies(300, seed=3)['title'])])
+def test_python_and_sql_tokens_match(titles):
+    for title, tokens in zip(titles, sql_tokens(titles)):
+        assert tokens == set(_title_tokens(title)) | {''}, title
+
+
+def test_one_word_matches_by_stem():
+    assert _cube_title_filter("Водитель") == ("title_token = ?", "водител")
+    assert _cube_title_filter("водителя") == ("title_token = ?", "водител")
+    assert "водител" not in _title_tokens("Руководителя отдела")
+    assert _cube_title_filter("водитель погрузчика") is None
@@ -0,0 +1,35 @@
+"""
+Пересборка индекса эмбеддингов: каждая сборка пишет файлы новой версии, уже открытый индекс
+продолжает читать свои. Запуск: python -m pytest tests
+"""
+import os
+import sys
+
+import duckdb
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'bot'))
+
+from vector_store import EMB_DIM, VectorIndex, build_index, save_embeddings  # noqa: E402
+
+
+def test_rebuilds_in_same_second_get_new_files(tmp_path):
+    con = duckdb.connect()
+    rng = np.random.default_rng(0)
+    save_embeddings(con, np.arange(1, 41), rng.random((40, EMB_DIM), dtype=np.float32))
+    out_dir = str(tmp_path / 'index')
+
+    first = build_index(con, out_dir)
+    index = VectorIndex(out_dir)
+    query = np.asarray(index.emb[0])
+    expected = index.search(query, k=5)[0]
+
+    save_embeddings(con, np.arange(41, 81), rng.random((40, EMB_DIM), dtype=np.float32))
+    second = build_index(con, out_dir)
+    assert second['version'] != first['version']
+    assert sorted(os.listdir(out_dir)) == sorted(
+        [f"{name}-{second['version']}.npy" for name in ('ids', 'emb', 'centroids', 'offsets')] + ['index.json'])
+    # старый индекс читает свои (уже удалённые) файлы через mmap
+    assert list(index.search(query, k=5)[0]) == list(expected)
+    assert len(VectorIndex(out_dir)) == 80
+    con.close()